@@ -1,3 +1,4 @@
+import collections
 from PySide import QtGui, QtCore
 from Converters import GCode, CNCCon, Filters
 
@@ -194,6 +195,9 @@ class ManualMotionController(QtCore.QObject):
 
 
 class ProgrammedMotionController(QtCore.QObject):
+	# the message of an error raised by the command source
+	failed = QtCore.Signal(str)
+
 	_completedSteps = 0
 	_sentSteps = 0
 	_totalSteps = 0
@@ -201,23 +205,7 @@ class ProgrammedMotionController(QtCore.QObject):
 
 	def __init__(self, machine):
 		QtCore.QObject.__init__(self)
-		commands = [
-			'@M0',
-			'#G11,5000',
-			'#E21,5000,30',
-			'#E41,10000,30',
-			'#G31,10000',
-			'#G1,15000',
-			'#G4,3000',
-			'#G2,15000',
-			'#G5,3000',
-			'#G3,10000',
-			'#G6,2000',
-			'#G7,10000',
-			'#G8,2000',
-			'#C2,9',
-			'#C14,17',
-			'#C43,1',
+		commands = [ '@M0' ] + CNCCon.motionSetup + [
 			'@N0',
 			'@M2',
 			'@O%d' % self._feedRateOverride,
@@ -245,9 +233,14 @@ class ProgrammedMotionController(QtCore.QObject):
 			self._end()
 
 	def setCommands(self, commands):
-		self._buffer = commands
-		for command in self._buffer:
-			if command == 'E': self._totalSteps += 1
+		self.setCommandSource([ commands ])
+
+	def setCommandSource(self, chunks):
+		"""send the commands of an iterable of command lists (e.g. from
+		GCodeInterpreter.iterRun), chunks are pulled as the machine
+		progresses.  The total number of steps grows as they are pulled"""
+		self._source = iter(chunks)
+		self._buffer = collections.deque()
 
 		self._timer = QtCore.QTimer(self)
 		self.connect(self._timer, QtCore.SIGNAL("timeout()"), self.updateStatus)
@@ -260,14 +253,35 @@ class ProgrammedMotionController(QtCore.QObject):
 		if self._completedSteps + 250 < self._sentSteps:
 			return	# machine still has work to do; don't send yet
 
-		while len(self._buffer) and self._sentSteps - self._completedSteps < 2000:
-			command = self._buffer.pop(0)
+		while self._sentSteps - self._completedSteps < 2000:
+			command = self._nextCommand()
+			if command == None: break
 			if command == 'E': self._sentSteps += 1
 
 			print "sent %d of %d; current N: %d; next command: %s" % (self._sentSteps, self._totalSteps, self._completedSteps, command)
 			self._machine.cts()
 			self._machine.send(command)
 
+	def _nextCommand(self):
+		while not self._buffer:
+			try:
+				chunk = next(self._source, None)
+			except Exception as e:
+				# don't send anything more, the machine stops after
+				# the commands sent so far.  Raising would end up in
+				# the timer slot, where it is lost
+				print "command source failed: %s" % e
+				self._source = iter(())
+				self._end()
+				self.failed.emit(str(e))
+				return None
+
+			if chunk == None: return None
+			self._totalSteps += chunk.count('E')
+			self._buffer.extend(chunk)
+
+		return self._buffer.popleft()
+
 	def _end(self):
 		commands = [
 			'@@',
@@ -10,11 +10,14 @@ class ControlMainWindow(QtGui.QMainWindow):
 	_originOffset = [ 0, 0 ]
 	_polarCorrection = [ 1, 0 ]
 	_debounce = None
+	_mapThreshold = 32 * 1024 * 1024
+	_travel = None
 
 	def __init__(self, chatBackend):
 		super(ControlMainWindow, self).__init__(None)
 
 		self._machine = MachineController(chatBackend);
+		self._parseCache = ParseCache.ParseCache()
 		self._machine.machineStatus().statusUpdated.connect(self.statusUpdated)
 
 		self._ui = Ui_MainWindow()
@@ -24,6 +27,7 @@ class ControlMainWindow(QtGui.QMainWindow):
 		self._ui.refMovement.clicked.connect(self.refMovement)
 		self._ui.importGCode.clicked.connect(self.importGCode)
 		self._ui.run.clicked.connect(self.run)
+		self._ui.runFrom.clicked.connect(self.runFrom)
 		self._ui.resume.clicked.connect(self.resume)
 		self._ui.showGraphicsView.clicked.connect(self.showGraphicsView)
 
@@ -124,19 +128,90 @@ class ControlMainWindow(QtGui.QMainWindow):
 
 	def importGCodeFromFile(self, filename):
 		parser = GCode.GCodeParser()
-		parser.readFile(filename)
-		parser.removeTapeMarkers()
-		parser.removeComments()
-		parser.removeInlineComments()
-		parser.removeBlockSkipLines()
-		parser.normalizeAddressWhitespace()
-		parser.normalizeLeadingZeros()
-		parser.readSequenceNumbers()
+
+		# don't keep huge programs in memory, decode blocks on demand
+		if os.path.getsize(filename) > self._mapThreshold:
+			parser.mapFile(filename)
+		else:
+			self._parseCache.parseFile(filename, parser)
+			self.analyze(parser)
 
 		self._parser = parser
 
+	def analyze(self, parser):
+		# pre-flight check of the program as it would be run now
+		estimator = Timing.TimeEstimator()
+		estimator.feedRateOverride = self._ui.feedRateOverride.value()
+		analyzer = Analysis.Analyzer(estimator, self._travel)
+		inter = GCode.GCodeInterpreter(Filters.FilterChain(self._filters(), analyzer))
+		inter.invertZ = self._ui.invertZ.isChecked()
+		analyzer.attach(inter)
+		estimator.setSource(inter)
+
+		try:
+			inter.runAll(parser)
+		except Exception as e:
+			self.statusBar().showMessage('No analysis: %s' % e)
+			return
+
+		box = [ '%s %.1f..%.1f' % (axis, b[0], b[1]) for axis, b in zip(Analysis.axes, analyzer.box) if b != None ]
+		tools = [ 'tool %d %s' % (tool, Timing.formatTime(t))
+			  for tool, t in sorted(estimator.toolTimes.items()) ]
+		self.statusBar().showMessage('Estimated time %s (rapid moves %s, feed moves %s; %s); %s' %
+					     (Timing.formatTime(estimator.total()), Timing.formatTime(estimator.rapidTime),
+					      Timing.formatTime(estimator.feedTime), ', '.join(tools), ', '.join(box)))
+
+		if analyzer.violations:
+			lines = [ 'line %s: %s %.3f' % (parser.lineOfBlock(block), axis, value)
+				  for axis, value, block in analyzer.firstViolations[:10] ]
+			QtGui.QMessageBox.warning(
+				self, 'G-Code Import',
+				'%d coordinates outside the machine travel:\n%s' % (analyzer.violations, '\n'.join(lines)))
+
+	def setTravel(self, travel):
+		self._travel = travel
+
+	def _filters(self):
+		return [
+			Filters.OffsetFilter([ -self._originOffset[0], -self._originOffset[1] ]),
+			Filters.PolarFixer(self._polarCorrection[0], self._polarCorrection[1]),
+			Filters.OffsetFilter(self._workpiecePos)
+		]
+
 	@QtCore.Slot()
 	def run(self):
+		self.runProgram()
+
+	@QtCore.Slot()
+	def runFrom(self):
+		if self._parser == None:
+			QtGui.QMessageBox.information(
+				self, 'PyPC-NC',
+				'No G-Code loaded.  You need to "Import G-Code" first.')
+			return
+
+		text, ok = QtGui.QInputDialog.getText(self, 'Run from ...',
+			'Sequence number (e.g. N120) or line number to start at:')
+		if not ok: return
+
+		text = text.strip().upper()
+		block = None
+		try:
+			if text.startswith('N'):
+				block = self._parser.findSequenceNumber(int(text[1:]))
+			else:
+				block = self._parser.findLine(int(text))
+		except ValueError:
+			pass
+
+		if block == None:
+			QtGui.QMessageBox.information(
+				self, 'PyPC-NC', 'No block found at "%s".' % text)
+			return
+
+		self.runProgram(block)
+
+	def runProgram(self, block = None):
 		if not self._machine.machineStatus().status() & 0x04:
 			reply = QtGui.QMessageBox.question(self, 'G-Code Import',
 				    'Are you sure to import G-Code without reference movement?',
@@ -153,25 +228,27 @@ class ControlMainWindow(QtGui.QMainWindow):
 			if reply == QtGui.QMessageBox.No:
 				return
 
-		filters = [
-			Filters.OffsetFilter([ -self._originOffset[0], -self._originOffset[1] ]),
-			Filters.PolarFixer(self._polarCorrection[0], self._polarCorrection[1]),
-			Filters.OffsetFilter(self._workpiecePos)
-		]
-
-		fc = Filters.FilterChain(filters, CNCCon.CNCConWriter())
+		fc = Filters.FilterChain(self._filters(), CNCCon.CNCConWriter())
+		previous = self._inter
 		self._inter = GCode.GCodeInterpreter(fc)
+
+		# restart quickly from where a previous run of the program got
+		if previous:
+			self._inter.adoptCheckpoints(previous)
 		self._inter.position = [
 			self._machine.machineStatus().x() - self._workpiecePos[0] + self._originOffset[0],
 			self._machine.machineStatus().y() - self._workpiecePos[1] + self._originOffset[1],
 			self._machine.machineStatus().z() - self._workpiecePos[2]
 		]
 		self._inter.invertZ = self._ui.invertZ.isChecked()
-		self._inter.run(self._parser)
 
-		self._machine.setAction(ProgrammedMotionController(self._machine))
-		self._machine.action().setFeedRateOverride(self._ui.feedRateOverride.value())
-		self._machine.action().setCommands(self._inter.target.buffer)
+		# commands are generated as the machine asks for them
+		if block == None:
+			commands = self._inter.iterRun(self._parser)
+		else:
+			commands = self._inter.iterRunFrom(self._parser, block)
+
+		self._startProgram(commands)
 
 	@QtCore.Slot()
 	def resume(self):
@@ -194,11 +271,21 @@ class ControlMainWindow(QtGui.QMainWindow):
 			self._machine.machineStatus().z() - self._workpiecePos[2]
 		]
 		self._inter.target.filters()[2].setOffsets(self._workpiecePos)
-		self._inter.resume(self._parser)
 
-		self._machine.setAction(ProgrammedMotionController(self._machine))
-		self._machine.action().setFeedRateOverride(self._ui.feedRateOverride.value())
-		self._machine.action().setCommands(self._inter.target.buffer)
+		self._startProgram(self._inter.iterResume(self._parser))
+
+	def _startProgram(self, commands):
+		controller = ProgrammedMotionController(self._machine)
+		controller.failed.connect(self.programFailed)
+		self._machine.setAction(controller)
+		controller.setFeedRateOverride(self._ui.feedRateOverride.value())
+		controller.setCommandSource(Optimizers.CommandOptimizer().optimize(commands))
+
+	@QtCore.Slot(str)
+	def programFailed(self, message):
+		QtGui.QMessageBox.warning(
+			self, 'PyPC-NC',
+			'Program stopped, no further commands are sent:\n%s' % message)
 
 	@QtCore.Slot(int)
 	def feedRateOverrideChanged(self, value):
@@ -368,7 +455,7 @@ class ControlMainWindow(QtGui.QMainWindow):
 	def pollStatus(self, fd):
 		self._machine.cts()
 
-from Converters import GCode
+from Converters import Analysis, GCode, Optimizers, ParseCache, Timing
 from Control.MachineStatus import *
 from Control.GraphicsView import ControlGraphicsView
 from ui.MainWindow import Ui_MainWindow
@@ -0,0 +1,207 @@
+"""pre-flight analysis of programs
+
+the Analyzer takes the place of the target of the interpreter (like
+Timing.TimeEstimator) and collects what is worth knowing before running
+a program, in one pass and without keeping anything per block"""
+import math
+
+from Converters import GCode, Optimizers
+
+axes = 'XYZ'
+
+def parseTravel(text):
+	"""machine travel from text like 'X0:400,Y0:300,Z-80:0' (mm) as list
+	of (min, max) per axis, None for axes not given"""
+	travel = [ None, None, None ]
+	for item in text.upper().split(','):
+		item = item.strip()
+		if not item: continue
+		if not item[0] in axes or not ':' in item:
+			raise ValueError('Invalid travel: %s' % item)
+		low, high = item[1:].split(':')
+		travel[axes.index(item[0])] = (float(low), float(high))
+	return travel
+
+def _covers(b, a, unlimited = False):
+	# range b covers range a, None is no range (or an unlimited one)
+	if b == None:
+		return unlimited
+	return b[0] <= a[0] and a[1] <= b[1]
+
+def _arcBox(cx, cy, r, start, sweep):
+	# bounding box of an arc (center, radius, start angle and signed sweep)
+	angles = [ start, start + sweep ]
+	low, high = min(angles), max(angles)
+	k = math.ceil(low / (math.pi / 2))
+	while k * math.pi / 2 <= high:
+		angles.append(k * math.pi / 2)
+		k += 1
+	xs = [ cx + r * math.cos(a) for a in angles ]
+	ys = [ cy + r * math.sin(a) for a in angles ]
+	return (min(xs), max(xs)), (min(ys), max(ys))
+
+class Analyzer:
+	"""collects the bounding box (box, (min, max) per axis), the lengths
+	of cuts and rapid moves (cutLength, rapidLength), the range of the
+	feed rates cut with (feedRange, units per minute), the tools used and
+	how often each code (G1, M3, ...) was processed (codes) of a program.
+	All values are in mm, as taken by the target.
+
+	coordinates outside travel (see parseTravel) of moves, the position
+	the first of them starts from and the extremes of arcs count in
+	violations, the first maxViolations are kept in firstViolations as
+	(axis, value, block).
+	Tools and blocks are those of the interpreter attached (see attach).
+	Calls are passed on to target, if any"""
+	def __init__(self, target = None, travel = None, maxViolations = 20):
+		d = self.__dict__
+		d['_target'] = target or GCode.NullTarget()
+		d['travel'] = travel or [ None, None, None ]
+		d['maxViolations'] = maxViolations
+		d['box'] = [ None, None, None ]
+		d['cutLength'] = 0.
+		d['rapidLength'] = 0.
+		d['feedRange'] = None
+		d['tools'] = [ ]
+		d['codes'] = { }
+		d['violations'] = 0
+		d['firstViolations'] = [ ]
+		d['_source'] = None
+		d['_feedRate'] = None
+		d['_position'] = [ 0, 0, 0 ]
+
+	def __getattr__(self, name):
+		return getattr(self.__dict__['_target'], name)
+
+	def __setattr__(self, name, value):
+		if name in self.__dict__:
+			self.__dict__[name] = value
+		else:
+			setattr(self.__dict__['_target'], name, value)
+
+	def attach(self, inter):
+		"""count the codes processed by the interpreter (in batch runs
+		too) and take tools and blocks from it"""
+		self.__dict__['_source'] = inter
+		codes = self.codes
+		for code, handler in inter.handlers.items():
+			inter.handlers[code] = self._counting(codes, code, handler)
+		inter.batchCodes = self._countBatch
+
+	def _counting(self, codes, code, handler):
+		def f(insn):
+			codes[code] = codes.get(code, 0) + 1
+			return handler(insn)
+		return f
+
+	def _countBatch(self, batchCodes):
+		codes = self.codes
+		for code in batchCodes:
+			codes[code] = codes.get(code, 0) + 1
+
+	def setFeedRate(self, fr):
+		self.__dict__['_feedRate'] = fr * 60 / 1000.
+		self._target.setFeedRate(fr)
+
+	def straightMotion(self, rapid, longMoveAxe, machinePos):
+		self._straightMotion(rapid, machinePos)
+		self._target.straightMotion(rapid, longMoveAxe, machinePos)
+
+	def straightMotionBatch(self, rapid, longMoveAxe, machinePos):
+		for args in zip(rapid, machinePos):
+			self._straightMotion(*args)
+
+		batch = getattr(self._target, 'straightMotionBatch', None)
+		if batch:
+			batch(rapid, longMoveAxe, machinePos)
+		else:
+			for args in zip(rapid, longMoveAxe, machinePos):
+				self._target.straightMotion(*args)
+
+	def circleMotion(self, x, y, p):
+		self._seed()
+		pos = self._position
+		cx, cy = (pos[0] + x) / 1000., (pos[1] + y) / 1000.
+		r = math.hypot(x, y) / 1000.
+
+		# the whole circle lying in the box and the travel (most arcs
+		# of a program do) leaves nothing to do
+		box, travel = self.box, self.travel
+		xs, ys = (cx - r, cx + r), (cy - r, cy + r)
+		if not (_covers(box[0], xs) and _covers(box[1], ys) and
+			_covers(travel[0], xs, True) and _covers(travel[1], ys, True)):
+			box = _arcBox(cx, cy, r, math.atan2(-y, -x), p / 1000000.)
+			for i in xrange(2):
+				self._extend(i, box[i][0])
+				self._extend(i, box[i][1])
+
+		self._cut(r * abs(p) / 1000000.)
+		pos[:2] = Optimizers.arcEnd(pos, x, y, p)
+		self._target.circleMotion(x, y, p)
+
+	def _straightMotion(self, rapid, machinePos):
+		self._seed()
+		pos = self._position
+		length = 0
+		for i in xrange(3):
+			if machinePos[i] != None:
+				length += (machinePos[i] - pos[i]) ** 2
+				pos[i] = machinePos[i]
+				self._extend(i, machinePos[i] / 1000.)
+		length = math.sqrt(length) / 1000.
+
+		if rapid:
+			self.__dict__['rapidLength'] += length
+		else:
+			self._cut(length)
+
+	def _seed(self):
+		# moves leave out the axes that don't change, so the position the
+		# first move starts from gets into the box (and the travel check)
+		# for axes not moved yet; other axes' starts are in already
+		box = self.box
+		if None in box:
+			pos = self._position
+			for i in xrange(3):
+				if box[i] == None:
+					self._extend(i, pos[i] / 1000.)
+
+	def _cut(self, length):
+		d = self.__dict__
+		d['cutLength'] += length
+
+		feed = self._feedRate
+		if feed != None:
+			r = self.feedRange
+			d['feedRange'] = (feed, feed) if r == None else (min(r[0], feed), max(r[1], feed))
+
+		source = self._source
+		if source != None and not source.currentTool in self.tools:
+			self.tools.append(source.currentTool)
+
+	def _extend(self, axis, value):
+		box = self.box
+		b = box[axis]
+		if b == None:
+			box[axis] = (value, value)
+		elif value < b[0]:
+			box[axis] = (value, b[1])
+		elif value > b[1]:
+			box[axis] = (b[0], value)
+
+		limits = self.travel[axis]
+		if limits != None and (value < limits[0] or value > limits[1]):
+			self.__dict__['violations'] += 1
+			if len(self.firstViolations) < self.maxViolations:
+				block = self._source.currentBlock if self._source != None else None
+				self.firstViolations.append((axes[axis], value, block))
+
+def analyzeProgram(parser, travel = None, invertZ = False, target = None):
+	"""analyze a parsed program, running it to its end (tool changes
+	included).  Returns the Analyzer"""
+	analyzer = Analyzer(target, travel)
+	inter = GCode.GCodeInterpreter(analyzer)
+	inter.invertZ = invertZ
+	analyzer.attach(inter)
+	inter.runAll(parser)
+	return analyzer
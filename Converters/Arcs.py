@@ -0,0 +1,101 @@
+"""circle arcs for the CNCCON circle command
+
+the functions take the start, end and center of arcs in one plane (mm)
+and work with vectors and atan2 only, so no chord direction is special.
+The *s variants solve a run of arcs at once on NumPy arrays (n x 2 for
+points, n for radii and directions) and give the same results"""
+import math
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+def radiusCenter(start, end, radius, ccw):
+	"""center of the arc of the given radius; on the right of the chord
+	for clockwise arcs up to 180 degrees, negative radii give the larger
+	arc"""
+	dx = end[0] - start[0]
+	dy = end[1] - start[1]
+	d = math.hypot(dx, dy)
+	if d == 0:
+		raise RuntimeError('Arc with radius format needs distinct end point')
+
+	h = radius ** 2 - (d / 2) ** 2
+	if h < 0:
+		if round(h, 6) < 0:
+			raise RuntimeError('Arc radius too small to reach end point')
+		h = 0
+	h = math.sqrt(h) / d
+	if ccw != (radius < 0):
+		h = -h
+
+	# (dy, -dx) points to the right of the chord
+	return [ start[0] + dx / 2 + h * dy, start[1] + dy / 2 - h * dx ]
+
+def checkRadius(start, end, center):
+	"""raise if start and end aren't (about) equally far from center"""
+	a = math.hypot(end[0] - center[0], end[1] - center[1])
+	b = math.hypot(start[0] - center[0], start[1] - center[1])
+	if round(a - b, 3) != 0:
+		raise RuntimeError('strange circle a=%f, b=%f', a, b)
+
+def sweep(start, end, center, ccw):
+	"""angle (radians) from start to end around center, positive
+	counter-clockwise; a full circle if start and end coincide"""
+	ax, ay = start[0] - center[0], start[1] - center[1]
+	bx, by = end[0] - center[0], end[1] - center[1]
+	angle = math.atan2(ax * by - ay * bx, ax * bx + ay * by)
+	if ccw and angle <= 0:
+		angle += 2 * math.pi
+	elif not ccw and angle >= 0:
+		angle -= 2 * math.pi
+	return angle
+
+def circleCommand(start, end, center, ccw):
+	"""circleMotion arguments (center relative to start and angle,
+	machine units) of an arc"""
+	x = round((center[0] - start[0]) * 1000)
+	y = round((center[1] - start[1]) * 1000)
+
+	# WinPC-NC seems to always ceil the angle, for whatever reason ...
+	p = math.ceil(sweep(start, end, center, ccw) * 1000000)
+	return x, y, p
+
+def radiusCenters(starts, ends, radii, ccw):
+	"""radiusCenter for arrays"""
+	d = ends - starts
+	length = numpy.hypot(d[:, 0], d[:, 1])
+	if not length.all():
+		raise RuntimeError('Arc with radius format needs distinct end point')
+
+	h = radii ** 2 - (length / 2) ** 2
+	if (numpy.round(h, 6) < 0).any():
+		raise RuntimeError('Arc radius too small to reach end point')
+	h = numpy.sqrt(numpy.maximum(h, 0)) / length
+	h = numpy.where(ccw != (radii < 0), -h, h)
+
+	return starts + d / 2 + h[:, None] * numpy.column_stack((d[:, 1], -d[:, 0]))
+
+def checkRadii(starts, ends, centers):
+	"""checkRadius for arrays"""
+	a = numpy.hypot(*(ends - centers).T)
+	b = numpy.hypot(*(starts - centers).T)
+	bad = numpy.round(a - b, 3) != 0
+	if bad.any():
+		k = bad.argmax()
+		raise RuntimeError('strange circle a=%f, b=%f', a[k], b[k])
+
+def circleCommands(starts, ends, centers, ccw):
+	"""circleCommand for arrays, returns arrays x, y and p"""
+	a = starts - centers
+	b = ends - centers
+	angle = numpy.arctan2(a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0], (a * b).sum(axis = 1))
+	angle = numpy.where(ccw & (angle <= 0), angle + 2 * math.pi, angle)
+	angle = numpy.where(~ccw & (angle >= 0), angle - 2 * math.pi, angle)
+
+	# round() of Python 2: half away from zero
+	scaled = numpy.abs(centers - starts) * 1000
+	rounded = numpy.floor(scaled)
+	rounded = numpy.copysign(rounded + (scaled - rounded >= .5), centers - starts)
+	return rounded[:, 0], rounded[:, 1], numpy.ceil(angle * 1000000)
@@ -1,3 +1,23 @@
+# speed and ramp setup of the controller for programmed motion (sent by
+# ProgrammedMotionController, used by Timing.TimeEstimator)
+motionSetup = [
+	'#G11,5000',
+	'#E21,5000,30',
+	'#E41,10000,30',
+	'#G31,10000',
+	'#G1,15000',
+	'#G4,3000',
+	'#G2,15000',
+	'#G5,3000',
+	'#G3,10000',
+	'#G6,2000',
+	'#G7,10000',
+	'#G8,2000',
+	'#C2,9',
+	'#C14,17',
+	'#C43,1',
+]
+
 class CNCConWriter:
 	axes = [ 'X', 'Y', 'Z' ]
 
@@ -144,6 +164,27 @@ class CNCConWriter:
 		self.buffer.append(','.join(command))
 		self.firstMove = False
 
+	def straightMotionBatch(self, rapid, longMoveAxe, machinePos):
+		"""straightMotion for lists of moves"""
+		append = self.buffer.append
+		axes = self.axes
+		lastRapid = None
+
+		for r, axe, pos in zip(rapid, longMoveAxe, machinePos):
+			command = [ 'V21' if not r else 'V%d' % (axe + 1) ]
+
+			for i in xrange(3):
+				if pos[i] != None:
+					command.append('%s%d' % (axes[i], pos[i]))
+
+			append('E')
+			# setSpeed only changes anything on the first call per speed
+			if r != lastRapid:
+				self.setSpeed(r)
+				lastRapid = r
+			append(','.join(command))
+			self.firstMove = False
+
 	def circleMotion(self, x, y, p):
 		self.buffer.append('E')
 		self.setSpeed(False)  # always "slow" motion
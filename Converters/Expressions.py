@@ -0,0 +1,280 @@
+"""LinuxCNC style expressions and parameters
+
+expressions ([...] arithmetic, functions, #n and #[...] parameter
+references) are compiled into closures taking the parameter dict, blocks
+with parameters or expressions into templates.  Both are cached by their
+text, so every distinct expression or block is only parsed once."""
+import re
+import math
+import operator
+
+_literalAssignmentRe = re.compile(r'\s*#(\d+)\s*=\s*([-+]?(?:\d+\.?\d*|\.\d+))\s*$')
+_tokenRe = re.compile(r'\s*(?:(\d+\.?\d*|\.\d+)|(\*\*|[-+*/\[\]#=])|([A-Z]+))')
+
+def _round(x):
+	# round half away from zero, like round() of Python 2
+	a = abs(x)
+	f = math.floor(a)
+	if a - f >= .5: f += 1
+	return math.copysign(f, x)
+
+def _mod(a, b):
+	# like LinuxCNC, the result has the sign of the divisor
+	if b == 0: raise RuntimeError('Division by zero in MOD')
+	result = math.fmod(a, b)
+	if result < 0: result += abs(b)
+	return result
+
+def _div(a, b):
+	if b == 0: raise RuntimeError('Division by zero')
+	return a / b
+
+def _sqrt(x):
+	if x < 0: raise RuntimeError('Negative argument to SQRT')
+	return math.sqrt(x)
+
+def _ln(x):
+	if x <= 0: raise RuntimeError('Zero or negative argument to LN')
+	return math.log(x)
+
+def _asin(x):
+	if x < -1 or x > 1: raise RuntimeError('Argument to ASIN out of range')
+	return math.degrees(math.asin(x))
+
+def _acos(x):
+	if x < -1 or x > 1: raise RuntimeError('Argument to ACOS out of range')
+	return math.degrees(math.acos(x))
+
+def _bool(f):
+	return lambda a, b: 1.0 if f(a, b) else 0.0
+
+functions = {
+	'ABS': abs,
+	'ACOS': _acos,
+	'ASIN': _asin,
+	'COS': lambda x: math.cos(math.radians(x)),
+	'EXP': math.exp,
+	'FIX': math.floor,
+	'FUP': math.ceil,
+	'LN': _ln,
+	'ROUND': _round,
+	'SIN': lambda x: math.sin(math.radians(x)),
+	'SQRT': _sqrt,
+	'TAN': lambda x: math.tan(math.radians(x)),
+}
+
+# binary operators by precedence, lowest first
+_operators = [
+	{
+		'AND': _bool(lambda a, b: a and b),
+		'OR': _bool(lambda a, b: a or b),
+		'XOR': _bool(lambda a, b: bool(a) != bool(b)),
+	},
+	{
+		'EQ': _bool(operator.eq), 'NE': _bool(operator.ne),
+		'GT': _bool(operator.gt), 'GE': _bool(operator.ge),
+		'LT': _bool(operator.lt), 'LE': _bool(operator.le),
+	},
+	{ '+': operator.add, '-': operator.sub },
+	{ '*': operator.mul, '/': _div, 'MOD': _mod },
+	{ '**': operator.pow },
+]
+
+class _Compiler:
+	def __init__(self, text):
+		self.text = text
+		self.tokens = [ ]
+		pos = 0
+		text = text.rstrip()
+
+		while pos < len(text):
+			m = _tokenRe.match(text, pos)
+			if not m: self.error()
+			self.tokens.append((m.group(1), m.group(2) or m.group(3)))
+			pos = m.end()
+
+		self.pos = 0
+
+	def error(self):
+		raise RuntimeError('Unsupported expression: %s' % self.text)
+
+	def peek(self):
+		if self.pos < len(self.tokens):
+			return self.tokens[self.pos][1]
+
+	def next(self):
+		if self.pos >= len(self.tokens): self.error()
+		self.pos += 1
+		return self.tokens[self.pos - 1]
+
+	def expect(self, symbol):
+		if self.next()[1] != symbol: self.error()
+
+	def atEnd(self):
+		return self.pos == len(self.tokens)
+
+	def expression(self, level = 0):
+		# binary operators of the given precedence level and above
+		if level == len(_operators):
+			return self.value()
+
+		left = self.expression(level + 1)
+		while self.peek() in _operators[level]:
+			op = _operators[level][self.next()[1]]
+			right = self.expression(level + 1)
+			left = (lambda op, a, b: lambda p: op(a(p), b(p)))(op, left, right)
+		return left
+
+	def parameter(self):
+		# after '#', the parameter number is a value itself (#1, #[..], ##1)
+		number, symbol = self.tokens[self.pos] if not self.atEnd() else (None, None)
+		if number != None:
+			self.pos += 1
+			key = int(float(number))
+			return lambda p: p.get(key, 0.0)
+
+		index = self.value()
+		return lambda p: p.get(int(_round(index(p))), 0.0)
+
+	def value(self):
+		number, symbol = self.next()
+
+		if number != None:
+			value = float(number)
+			return lambda p: value
+		elif symbol == '[':
+			result = self.expression()
+			self.expect(']')
+			return result
+		elif symbol == '#':
+			return self.parameter()
+		elif symbol == '-':
+			operand = self.value()
+			return lambda p: -operand(p)
+		elif symbol == '+':
+			return self.value()
+		elif symbol == 'ATAN':
+			# ATAN[y]/[x]
+			self.expect('[')
+			y = self.expression()
+			self.expect(']')
+			self.expect('/')
+			self.expect('[')
+			x = self.expression()
+			self.expect(']')
+			return lambda p: math.degrees(math.atan2(y(p), x(p)))
+		elif symbol in functions:
+			f = functions[symbol]
+			self.expect('[')
+			arg = self.expression()
+			self.expect(']')
+			return lambda p: f(arg(p))
+
+		self.error()
+
+_expressions = { }
+_templates = { }
+_cacheSize = 65536
+
+def compileExpression(text):
+	"""compile an expression (e.g. '[#1 * 2]', '-#3', '1.5') into a
+	function taking the parameter dict and returning the value"""
+	if text in _expressions:
+		return _expressions[text]
+
+	c = _Compiler(text.upper())
+	result = c.expression()
+	if not c.atEnd(): c.error()
+
+	if len(_expressions) >= _cacheSize: _expressions.clear()
+	_expressions[text] = result
+	return result
+
+def compileArguments(text):
+	"""compile a list of values (e.g. the arguments of an O-word call,
+	'[1] [#2 * 3] 4') into a list of functions as of compileExpression"""
+	c = _Compiler(text.upper())
+	result = [ ]
+	while not c.atEnd():
+		result.append(c.value())
+	return result
+
+def formatValue(value):
+	if int(value) == float(value):
+		return '%d' % value
+	return '%f' % value
+
+class Template:
+	"""block with parameters and expressions, split into words
+
+	substitute returns the text of the block with all values evaluated,
+	assignments lists (parameter number function, value function) pairs
+	of the #n=... assignments of the block"""
+	def __init__(self, words, assignments):
+		self.words = words
+		self.assignments = assignments
+
+	def substitute(self, parameters):
+		return ' '.join([ word if word.__class__ is str else
+				  word[0] + formatValue(word[1](parameters))
+				  for word in self.words ])
+
+	def assign(self, parameters, check = None):
+		"""perform the assignments of the block; all values are evaluated
+		before the first one is assigned.  check is called with every
+		parameter number before it is assigned"""
+		values = [ (int(_round(key(parameters))), value(parameters))
+			   for key, value in self.assignments ]
+		for key, value in values:
+			if check: check(key)
+			parameters[key] = value
+
+def compileBlock(text):
+	"""split a block into a Template, None if it has neither parameters
+	nor expressions"""
+	if not '#' in text and not '[' in text:
+		return None
+	if text in _templates:
+		return _templates[text]
+
+	# CAM output mostly assigns plain numbers, these are cheap enough to
+	# split that caching them (typically unique lines) doesn't pay off
+	m = _literalAssignmentRe.match(text)
+	if m:
+		key, value = float(m.group(1)), float(m.group(2))
+		return Template([ ], [ (lambda p: key, lambda p: value) ])
+
+	c = _Compiler(text.upper())
+	words = [ ]
+	assignments = [ ]
+
+	while not c.atEnd():
+		start = c.pos
+		number, symbol = c.next()
+
+		if symbol == '#':
+			key = c.value()
+			c.expect('=')
+			assignments.append((key, c.value()))
+			continue
+
+		if number != None or len(symbol) != 1 or not symbol.isalpha():
+			# function names and letters run together, split them again
+			if symbol and symbol.isalpha():
+				c.tokens[start:start + 1] = [ (None, symbol[0]), (None, symbol[1:]) ]
+				c.pos = start
+				continue
+			c.error()
+
+		value = c.value()
+		literal = c.tokens[start + 1:c.pos]
+		if literal[-1][0] != None and (len(literal) == 1 or
+					       (len(literal) == 2 and literal[0][1] in '+-')):
+			# plain number, keep the text as it is
+			words.append(symbol + ''.join([ x[0] or x[1] for x in literal ]))
+		else:
+			words.append((symbol, value))
+
+	if len(_templates) >= _cacheSize: _templates.clear()
+	_templates[text] = result = Template(words, assignments)
+	return result
@@ -6,7 +6,11 @@ class FilterChain:
 		self.__dict__['_writer'] = writer
 
 	def __getattr__(self, name):
-		return getattr(self.__dict__['_writer'], name)
+		value = getattr(self.__dict__['_writer'], name)
+		if callable(value):
+			# feed rate changes, tool changes, ... end held back paths
+			self.flush()
+		return value
 
 	def __setattr__(self, name, value):
 		setattr(self.__dict__['_writer'], name, value)
@@ -15,21 +19,63 @@ class FilterChain:
 		return self.__dict__['_filters']
 
 	def straightMotion(self, rapid, longMoveAxe, pos):
-		for filter in self.__dict__['_filters']:
-			pos = filter.straightMotion(pos)
+		self._straightMotion(0, rapid, longMoveAxe, pos)
+
+	def _straightMotion(self, first, rapid, longMoveAxe, pos):
+		filters = self.__dict__['_filters']
+		for k in xrange(first, len(filters)):
+			filter = filters[k]
+			if not getattr(filter, 'buffering', False):
+				pos = filter.straightMotion(pos)
+			elif rapid:
+				self._flush(k)
+				filter.moveTo(pos)
+			else:
+				for longMoveAxe, pos in filter.straightMotion(pos):
+					self._straightMotion(k + 1, rapid, longMoveAxe, pos)
+				return
 		self._writer.straightMotion(rapid, longMoveAxe, pos)
 
+	def _flush(self, k):
+		for longMoveAxe, pos in self.__dict__['_filters'][k].flush():
+			self._straightMotion(k + 1, False, longMoveAxe, pos)
+
+	def flush(self):
+		"""pass on the moves held back by buffering filters"""
+		filters = self.__dict__['_filters']
+		for k in xrange(len(filters)):
+			if getattr(filters[k], 'buffering', False):
+				self._flush(k)
+
+	def straightMotionBatch(self, rapid, longMoveAxe, machinePos):
+		filters = self.__dict__['_filters']
+		if [ f for f in filters if getattr(f, 'buffering', False) ]:
+			for args in zip(rapid, longMoveAxe, machinePos):
+				self.straightMotion(*args)
+			return
+
+		for pos in machinePos:
+			for filter in filters:
+				pos[:] = filter.straightMotion(pos)
+
+		batch = getattr(self._writer, 'straightMotionBatch', None)
+		if batch:
+			batch(rapid, longMoveAxe, machinePos)
+		else:
+			for args in zip(rapid, longMoveAxe, machinePos):
+				self._writer.straightMotion(*args)
+
 	def circleMotion(self, x, y, p):
+		self.flush()
 		for filter in self.__dict__['_filters']:
 			(x, y, p) = filter.circleMotion(x, y, p)
 		self._writer.circleMotion(x, y, p)
 
 class PolarFixer:
-	_lastPos = [ 0, 0 ]
-
 	def __init__(self, r, phi):
 		self._r = r
 		self._phi = phi
+		self._lastPos = [ 0, 0 ]
 
 	def straightMotion(self, pos):
 		if pos[0] == None and pos[1] == None: return pos
@@ -89,5 +135,111 @@ class OffsetFilter:
 		#y += self._offsets[1]
 		return (x, y, p)
 
+class SimplifyFilter:
+	"""merges nearly collinear and sub-resolution feed moves
+
+	feed moves are held back and simplified in windows of up to lookAhead
+	moves (Douglas-Peucker), dropping points that are less than tolerance
+	(mm) away from the remaining path.  Unlike the other filters it is
+	buffering: straightMotion returns a (possibly empty) list of
+	(longMoveAxe, pos) moves to pass on, flush those still held back.
+	FilterChain flushes before rapid moves (which are passed to moveTo
+	instead), circles and any other call to the writer, so paths are never
+	merged across those.  droppedMoves counts the moves merged away"""
+	buffering = True
+
+	def __init__(self, tolerance, lookAhead = 64):
+		self._tolerance = tolerance * 1000
+		self._lookAhead = lookAhead
+		# axes never moved don't change, assume them at 0 like the
+		# interpreter does
+		self._anchor = [ 0, 0, 0 ]
+		self._points = [ ]
+		self.droppedMoves = 0
+
+	def straightMotion(self, pos):
+		if None in self._anchor:
+			# start of the path unknown (after a circle)
+			result = [ (self._longMoveAxe(self._anchor, pos), pos) ]
+			self.moveTo(pos)
+			return result
+
+		last = self._points[-1] if self._points else self._anchor
+		self._points.append(_merge(last, pos))
+		if len(self._points) < self._lookAhead:
+			return [ ]
+		return self.flush()
+
+	def moveTo(self, pos):
+		"""take note of a move passed on unchanged"""
+		self._anchor = _merge(self._anchor, pos)
+
+	def circleMotion(self, x, y, p):
+		# FilterChain flushes before, the end of the circle isn't known
+		self._anchor = [ None, None, self._anchor[2] ]
+		return (x, y, p)
+
+	def flush(self):
+		if not self._points:
+			return [ ]
+
+		path = [ self._anchor ] + self._points
+		keep = self._simplify(path)
+		self.droppedMoves += len(self._points) - len(keep)
+
+		result = [ ]
+		last = self._anchor
+		for k in keep:
+			point = path[k]
+			pos = [ None if point[i] == last[i] else point[i] for i in xrange(3) ]
+			if pos != [ None, None, None ]:
+				result.append((self._longMoveAxe(last, point), pos))
+			last = point
+
+		self._anchor = self._points[-1]
+		self._points = [ ]
+		return result
+
+	def _simplify(self, path):
+		# indices of the points of path to keep (except the first one)
+		keep = [ ]
+		stack = [ (0, len(path) - 1) ]
+		while stack:
+			first, last = stack.pop()
+			index = None
+			maxDist = self._tolerance
+			for k in xrange(first + 1, last):
+				dist = _segmentDistance(path[k], path[first], path[last])
+				if dist > maxDist:
+					index = k
+					maxDist = dist
+
+			if index == None:
+				keep.append(last)
+			else:
+				# the later half is taken from the stack last
+				stack.append((index, last))
+				stack.append((first, index))
+		return keep
+
+	def _longMoveAxe(self, a, b):
+		dist = [ 0 if b[i] == None or a[i] == None else abs(b[i] - a[i]) for i in xrange(3) ]
+		return dist.index(max(dist))
+
+def _merge(a, pos):
+	# position a after a move to pos, which may leave axes unchanged (None)
+	return [ a[i] if pos[i] == None else pos[i] for i in xrange(3) ]
+
+def _segmentDistance(p, a, b):
+	# distance of point p to the segment a-b
+	ab = [ b[i] - a[i] for i in xrange(3) ]
+	ap = [ p[i] - a[i] for i in xrange(3) ]
+	length = ab[0] * ab[0] + ab[1] * ab[1] + ab[2] * ab[2]
+	t = 0
+	if length:
+		t = (ap[0] * ab[0] + ap[1] * ab[1] + ap[2] * ab[2]) / float(length)
+		t = min(1, max(0, t))
+	return math.sqrt(sum([ (ap[i] - t * ab[i]) ** 2 for i in xrange(3) ]))
+
 
 from util.polar import *
@@ -1,12 +1,275 @@
 import re
+import os
+import copy
 import math
+import types
+import itertools
+import mmap
+import bisect
+import marshal
+import multiprocessing
+from array import array
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from Converters import Arcs, CNCCon, Expressions, Optimizers
+
+_inlineCommentRe = re.compile(r'\s*\([^()]+\)\s*')
+_commentRe = re.compile(r'\s*;.*')
+_addressWhitespaceRe = re.compile(r'\b([A-Z])\s*([0-9.-]+)\b')
+_leadingZerosRe = re.compile(r'\b([A-Z])0+([0-9])')
+_sequenceNumberRe = re.compile(r'\s*N(\d+)\s*')
+
+# scanner for plain address words (letter followed by a number), handles
+# compact CAM output like "G1X10Y20" as well as "G 01 X 10"; anything else
+# ends up in the last group and makes the line fall back to the regex passes
+_wordRe = re.compile(r'\s*(?:([A-Z])\s*(?:0+(?=\d))?([-+]?(?:\d+\.?\d*|\.\d+))|(\S))')
+
+_handlerNameRe = re.compile(r'^process([A-Z]\d*)(?:_(\d+))?$')
+
+# O-word control flow: O100 sub, O<name> call [1] [2], O101 while [...], ...
+_oWordRe = re.compile(r'O\s*(\d+|<[^>]*>)\s*([A-Z]+)\s*(.*?)\s*$', re.I)
+
+def _stripInlineComments(x):
+	while True:
+		old = x
+		x = _inlineCommentRe.sub(' ', old)
+		if old == x:
+			return x
+
+def tokenize(line):
+	"""split cleaned block text into (letter, value) words
+
+	returns None if the line has anything but plain address words
+	(parameters, expressions, keywords, ...)"""
+	words = []
+	for letter, value, junk in _wordRe.findall(line):
+		if junk: return None
+		words.append((letter, value))
+	return words
+
+# to be increased whenever parser output changes, invalidates ParseCache
+PARSER_VERSION = 3
+
+_axisLetters = frozenset([ 'X', 'Y', 'Z' ])
+_arcLetters = frozenset([ 'X', 'Y', 'I', 'J', 'R' ])
+# axis indices (first, second, normal) and center offset words of the
+# arc planes, the first axis is where angles start counting
+_arcPlanes = {
+	'XY': ((0, 1, 2), ('I', 'J')),
+	'XZ': ((2, 0, 1), ('K', 'I')),
+	'YZ': ((1, 2, 0), ('J', 'K')),
+}
+
+# canned cycles _drillRun reorders and the words their blocks may have
+_drillCodes = frozenset([ 'G81', 'G82', 'G83' ])
+_drillLetters = frozenset([ 'X', 'Y', 'Z', 'R', 'Q', 'P', 'L' ])
+
+_axesCommands = frozenset([ 'G0', 'G1', 'G2', 'G3', 'G81', 'G82', 'G83' ])
+
+def compileWords(words):
+	"""turn the (letter, value) words of a block into pre-tokenized form
+
+	the result is a tuple of (code, params) instructions with params
+	mapping address letters to floats; F, S and T words have their letter
+	as code.  Grouping and order follow GCodeInterpreter.splitBlock and
+	reorderBlock, axis words without motion code get None as code (i.e.
+	the current motion mode)"""
+	feeds = []
+	insns = []
+	cur = None
+	axes = None
+	axesInsn = None
+
+	for letter, value in words:
+		if letter in _axisLetters:
+			if axes == None: axes = { }
+			axes.setdefault(letter, float(value))
+		elif letter == 'S' and cur and cur[0] in ('M3', 'M4'):
+			cur[1].setdefault('S', float(value))
+		elif letter == 'F':
+			feeds.append(('F', { 'F': float(value) }))
+		elif letter in 'GM':
+			cur = (letter + value, { })
+			insns.append(cur)
+			if cur[0] in _axesCommands: axesInsn = cur
+		elif letter in 'ST':
+			cur = (letter, { letter: float(value) })
+			insns.append(cur)
+		elif cur:
+			cur[1].setdefault(letter, float(value))
+		else:
+			cur = (letter + value, { })
+			insns.append(cur)
+
+	if axes:
+		if axesInsn:
+			axesInsn[1].update(axes)
+		else:
+			insns.append((None, axes))
+
+	return tuple(feeds + insns)
+
+class GCodeFileMap:
+	"""memory mapped program file with a sparse index of line offsets
+
+	the offset of every STRIDE-th line is recorded as lines are looked up,
+	lines in between are found by scanning forward from the closest
+	indexed one (or the previously looked up line)"""
+	STRIDE = 64
+
+	def __init__(self, fname):
+		with open(fname, 'rb') as f:
+			self._size = os.fstat(f.fileno()).st_size
+			if self._size:
+				self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+			else:
+				self._map = ''
+
+		self._offsets = array('L', [ 0 ])
+		self._cursorLine = 0
+		self._cursorOffset = 0
+		self.firstOffset, self.lastOffset = self._findOutermostLines()
+
+	def _findOutermostLines(self):
+		m = re.search(r'\S', self._map)
+		if not m: return (None, None)
+		first = self._map.rfind('\n', 0, m.start()) + 1
+
+		end = self._size
+		while True:
+			start = max(0, end - 4096)
+			chunk = self._map[start:end].rstrip()
+			if chunk: break
+			end = start
+		last = self._map.rfind('\n', 0, start + len(chunk)) + 1
+
+		return (first, last)
+
+	def _seek(self, i):
+		k = i // self.STRIDE
+		if k >= len(self._offsets): k = len(self._offsets) - 1
+
+		if i < self._cursorLine or k * self.STRIDE > self._cursorLine:
+			self._cursorLine = k * self.STRIDE
+			self._cursorOffset = self._offsets[k]
+
+		while self._cursorLine < i:
+			n = self._map.find('\n', self._cursorOffset)
+			if n < 0: return False
+
+			self._cursorOffset = n + 1
+			self._cursorLine += 1
 
-from Converters import CNCCon
+			if self._cursorLine == len(self._offsets) * self.STRIDE:
+				self._offsets.append(self._cursorOffset)
+
+		return self._cursorOffset < self._size
+
+	def line(self, i):
+		"""return (offset, text) of line i or None past the end of file"""
+		if not self._seek(i): return None
+
+		end = self._map.find('\n', self._cursorOffset)
+		if end < 0: end = self._size
+		return (self._cursorOffset, self._map[self._cursorOffset:end])
+
+	def lineAt(self, offset):
+		"""return the number of the line containing the given offset"""
+		k = bisect.bisect_right(self._offsets, offset) - 1
+		i = k * self.STRIDE
+
+		while True:
+			self._seek(i)
+			n = self._map.find('\n', self._cursorOffset)
+			if n < 0 or n >= offset: return i
+			i += 1
+
+	def search(self, pattern):
+		"""return the offset of the first match of pattern or None"""
+		m = pattern.search(self._map)
+		if m: return m.start()
+
+	def chunks(self, n):
+		"""split the file into at most n (start, end) offset ranges of
+		about equal size, each starting at the beginning of a line"""
+		bounds = [ 0 ]
+		for k in xrange(1, n):
+			offset = self._map.find('\n', max(bounds[-1], k * self._size // n)) + 1
+			if offset <= 0 or offset >= self._size: break
+			if offset > bounds[-1]: bounds.append(offset)
+		bounds.append(self._size)
+
+		return zip(bounds[:-1], bounds[1:])
+
+	def close(self):
+		if self._size: self._map.close()
+
+def _lexChunk(args):
+	# process pool worker of GCodeParser.parseFileParallel, returns the
+	# number of lines in the chunk and the marshalled line numbers,
+	# (block, sequence number) pairs, texts and blocks found
+	fname, start, end, first, last = args
+	with open(fname, 'rb') as f:
+		f.seek(start)
+		data = f.read(end - start)
+
+	parser = GCodeParser()
+	lineNos, seqs, texts, blocks = [ ], [ ], [ ], [ ]
+	offset = start
+
+	for lineNo, line in enumerate(data.split('\n')):
+		lineOffset = offset
+		offset += len(line) + 1
+
+		line = line.strip()
+		if not line: continue
+		if line[0] == '%' and lineOffset in (first, last): continue
+
+		lexed = parser._lexLine(line)
+		if not lexed: continue
+
+		seq, text, words = lexed
+		if seq != None: seqs.append((len(texts), seq))
+		lineNos.append(lineNo)
+		texts.append(text)
+		blocks.append(text if words == None else compileWords(words))
+
+	return (data.count('\n'), marshal.dumps((lineNos, seqs, texts, blocks)))
 
 class GCodeParser:
-	sequenceNumbers = { }
+	"""G-Code program reader
+
+	besides the blocks the parser keeps an index of sequence numbers
+	(N-number to block and back) and, when reading with parseFile,
+	parseString or in streaming mode, the source line of every block"""
+	blocks = None
+	_stream = None
+	_fileMap = None
+
+	def __init__(self):
+		self.sequenceNumbers = { }
+		self.blockSequenceNumbers = { }
+		self.blockLines = None
+
+	def _reset(self):
+		# forget the program read before, if any
+		if self._stream:
+			self._stream.close()
+			self._stream = None
+		if self._fileMap:
+			self._fileMap.close()
+			self._fileMap = None
+		self.sequenceNumbers = { }
+		self.blockSequenceNumbers = { }
+		self.blockLines = None
 
 	def readString(self, string):
+		self._reset()
+		self.blocks = None
 		self.lines = string.split('\n')
 		while self.lines and self.lines[0] == '':
 			self.lines.pop(0)
@@ -14,6 +277,8 @@ class GCodeParser:
 			self.lines.pop()
 
 	def readFile(self, fname):
+		self._reset()
+		self.blocks = None
 		with open(fname) as f:
 			self.lines = f.readlines()
 
@@ -27,6 +292,310 @@ class GCodeParser:
 			return len(x) > 0
 		self.lines = filter(f, self.lines)
 
+	def parseString(self, string):
+		"""read and clean up a program in a single pass
+
+		equivalent to readString followed by all the remove* and
+		normalize* passes and readSequenceNumbers"""
+		self._parse(string.split('\n'))
+
+	def parseFile(self, fname):
+		"""read and clean up a program file in a single pass"""
+		with open(fname) as f:
+			self._parse(f)
+
+	def parseFileParallel(self, fname, processes = None, chunkSize = 4 * 1024 * 1024):
+		"""read and clean up a program file using a pool of processes
+
+		the file is split into chunks at line boundaries which are lexed
+		in parallel; the result is the same as with parseFile.  processes
+		defaults to the number of CPUs, files smaller than chunkSize are
+		parsed in this process"""
+		if processes == None:
+			processes = multiprocessing.cpu_count()
+
+		fileMap = GCodeFileMap(fname)
+		try:
+			n = min(processes * 4, fileMap._size // chunkSize)
+			if processes < 2 or n < 2:
+				return self.parseFile(fname)
+
+			chunks = [ (fname, start, end, fileMap.firstOffset, fileMap.lastOffset)
+				   for start, end in fileMap.chunks(n) ]
+		finally:
+			fileMap.close()
+
+		self._reset()
+		self.lines = []
+		self.blocks = []
+		self.blockLines = array('L')
+
+		pool = multiprocessing.Pool(processes)
+		try:
+			lineBase = 1
+			for lineCount, result in pool.imap(_lexChunk, chunks):
+				lineNos, seqs, texts, blocks = marshal.loads(result)
+				for i, seq in seqs:
+					self._addSequenceNumber(seq, len(self.lines) + i)
+
+				self.lines.extend(texts)
+				self.blocks.extend(blocks)
+				self.blockLines.extend([ lineBase + i for i in lineNos ])
+				lineBase += lineCount
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+
+	def iterBlocks(self, fileobj, compiled = False):
+		"""generate the cleaned blocks of an open program file one by one
+
+		sequence numbers are recorded as the blocks are read; if compiled
+		is set, blocks are generated in pre-tokenized form where possible"""
+		self.blockLines = array('L')
+
+		for lineNo, seq, text, words in self._lex(fileobj):
+			if seq != None:
+				self._addSequenceNumber(seq, len(self.blockLines))
+			self.blockLines.append(lineNo)
+
+			if compiled and words != None:
+				yield compileWords(words)
+			else:
+				yield text
+
+	def streamFile(self, fname):
+		"""read blocks of a program file lazily as the interpreter asks for them
+
+		only the current block is kept in memory; seeking back (e.g. on
+		another run) re-reads the file from its beginning"""
+		self._reset()
+		self.lines = None
+		self.blocks = None
+		self._streamName = fname
+		self._openStream()
+
+	def _openStream(self):
+		if self._stream: self._stream.close()
+		self._stream = self._iterFileBlocks(self._streamName)
+		self._streamBlock = -1
+		self._streamText = None
+
+	def _iterFileBlocks(self, fname):
+		with open(fname) as f:
+			for block in self.iterBlocks(f, True):
+				yield block
+
+	def mapFile(self, fname):
+		"""memory map a program file and decode blocks on demand
+
+		there is one block per source line, lines without content
+		(e.g. comments, block-skip lines) become empty blocks"""
+		self._reset()
+		self.lines = None
+		self.blocks = None
+		self._fileMap = GCodeFileMap(fname)
+
+	def _getMappedBlock(self, i):
+		line = self._fileMap.line(i)
+		if line == None: return None
+
+		offset, text = line
+		text = text.strip()
+		if not text: return ()
+
+		if text[0] == '%' and offset in (self._fileMap.firstOffset, self._fileMap.lastOffset):
+			return ()
+
+		result = self._lexLine(text)
+		if not result: return ()
+
+		seq, text, words = result
+		if seq != None:
+			self._addSequenceNumber(seq, i)
+
+		if words != None:
+			return compileWords(words)
+		return text
+
+	def _addSequenceNumber(self, n, block):
+		self.sequenceNumbers[n] = block
+		self.blockSequenceNumbers[block] = n
+
+	def findSequenceNumber(self, n):
+		"""return the number of the block with sequence number n or None"""
+		if n in self.sequenceNumbers:
+			return self.sequenceNumbers[n]
+
+		if self._fileMap:
+			offset = self._fileMap.search(re.compile(r'^[ \t]*N\s*0*%d(?!\d)' % n, re.M))
+			if offset != None:
+				self._addSequenceNumber(n, self._fileMap.lineAt(offset))
+				return self.sequenceNumbers[n]
+
+		elif self._stream:
+			while self.getBlock(self._streamBlock + 1) != None:
+				if n in self.sequenceNumbers:
+					return self.sequenceNumbers[n]
+
+	def sequenceNumberOfBlock(self, i):
+		"""return the sequence number of block i or None"""
+		if self._fileMap and not i in self.blockSequenceNumbers:
+			self.getBlock(i)
+		return self.blockSequenceNumbers.get(i)
+
+	def findLine(self, line):
+		"""return the number of the first block at or after source line
+		line (counting from 1) or None"""
+		if self._fileMap:
+			if self.getBlock(line - 1) == None: return None
+			return max(0, line - 1)
+
+		if self._stream:
+			# blockLines is set up once the stream is started
+			while not self.blockLines or self.blockLines[-1] < line:
+				if self.getBlock(self._streamBlock + 1) == None: break
+
+		if self.blockLines == None: return None
+
+		i = bisect.bisect_left(self.blockLines, line)
+		if i < len(self.blockLines): return i
+
+	def lineOfBlock(self, i):
+		"""return the source line (counting from 1) of block i or None"""
+		if self._fileMap:
+			if self.getBlock(i) == None: return None
+			return i + 1
+
+		if self._stream and (not self.blockLines or i >= len(self.blockLines)):
+			self.getBlock(i)
+
+		if self.blockLines != None and i < len(self.blockLines):
+			return self.blockLines[i]
+
+	def getBlock(self, i):
+		"""return block i or None if the program has less blocks
+
+		blocks are returned in pre-tokenized form (see compileWords) where
+		available, as text otherwise"""
+		if self.blocks != None:
+			if i < len(self.blocks):
+				return self.blocks[i]
+			return None
+
+		if self.lines != None:
+			if i < len(self.lines):
+				return self.lines[i]
+			return None
+
+		if self._fileMap:
+			return self._getMappedBlock(i)
+
+		if i < self._streamBlock:
+			self._openStream()
+
+		while self._streamBlock < i:
+			try:
+				self._streamText = next(self._stream)
+			except StopIteration:
+				return None
+			self._streamBlock += 1
+
+		return self._streamText
+
+	def dumpParsed(self):
+		"""return the parse result as marshallable data, see loadParsed"""
+		return (self.lines, self.blocks, self.sequenceNumbers, self.blockLines.tostring())
+
+	def loadParsed(self, data):
+		"""restore a parse result returned by dumpParsed"""
+		self._reset()
+		self.lines, self.blocks, sequenceNumbers, blockLines = data
+
+		for n, block in sequenceNumbers.iteritems():
+			self._addSequenceNumber(n, block)
+
+		self.blockLines = array('L')
+		self.blockLines.fromstring(blockLines)
+
+	def _parse(self, rawLines):
+		self._reset()
+		self.lines = []
+		self.blocks = []
+		self.blockLines = array('L')
+
+		for lineNo, seq, text, words in self._lex(rawLines):
+			if seq != None:
+				self._addSequenceNumber(seq, len(self.lines))
+			self.lines.append(text)
+			self.blocks.append(text if words == None else compileWords(words))
+			self.blockLines.append(lineNo)
+
+	def _lex(self, rawLines):
+		# the last line is held back by one, so a trailing tape marker
+		# can be told apart from one in the middle of the program
+		first = True
+		pending = None
+		pendingNo = None
+		lineNo = 0
+
+		for line in rawLines:
+			lineNo += 1
+			line = line.strip()
+			if not line: continue
+
+			if first:
+				first = False
+				if line[0] == '%': continue
+
+			if pending != None:
+				result = self._lexLine(pending)
+				if result: yield (pendingNo, ) + result
+			pending = line
+			pendingNo = lineNo
+
+		if pending != None and pending[0] != '%':
+			result = self._lexLine(pending)
+			if result: yield (pendingNo, ) + result
+
+	def _lexLine(self, line):
+		"""clean up a single (stripped) line
+
+		returns (sequenceNumber, text, words) or None if the line is to be
+		skipped; words is None if the line needs interpretation as text"""
+		if ';' in line:
+			line = _commentRe.sub('', line)
+		if '(' in line:
+			line = _stripInlineComments(line)
+
+		stripped = line.strip()
+		if not stripped or stripped[0] == '/': return None
+
+		seq = None
+		words = tokenize(line)
+
+		if words != None:
+			if words and words[0][0] == 'N' and words[0][1].isdigit():
+				seq = int(words[0][1])
+				words.pop(0)
+			text = ' '.join([ letter + value for letter, value in words ])
+			if [ word for word in words if word[0] == 'O' ]:
+				# O-words are interpreted from the text, see
+				# GCodeInterpreter._oWord
+				words = None
+		else:
+			line = _addressWhitespaceRe.sub('\\1\\2', line)
+			line = _leadingZerosRe.sub('\\1\\2', line)
+			m = _sequenceNumberRe.match(line)
+			if m:
+				seq = int(m.group(1))
+				line = line[m.end():]
+			text = line
+
+		return (seq, text, words)
+
 	def removeTapeMarkers(self):
 		if self.lines and self.lines[0][0] == '%':
 			self.lines.pop(0)
@@ -35,14 +604,10 @@ class GCodeParser:
 
 	def removeInlineComments(self):
 		for i in xrange(0, len(self.lines)):
-			while True:
-				old = self.lines[i]
-				self.lines[i] = re.sub(r'\s*\([^()]+\)\s*', ' ', old)
-				if old == self.lines[i]:
-					break
+			self.lines[i] = _stripInlineComments(self.lines[i])
 
 	def removeComments(self):
-		def f(x): return re.sub(r'\s*;.*', '', x)
+		def f(x): return _commentRe.sub('', x)
 		self.lines = map(f, self.lines)
 
 	def removeBlockSkipLines(self):
@@ -53,23 +618,47 @@ class GCodeParser:
 
 	def normalizeAddressWhitespace(self):
 		def f(x):
-			return re.sub(r'\b([A-Z])\s*([0-9.-]+)\b', '\\1\\2', x)
+			return _addressWhitespaceRe.sub('\\1\\2', x)
 		self.lines = map(f, self.lines)
 
 	def normalizeLeadingZeros(self):
 		def f(x):
-			return re.sub(r'\b([A-Z])0+([0-9])', '\\1\\2', x)
+			return _leadingZerosRe.sub('\\1\\2', x)
 		self.lines = map(f, self.lines)
 
 	def readSequenceNumbers(self):
 		for i in xrange(0, len(self.lines)):
-			m = re.match(r'\s*N(\d+)\s*', self.lines[i])
+			m = _sequenceNumberRe.match(self.lines[i])
 			if not m: continue
 
 			self.lines[i] = self.lines[i][m.end():]
-			self.sequenceNumbers[int(m.group(1))] = i
+			self._addSequenceNumber(int(m.group(1)), i)
+
+class NullTarget:
+	"""target discarding all output, used to fast-forward the interpreter"""
+	axes = [ 'X', 'Y', 'Z' ]
+
+	def appendPreamble(self): pass
+	def appendPostamble(self): pass
+	def setFeedRate(self, fr): pass
+	def setSpindleSpeed(self, speed): pass
+	def appendEmptyStep(self): pass
+	def setCoolantMist(self): pass
+	def setCoolantOff(self): pass
+	def setSpindleConfig(self, spindleCCW, spindleEnable, speed): pass
+	def setSpeed(self, rapid): pass
+	def straightMotion(self, rapid, longMoveAxe, machinePos): pass
+	def circleMotion(self, x, y, p): pass
 
 class GCodeInterpreter:
+	# state saved by checkpoints, everything else is configuration
+	checkpointAttributes = (
+		'position', 'incrPosition', 'stretch', 'absDistanceMode',
+		'absArcDistanceMode', 'firstMove', 'parameters', 'plane',
+		'cannedCycleWords', 'currentTool', 'nextTool',
+		'currentMotionCommand', 'feedRate', 'spindleConfig',
+		'spindleSpeed', 'coolant' )
+
 	motionGroup = [ 'G0', 'G1', 'G2', 'G3', 'G80', 'G81', 'G82', 'G83' ]
 	axesCommands = [ 'G0', 'G1', 'G2', 'G3', 'G81', 'G82', 'G83' ]
 
@@ -90,15 +679,156 @@ class GCodeInterpreter:
 		self.cannedCycleWords = { }
 		self.currentTool = 1
 		self.nextTool = 1
+		self.currentMotionCommand = None
+
+		# maximum deviation of the straight moves arcs the controller
+		# can't do are split into
+		self.arcTolerance = 0.005
+
+		# handle runs of plain G0/G1 and G2/G3 blocks with NumPy, see
+		# _straightMotionRun and _arcRun; ignored if NumPy isn't available
+		self.batchMotion = False
+		self.batchMinLength = 32
+		# called with the codes (one per block) of each run, as the runs
+		# don't go through the handlers
+		self.batchCodes = None
+		self._noBatchBefore = 0
+		self._noArcBatchBefore = 0
+
+		# drill runs of canned cycle holes in an order shortening the
+		# rapid moves between them, see _drillRun; drillTravel is the
+		# length of these moves in program and in drilled order
+		self.drillOrder = False
+		self.drillGroupLimit = 500
+		self.drillTravel = [ 0.0, 0.0 ]
+
+		# dispatch table: code (e.g. 'G90.1', 'F') to bound handler
+		self.handlers = { }
+		for name in dir(self):
+			m = _handlerNameRe.match(name)
+			if m:
+				code = m.group(1) if m.group(2) == None else '%s.%s' % m.groups()
+				self.handlers[code] = getattr(self, name)
+		self.motionCodes = set(self.motionGroup)
+		self._extraAxesCommands = set()
+
+		# machine state as last passed to the target, to be re-established
+		# when starting in the middle of a program
+		self.feedRate = None
+		self.spindleConfig = None
+		self.spindleSpeed = None
+		self.coolant = False
+		self._restoreMachineState = False
+
+		# snapshots of the state at the start of every checkpointInterval-th
+		# block and after tool changes, used by runFrom and iterRunFrom
+		self.checkpointInterval = 1000
+		self._checkpointKey = None
+		self._checkpointBlocks = [ ]
+		self._checkpoints = [ ]
+		self._nextCheckpoint = 0
+
+		# O-word control flow: stack of active calls, loops and
+		# conditionals, see _processOWord
+		self.maxCallDepth = 100
+		self._frames = [ ]
+		self._resetOWords()
 
 	def run(self, parser):
-		self.currentBlock = -1
+		self._rewind(0)
+		self.resume(parser)
+
+	def runAll(self, parser):
+		"""like run, but continue after tool changes (assumed to be done
+		right away) up to the end of the program"""
+		self.run(parser)
+		while self.pause and not self.end:
+			self.resume(parser)
+
+	def iterRun(self, parser, chunkSize = 256):
+		"""like run, but generate the output step by step, see iterResume"""
+		self._rewind(0)
+		return self.iterResume(parser, chunkSize)
+
+	def runFrom(self, parser, block):
+		"""run the program starting at the given block number
+
+		the blocks before are interpreted without output to establish
+		the modal state; the machine state (feed rate, spindle, coolant)
+		is then re-established and the tool moved to the position reached
+		by the program, like when resuming after a tool change"""
+		self._fastForward(parser, block)
 		self.resume(parser)
 
+	def iterRunFrom(self, parser, block, chunkSize = 256):
+		"""like runFrom, but generate the output step by step, see
+		iterResume"""
+		self._fastForward(parser, block)
+		return self.iterResume(parser, chunkSize)
+
+	def _fastForward(self, parser, block):
+		position = list(self.position)
+		target = self.target
+		self.target = NullTarget()
+
+		try:
+			self._rewind(self.restoreCheckpoint(parser, block))
+			while self.currentBlock + 1 < block and not self.end:
+				self._step(parser)
+				# tool changes are assumed to be done already
+				self.pause = False
+		finally:
+			self.target = target
+
+		self.pausePosition = list(self.position)
+		self.position = position
+		self._restoreMachineState = True
+
+	def _rewind(self, block):
+		# continue with the given block
+		self.currentBlock = block - 1
+		self._noBatchBefore = 0
+		self._noArcBatchBefore = 0
+		self._nextCheckpoint = block
+		self._frames = [ ]
+		self._resetOWords()
+
 	def resume(self, parser):
+		for step in self._resume(parser):
+			pass
+
+	def iterResume(self, parser, chunkSize = 256):
+		"""like resume, but generate the output of the target (a list of
+		commands in its buffer) in chunks of about chunkSize commands, as
+		the blocks are interpreted.  The buffer is emptied every chunk, so
+		the output of the whole program is never held in memory"""
+		for step in self._resume(parser):
+			if len(self.target.buffer) >= chunkSize:
+				chunk = self.target.buffer
+				self.target.buffer = [ ]
+				yield chunk
+
+		if self.target.buffer:
+			chunk = self.target.buffer
+			self.target.buffer = [ ]
+			yield chunk
+
+	def _resume(self, parser):
+		# generator doing the work of resume, yielding after every step
 		self.pause = False
 		self.target.appendPreamble()
 
+		if self._restoreMachineState:
+			self._restoreMachineState = False
+			if self.feedRate != None:
+				self.target.setFeedRate(self.feedRate)
+			if self.spindleConfig != None:
+				self.target.setSpindleConfig(*self.spindleConfig)
+			if self.spindleSpeed != None:
+				self.target.setSpindleSpeed(self.spindleSpeed)
+			if self.coolant:
+				self.target.setCoolantMist()
+
 		# assume tool change was performed during pause
 		self.currentTool = self.nextTool
 
@@ -108,24 +838,326 @@ class GCodeInterpreter:
 			self._straightMotionToTarget([ None, None, self.pausePosition[2] ], True)
 
 		while not self.end and not self.pause:
-			self.currentBlock += 1
+			if not ((self.batchMotion and (self._straightMotionRun(parser) or self._arcRun(parser))) or
+				(self.drillOrder and self._drillRun(parser))):
+				self._step(parser)
+			yield
+
+		self.target.appendPostamble()
+		self.pausePosition = list(self.position)
+
+	def checkpoint(self):
+		"""return a snapshot of the interpreter state"""
+		return dict([ (name, copy.copy(getattr(self, name)))
+			      for name in self.checkpointAttributes ])
+
+	def restore(self, state):
+		"""return to a state returned by checkpoint"""
+		for name, value in state.iteritems():
+			setattr(self, name, copy.copy(value))
+		self.end = False
+		self.pause = False
+
+	def restoreCheckpoint(self, parser, block):
+		"""restore the last checkpoint at or before block, returns the
+		block to continue with (0 if there is none, the state is kept
+		in that case)"""
+		if self._checkpointKey != (parser, self.invertZ):
+			return 0
+
+		i = bisect.bisect_right(self._checkpointBlocks, block) - 1
+		if i < 0:
+			return 0
+
+		self.restore(self._checkpoints[i])
+		return self._checkpointBlocks[i]
+
+	def adoptCheckpoints(self, other):
+		"""take over the checkpoints another interpreter recorded"""
+		self._checkpointKey = other._checkpointKey
+		self._checkpointBlocks = other._checkpointBlocks
+		self._checkpoints = other._checkpoints
+
+	def _addCheckpoint(self, parser):
+		key = (parser, self.invertZ)
+		if self._checkpointKey != key:
+			self._checkpointKey = key
+			self._checkpointBlocks = [ ]
+			self._checkpoints = [ ]
+
+		block = self.currentBlock
+		i = bisect.bisect_left(self._checkpointBlocks, block)
+		if i == len(self._checkpointBlocks) or self._checkpointBlocks[i] != block:
+			self._checkpointBlocks.insert(i, block)
+			self._checkpoints.insert(i, self.checkpoint())
+
+		self._nextCheckpoint = block + self.checkpointInterval
+
+	def _step(self, parser):
+		self.currentBlock += 1
+
+		# the state inside of calls and loops depends on the O-word
+		# frames, so checkpoints are only taken at the top level
+		if self.currentBlock >= self._nextCheckpoint and self.checkpointInterval and not self._frames:
+			self._addCheckpoint(parser)
+
+		block = self._getBlock(parser, self.currentBlock)
+		if block == None:
+			block = 'M30'
+
+		if block.__class__ is tuple:
+			# pre-tokenized block, see compileWords
+			self._processBlock(block)
+			return
 
-			if self.currentBlock < len(parser.lines):
-				blockStr = parser.lines[self.currentBlock]
+		oWord = self._oWord(self.currentBlock, block)
+		if oWord:
+			self._processOWord(parser, *oWord)
+			return
+
+		if self.readParameters(block):
+			return
+
+		block = self.substituteParameters(block)
+		commands = self.reorderBlock(self.splitBlock(block))
+
+		for command in commands:
+			self.process(command)
+
+	def _processBlock(self, block):
+		# like splitBlock, axis words without motion code use the
+		# motion mode active at the start of the block
+		motion = self.currentMotionCommand
+
+		if self._extraAxesCommands and block and block[-1][0] == None:
+			block = self._attachAxes(block)
+
+		for insn in block:
+			if insn[0] == None:
+				if motion == None:
+					raise RuntimeError('Axis words without active motion mode')
+				insn = (motion, insn[1])
+
+			self.process(insn)
+
+	def _attachAxes(self, block):
+		# compileWords only knows the built-in motion codes, hand the axis
+		# words to a motion code added with registerHandler like
+		# splitBlock does
+		axes = block[-1][1]
+		for i, insn in enumerate(block):
+			if insn[0] in self._extraAxesCommands:
+				params = dict(insn[1])
+				params.update(axes)
+				return block[:i] + ((insn[0], params), ) + block[i + 1:-1]
+		return block
+
+	def _resetOWords(self):
+		# parsed O-words by block, found blocks (see _findOWord),
+		# subroutine blocks by name and blocks kept for replay
+		self._oWords = { }
+		self._oWordTargets = { }
+		self._subroutines = { }
+		self._bodyBlocks = { }
+
+	def _getBlock(self, parser, i):
+		if self._bodyBlocks:
+			block = self._bodyBlocks.get(i)
+			if block != None:
+				return block
+		return parser.getBlock(i)
+
+	def _oWord(self, i, block):
+		# (name, keyword, compiled argument) of an O-word control block,
+		# None for other blocks (including plain program numbers)
+		if block.__class__ is tuple or not block or not block[0] in 'Oo':
+			return None
+		if i in self._oWords:
+			return self._oWords[i]
+
+		m = _oWordRe.match(block)
+		if not m:
+			return None
+
+		name, keyword, arg = m.group(1).lower(), m.group(2).upper(), m.group(3)
+		if name[0] != '<':
+			name = str(int(name))
+
+		if keyword == 'CALL':
+			arg = Expressions.compileArguments(arg)
+		elif keyword in ('IF', 'ELSEIF', 'WHILE', 'REPEAT'):
+			arg = Expressions.compileExpression(arg)
+		else:
+			arg = None
+
+		self._oWords[i] = result = (name, keyword, arg)
+		return result
+
+	def _findOWord(self, parser, block, name, keywords, keep = False):
+		# first block after block with an O-word of the given name and one
+		# of keywords; with keep, the blocks from block up to it are kept
+		# so they aren't read again by the parser when replayed
+		key = (block, name, keywords)
+		if key in self._oWordTargets:
+			return self._oWordTargets[key]
+
+		keep = keep and parser.blocks == None
+		if keep:
+			self._bodyBlocks[block] = self._getBlock(parser, block)
+
+		i = block + 1
+		while True:
+			current = self._getBlock(parser, i)
+			if current == None:
+				raise RuntimeError('Missing O%s %s' % (name, keywords[-1].lower()))
+			if keep:
+				self._bodyBlocks[i] = current
+
+			oWord = self._oWord(i, current)
+			if oWord and oWord[0] == name and oWord[1] in keywords:
+				break
+			i += 1
+
+		self._oWordTargets[key] = i
+		return i
+
+	def _findSubroutine(self, parser, name):
+		if not name in self._subroutines:
+			self._subroutines[name] = self._findOWord(parser, -1, name, ('SUB', ))
+		block = self._subroutines[name]
+		self._findOWord(parser, block, name, ('ENDSUB', ), True)
+		return block
+
+	# end of the loops started by the keyword
+	_loopEnds = { 'WHILE': ('ENDWHILE', ), 'DO': ('WHILE', ), 'REPEAT': ('ENDREPEAT', ) }
+
+	def _loopEnd(self, parser, frame):
+		return self._findOWord(parser, frame[2], frame[1], self._loopEnds[frame[0]], True)
+
+	def _jump(self, block):
+		# continue with the given block
+		if block <= self.currentBlock:
+			self._noBatchBefore = 0
+			self._noArcBatchBefore = 0
+		self.currentBlock = block - 1
+
+	def _topFrame(self, name, keyword, kinds):
+		frames = self._frames
+		if not frames or frames[-1][0] not in kinds or frames[-1][1] != name:
+			raise RuntimeError('O%s %s without %s' % (name, keyword.lower(), kinds[0].lower()))
+		return frames[-1]
+
+	def _unwind(self, name, keyword, kinds):
+		# drop the frames above the innermost one of the given kinds
+		frames = self._frames
+		while frames and not (frames[-1][0] in kinds and (name == None or frames[-1][1] == name)):
+			frames.pop()
+		if not frames:
+			raise RuntimeError('O%s %s outside of %s' % (name, keyword.lower(), kinds[0].lower()))
+		return frames[-1]
+
+	def _popLocals(self):
+		# remove #1 to #30, returns them
+		return dict([ (key, self.parameters.pop(key))
+			      for key in self.parameters.keys() if 0 < key < 31 ])
+
+	def _processOWord(self, parser, name, keyword, arg):
+		# subroutines, loops and conditionals
+		#
+		# loops and calls jump back to blocks already read, so their bodies
+		# are only tokenized once however often they run; frames are
+		# [ kind, name, block of the starting O-word, state ]
+		i = self.currentBlock
+		frames = self._frames
+		value = arg(self.parameters) if callable(arg) else None
+
+		if keyword == 'SUB':
+			self._subroutines[name] = i
+			self._jump(self._findOWord(parser, i, name, ('ENDSUB', ), True) + 1)
+
+		elif keyword == 'CALL':
+			block = self._findSubroutine(parser, name)
+			if len(frames) >= self.maxCallDepth:
+				raise RuntimeError('O%s call nested too deeply' % name)
+
+			# #1 to #30 are local to the subroutine, they start out with
+			# the arguments of the call
+			args = [ f(self.parameters) for f in arg ]
+			saved = self._popLocals()
+			for key, argValue in enumerate(args[:30]):
+				self.parameters[key + 1] = argValue
+
+			frames.append([ 'CALL', name, i, saved ])
+			self._jump(block + 1)
+
+		elif keyword in ('ENDSUB', 'RETURN'):
+			frame = self._unwind(None, keyword, ('CALL', ))
+			frames.pop()
+			self._popLocals()
+			self.parameters.update(frame[3])
+			self._jump(frame[2] + 1)
+
+		elif keyword == 'WHILE' and frames and frames[-1][0] == 'DO' and frames[-1][1] == name:
+			# end of do ... while
+			if value:
+				self._jump(frames[-1][2] + 1)
 			else:
-				blockStr = 'M30'
+				frames.pop()
 
-			if self.readParameters(blockStr):
-				continue
+		elif keyword in ('WHILE', 'DO', 'REPEAT'):
+			frame = [ keyword, name, i, None ]
+			end = self._loopEnd(parser, frame)
 
-			blockStr = self.substituteParameters(blockStr)
-			commands = self.reorderBlock(self.splitBlock(blockStr))
+			if keyword == 'REPEAT':
+				frame[3] = value = int(value)
+			if keyword == 'DO' or value > 0:
+				frames.append(frame)
+			else:
+				self._jump(end + 1)
+
+		elif keyword == 'ENDWHILE':
+			frame = self._topFrame(name, keyword, ('WHILE', ))
+			frames.pop()
+			self._jump(frame[2])
+
+		elif keyword == 'ENDREPEAT':
+			frame = self._topFrame(name, keyword, ('REPEAT', ))
+			frame[3] -= 1
+			if frame[3] > 0:
+				self._jump(frame[2] + 1)
+			else:
+				frames.pop()
+
+		elif keyword in ('BREAK', 'CONTINUE'):
+			frame = self._unwind(name, keyword, ('WHILE', 'DO', 'REPEAT'))
+			end = self._loopEnd(parser, frame)
+			if keyword == 'BREAK':
+				frames.pop()
+				self._jump(end + 1)
+			else:
+				# the end of the loop decides about the next iteration
+				self._jump(end)
+
+		elif keyword == 'IF':
+			frames.append([ 'IF', name, i, bool(value) ])
+			if not value:
+				self._jump(self._findOWord(parser, i, name, ('ELSEIF', 'ELSE', 'ENDIF')))
+
+		elif keyword in ('ELSEIF', 'ELSE'):
+			frame = self._topFrame(name, keyword, ('IF', ))
+			if frame[3]:
+				self._jump(self._findOWord(parser, i, name, ('ENDIF', )))
+			elif keyword == 'ELSE' or value:
+				frame[3] = True
+			else:
+				self._jump(self._findOWord(parser, i, name, ('ELSEIF', 'ELSE', 'ENDIF')))
 
-			for command in commands:
-				self.process(command)
+		elif keyword == 'ENDIF':
+			self._topFrame(name, keyword, ('IF', ))
+			frames.pop()
 
-		self.target.appendPostamble()
-		self.pausePosition = list(self.position)
+		else:
+			raise RuntimeError('Unsupported O-word: O%s %s' % (name, keyword.lower()))
 
 	def splitBlock(self, blockStr):
 		instructions = []
@@ -171,64 +1203,90 @@ class GCodeInterpreter:
 		return sorted(block, key = sorter)
 
 	def readParameters(self, blockStr):
-		m = re.match(r'\s*#(\d+)\s*=\s*(.*?)\s*$', blockStr)
-		if not m: return False
+		"""perform the parameter assignments of a block, returns True if
+		there is nothing else in the block"""
+		template = Expressions.compileBlock(blockStr)
+		if not template or template.words or not template.assignments:
+			return False
 
-		key = int(m.group(1))
+		template.assign(self.parameters, self._checkWriteable)
+		return True
 
+	def _checkWriteable(self, key):
 		if key < 1 or (key > 33 and key < 100) or (key > 199 and key < 500) or key > 999:
 			raise RuntimeError('Parameter #%d is not writeable' % key)
 
-		self.parameters[key] = self.evalExpression(m.group(2))
-		return True
-
 	def evalExpression(self, expr):
-		m = re.match(r'-?[0-9\.]+$', expr)
-		if not m:
-			raise RuntimeError('Unsupported expression: %s' % expr)
-		return float(expr)
+		return Expressions.compileExpression(expr)(self.parameters)
 
 	def substituteParameters(self, blockStr):
-		while True:
-			m = re.search(r'#(\d+)\b', blockStr)
-			if not m: break
-
-			key = int(m.group(1))
+		"""evaluate the parameters and expressions of a block
 
-			if int(self.parameters[key]) == float(self.parameters[key]):
-				subst = '%d' % (self.parameters[key])
-			else:
-				subst = '%f' % (self.parameters[key])
+		assignments in the block take effect after the block is read,
+		like with LinuxCNC"""
+		template = Expressions.compileBlock(blockStr)
+		if not template:
+			return blockStr
 
-			blockStr = blockStr[:m.start()] + subst + blockStr[m.end():]
+		blockStr = template.substitute(self.parameters)
+		if template.assignments:
+			template.assign(self.parameters, self._checkWriteable)
 		return blockStr
 
+	def compileInstruction(self, insn):
+		"""turn an instruction in split form (e.g. [ 'G0', 'X10' ]) into
+		(code, params) form as produced by compileWords"""
+		code = insn[0]
+		params = { }
+
+		if code[0] in 'FST':
+			params[code[0]] = float(code[1:])
+			code = code[0]
+
+		for word in insn[1:]:
+			params.setdefault(word[0], float(word[1:]))
+
+		return (code, params)
+
 	def process(self, insn):
-		#try:
-		if 1:
-			if insn[0] in self.motionGroup:
-				self.currentMotionCommand = insn[0]
-
-			if insn[0][0] == 'F':
-				self.processF(insn)
-			elif insn[0][0] == 'S':
-				self.processS(insn)
-			elif insn[0][0] == 'T':
-				self.processT(insn)
-			else:
-				getattr(self, 'process%s' % insn[0].replace('.', '_'))(insn)
-		#except AttributeError:
-		#	raise RuntimeError('Unsupported G-Code instruction: %s' % insn[0])
+		if insn.__class__ is list:
+			insn = self.compileInstruction(insn)
+
+		handler = self.handlers.get(insn[0])
+		if handler == None:
+			if insn[0][0] == 'O':
+				return  # program number
+			raise RuntimeError('Unsupported G-Code instruction: %s' % insn[0])
+
+		if insn[0] in self.motionCodes:
+			self.currentMotionCommand = insn[0]
+
+		handler(insn)
+
+	def registerHandler(self, code, handler, motion = False):
+		"""handle instruction code (e.g. 'M100', 'G5.1') with handler
+
+		handler is called with the interpreter and the instruction in
+		(code, params) form; motion codes become the modal motion used
+		by subsequent blocks with axis words only"""
+		self.handlers[code] = types.MethodType(handler, self)
+
+		if motion:
+			self.motionCodes.add(code)
+			if not code in self.axesCommands:
+				self.axesCommands = self.axesCommands + [ code ]
+				self._extraAxesCommands.add(code)
 
 	def processF(self, insn):  # set feed rate in units per minute
-		fr = float(self._getAddress('F', insn)) * self.stretch * 1000 / 60
-		self.target.setFeedRate(fr)
+		self.feedRate = insn[1]['F'] * self.stretch * 1000 / 60
+		self.target.setFeedRate(self.feedRate)
 
 	def processS(self, insn):  # set spindle speed
-		self.target.setSpindleSpeed(min(255, round(float(self._getAddress('S', insn)) * .0141)))
+		self.spindleSpeed = min(255, round(insn[1]['S'] * .0141))
+		self.target.setSpindleSpeed(self.spindleSpeed)
 
 	def processT(self, insn):  # select tool
-		self.nextTool = int(self._getAddress('T', insn))
+		self.nextTool = int(insn[1]['T'])
 
 	def processG04(self, insn):  # dwell
 		pass
@@ -303,14 +1361,18 @@ class GCodeInterpreter:
 
 	def processM6(self, insn):  # tool change (not supported)
 		self.pause = True
+		# checkpoint at the next block
+		self._nextCheckpoint = self.currentBlock + 1
 
 	def processM7(self, insn):  # coolant on "mist"
+		self.coolant = True
 		self.target.setCoolantMist()
 
 	def processM8(self, insn):  # coolant on "flood"; equal behaviour in WinPC-NC
 		self.processM7(insn)
 
 	def processM9(self, insn):  # coolant off
+		self.coolant = False
 		self.target.setCoolantOff()
 
 	def _setSpindleConfig(self, insn, spindleCCW, spindleEnable):
@@ -321,20 +1383,21 @@ class GCodeInterpreter:
 			if S != None:
 				speed = int(S)
 				if speed: D = min(255, round(speed * .0141))
+
+		self.spindleConfig = (spindleCCW, spindleEnable, speed)
+		self.spindleSpeed = None
 		self.target.setSpindleConfig(spindleCCW, spindleEnable, speed)
 
 	def processM30(self, insn):  # end program
 		self.end = True
 
 	def _readAxes(self, insn):
-		words = [ 'X', 'Y', 'Z' ]
-		values = [ None, None, None ]
-
-		for i in xrange(len(words)):
-			for j in insn:
-				if j[0] == words[i]:
-					values[i] = float(j[1:]) * self.stretch
-					break
+		params = insn[1]
+		values = [ params.get('X'), params.get('Y'), params.get('Z') ]
+
+		for i in xrange(3):
+			if values[i] != None:
+				values[i] *= self.stretch
 		return values
 
 	def _vectorAdd(self, a, b):
@@ -390,6 +1453,174 @@ class GCodeInterpreter:
 		self._mergeIntoPosition(target)
 		self.firstMove = False
 
+	def _straightMotionRun(self, parser):
+		# vectorized equivalent of _straightMotion for a run of blocks
+		# consisting of a single G0/G1 (or modal motion) instruction with
+		# axis words only, returns False if there is no such run at the
+		# current block
+		first = self.currentBlock + 1
+		blocks = parser.blocks
+		if (numpy == None or blocks == None or first < self._noBatchBefore or
+		    self.firstMove or self.position != self.incrPosition):
+			return False
+
+		motion = self.currentMotionCommand
+		rapids = [ ]
+		moves = [ ]
+		nan = float('nan')
+		end = first
+
+		while end < len(blocks):
+			block = blocks[end]
+			if block.__class__ is not tuple or len(block) != 1: break
+
+			code, params = block[0]
+			if code == None: code = motion
+			if code != 'G0' and code != 'G1': break
+			if not _axisLetters.issuperset(params): break
+
+			motion = code
+			rapids.append(code == 'G0')
+			moves.append((params.get('X', nan), params.get('Y', nan), params.get('Z', nan)))
+			end += 1
+
+		if end - first < self.batchMinLength:
+			self._noBatchBefore = end + 1
+			return False
+
+		n = len(moves)
+		moves = numpy.array(moves) * self.stretch
+		given = ~numpy.isnan(moves)
+		if self.invertZ: moves[:, 2] = -moves[:, 2]
+		start = numpy.array(self.position, dtype = float)
+
+		# positions after each move
+		if self.absDistanceMode:
+			index = numpy.where(given, numpy.arange(n)[:, None], -1)
+			numpy.maximum.accumulate(index, axis = 0, out = index)
+			positions = numpy.where(index >= 0, moves[index, numpy.arange(3)], start)
+			targets = moves
+		else:
+			# sequential sums, like adding up one move after the other
+			positions = numpy.add.accumulate(numpy.vstack((start, numpy.where(given, moves, 0))))[1:]
+			targets = positions
+		before = numpy.vstack((start, positions[:-1]))
+
+		dist = numpy.where(given, numpy.abs(targets - before), 0)
+		longMoveAxes = dist.argmax(axis = 1)
+		moving = given & (targets != before)
+
+		# round() of Python 2: half away from zero
+		with numpy.errstate(invalid = 'ignore'):
+			scaled = numpy.abs(targets * 1000)
+			machine = numpy.floor(scaled)
+			machine = numpy.copysign(machine + (scaled - machine >= .5), targets)
+
+		rapidMoves = [ ]
+		longMoveAxeMoves = [ ]
+		machinePosMoves = [ ]
+		for rapid, longMoveAxe, pos, mask in itertools.izip(rapids, longMoveAxes.tolist(),
+								      machine.tolist(), moving.tolist()):
+			if mask[0] or mask[1] or mask[2]:
+				rapidMoves.append(rapid)
+				longMoveAxeMoves.append(longMoveAxe)
+				machinePosMoves.append([ pos[0] if mask[0] else None,
+							 pos[1] if mask[1] else None,
+							 pos[2] if mask[2] else None ])
+
+		batch = getattr(self.target, 'straightMotionBatch', None)
+		if batch:
+			batch(rapidMoves, longMoveAxeMoves, machinePosMoves)
+		else:
+			for args in itertools.izip(rapidMoves, longMoveAxeMoves, machinePosMoves):
+				self.target.straightMotion(*args)
+		if self.batchCodes:
+			self.batchCodes([ 'G0' if rapid else 'G1' for rapid in rapids ])
+
+		self.position = positions[-1].tolist()
+		self.incrPosition = list(self.position)
+		self.currentMotionCommand = motion
+		self.currentBlock = end - 1
+		return True
+
+	def _arcRun(self, parser):
+		# vectorized equivalent of _circleMotion for a run of blocks
+		# consisting of a single G2/G3 (or modal motion) instruction in
+		# the XY plane, returns False if there is no such run at the
+		# current block
+		first = self.currentBlock + 1
+		blocks = parser.blocks
+		if (numpy == None or blocks == None or first < self._noArcBatchBefore or
+		    self.firstMove or self.position != self.incrPosition or self.plane != 'XY'):
+			return False
+
+		motion = self.currentMotionCommand
+		ccw = [ ]
+		arcs = [ ]
+		nan = float('nan')
+		end = first
+
+		while end < len(blocks):
+			block = blocks[end]
+			if block.__class__ is not tuple or len(block) != 1: break
+
+			code, params = block[0]
+			if code == None: code = motion
+			if code != 'G2' and code != 'G3': break
+			if not _arcLetters.issuperset(params): break
+
+			motion = code
+			ccw.append(code == 'G3')
+			arcs.append([ params.get(x, nan) for x in 'XYIJR' ])
+			end += 1
+
+		if end - first < self.batchMinLength:
+			self._noArcBatchBefore = end + 1
+			return False
+
+		n = len(arcs)
+		arcs = numpy.array(arcs) * self.stretch
+		ccw = numpy.array(ccw)
+		moves = arcs[:, :2]
+		given = ~numpy.isnan(moves)
+		start = numpy.array(self.position[:2], dtype = float)
+
+		# end points like in _straightMotionRun
+		if self.absDistanceMode:
+			index = numpy.where(given, numpy.arange(n)[:, None], -1)
+			numpy.maximum.accumulate(index, axis = 0, out = index)
+			ends = numpy.where(index >= 0, moves[index, numpy.arange(2)], start)
+		else:
+			ends = numpy.add.accumulate(numpy.vstack((start, numpy.where(given, moves, 0))))[1:]
+		starts = numpy.vstack((start, ends[:-1]))
+
+		offsets = numpy.nan_to_num(arcs[:, 2:4])
+		centers = offsets if self.absArcDistanceMode else starts + offsets
+		radius = ~numpy.isnan(arcs[:, 4])
+
+		try:
+			if radius.any():
+				centers[radius] = Arcs.radiusCenters(starts[radius], ends[radius],
+								     arcs[radius, 4], ccw[radius])
+			Arcs.checkRadii(starts, ends, centers)
+		except RuntimeError:
+			# let _circleMotion report the error at its block
+			self._noArcBatchBefore = end + 1
+			return False
+
+		x, y, p = Arcs.circleCommands(starts, ends, centers, ccw)
+		circleMotion = self.target.circleMotion
+		for args in itertools.izip(x.tolist(), y.tolist(), p.tolist()):
+			circleMotion(*args)
+		if self.batchCodes:
+			self.batchCodes([ 'G3' if c else 'G2' for c in ccw.tolist() ])
+
+		self.position[:2] = ends[-1].tolist()
+		self.incrPosition = list(self.position)
+		self.currentMotionCommand = motion
+		self.currentBlock = end - 1
+		return True
+
 	def processG0(self, insn):  # rapid motion
 		self._straightMotion(insn, True)
 
@@ -397,147 +1628,115 @@ class GCodeInterpreter:
 		self._straightMotion(insn, False)
 
 	def _getAddress(self, word, insn):
-		for i in insn:
-			if i[0] == word:
-				return i[1:]
+		return insn[1].get(word)
 
 	def processG2(self, insn):  # CW circle
-		self._circleMotion(insn, self.angleCalcCW, False)
+		self._circleMotion(insn, False)
 
 	def processG3(self, insn):  # CCW circle
-		self._circleMotion(insn, self.angleCalcCCW, True)
-
-	def _calcInnerAngle(self, xa, ya, xb, yb, xc, yc, fAngle):
-		# a = dist B-C
-		a = math.sqrt((xb - xc) ** 2 + (yb - yc) ** 2)
-		# b = dist C-A
-		b = math.sqrt((xc - xa) ** 2 + (yc - ya) ** 2)
-
-		if round(a - b, 3) != 0:
-			raise RuntimeError('strange circle a=%f, b=%f', a, b)
+		self._circleMotion(insn, True)
 
-		alpha = fAngle((xa - xc) / a, (ya - yc) / a)
-		beta = fAngle((xb - xc) / a, (yb - yc) / a)
-
-		if beta < alpha: beta += math.pi * 2
-
-		return beta - alpha
-
-	def _circleMotion(self, insn, fAngle, ccw):
+	def _circleMotion(self, insn, ccw):
 		move = self._readAxes(insn)
 		radius = self._getAddress('R', insn)
 
+		if self.invertZ and move[2] != None:
+			move[2] = -move[2]
+
 		if self.absDistanceMode:
 			target = move
 		else:
 			target = self._vectorAdd(move, self.incrPosition)
 
-		xa = self.position[0]
-		ya = self.position[1]
-		xb = target[0]
-		yb = target[1]
-
-		if radius:
-			#
-			# calculate potential center coords for circle
-			# http://www.fachinformatiker.de/algorithmik/70902-kreismittelpunkt-berechnen.html
-			#
-			r = float(radius) ** 2
-
-			a = -((-2 * ya) - (-2 * yb)) / ((-2 * xa) - (-2 * xb))
-			b = -((xa * xa + ya * ya - r) - (xb * xb + yb * yb - r)) / ((-2 * xa) - (-2 * xb));
-			p = (-2 * (xa - b) * a - 2 * ya) / (a * a + 1);
-			q = ((xa - b) * (xa - b) + ya * ya - r) / (a * a + 1);
-			y1 = -p / 2 + math.sqrt((p * p) / 4 - q);
-			y2 = -p / 2 - math.sqrt((p * p) / 4 - q);
-			x1 = a * y1 + b;
-			x2 = a * y2 + b;
-
-			k = self._calcInnerAngle(xa, ya, xb, yb, x1, y1, fAngle) < self._calcInnerAngle(xa, ya, xb, yb, x2, y2, fAngle)
-			if float(radius) < 0: k = not k
-
-			if k:
-				xc = x1
-				yc = y1
-			else:
-				xc = x2
-				yc = y2
+		for i in xrange(3):
+			if target[i] == None:
+				target[i] = self.position[i] if self.absDistanceMode else self.incrPosition[i]
 
+		if self.plane != 'XY' or target[2] != self.position[2]:
+			# the CNCCON circle command only moves X and Y
+			self._segmentedArc(insn, target, ccw)
+			return
+
+		start = self.position[:2]
+		end = target[:2]
+
+		if radius != None:
+			center = Arcs.radiusCenter(start, end, radius * self.stretch, ccw)
 		else:
-			i = self._getAddress('I', insn)
-			j = self._getAddress('J', insn)
+			i = self._getAddress('I', insn) or 0
+			j = self._getAddress('J', insn) or 0
 
 			if self.absArcDistanceMode:
-				xc = float(i) * self.stretch
-				yc = float(j) * self.stretch
+				center = [ i * self.stretch, j * self.stretch ]
 			else:
-				if i:
-					xc = self.position[0] + float(i) * self.stretch
-				else:
-					xc = self.position[0]
+				center = [ start[0] + i * self.stretch, start[1] + j * self.stretch ]
 
-				if j:
-					yc = self.position[1] + float(j) * self.stretch
-				else:
-					yc = self.position[1]
-
-		# a = dist B-C
-		a = math.sqrt((xb - xc) ** 2 + (yb - yc) ** 2)
-		# b = dist C-A
-		b = math.sqrt((xc - xa) ** 2 + (yc - ya) ** 2)
-
-		if round(a - b, 3) != 0:
-			raise RuntimeError('strange circle a=%f, b=%f', a, b)
-
-		# c = dist A-B
-		c = math.sqrt((xa - xb) ** 2 + (ya - yb) ** 2)
-
-		# law of cosine
-		gamma = math.acos((a ** 2 + b ** 2 - c ** 2) / (2 * a * b))
-
-		# if the center of the circle is specified directly,
-		# the angle gamma may be larger than 180 deg;
-		alpha = fAngle((xa - xc) / a, (ya - yc) / a)
-		beta = fAngle((xb - xc) / a, (yb - yc) / a)
-
-		if beta < alpha: beta += math.pi * 2
-		if beta - alpha > math.pi: gamma += math.pi
-
-		x = round((xc - xa) * 1000)
-		y = round((yc - ya) * 1000)
-		p = gamma * 1000000
-		if not ccw: p = -p
-
-		# WinPC-NC seems to always ceil the value, for whatever reason ...
-		p = math.ceil(p)
-
-		self.target.circleMotion(x, y, p)
+		Arcs.checkRadius(start, end, center)
+		self.target.circleMotion(*Arcs.circleCommand(start, end, center, ccw))
 		self._mergeIntoPosition(target)
 		self.firstMove = False
 
-	def angleCalcCW(self, x, y):
-		x = round(x, 6)
-		alpha = math.acos(x)
-		if y > 0: alpha = 2 * math.pi - alpha
+	def _segmentedArc(self, insn, target, ccw):
+		# arc in any plane, possibly helical, as straight moves deviating
+		# at most arcTolerance from the arc
+		axes, words = _arcPlanes[self.plane]
+		first, second, normal = axes
+		start = self.position
+		radius = self._getAddress('R', insn)
 
-		return alpha
+		if self.invertZ and self.plane != 'XY':
+			# mirrored plane, the arc runs the other way round
+			ccw = not ccw
 
-	def angleCalcCCW(self, x, y):
-		x = round(x, 6)
-		alpha = math.acos(x)
-		if y < 0: alpha = 2 * math.pi - alpha
+		arcStart = (start[first], start[second])
+		arcEnd = (target[first], target[second])
 
-		return alpha
+		if radius != None:
+			center = Arcs.radiusCenter(arcStart, arcEnd, radius * self.stretch, ccw)
+		else:
+			center = [ ]
+			for axis, word in zip((first, second), words):
+				offset = self._getAddress(word, insn)
+				if offset == None:
+					center.append(start[axis])
+					continue
+
+				offset *= self.stretch
+				if axis == 2 and self.invertZ:
+					offset = -offset
+				center.append(offset if self.absArcDistanceMode else start[axis] + offset)
+
+		Arcs.checkRadius(arcStart, arcEnd, center)
+		a = math.hypot(arcStart[0] - center[0], arcStart[1] - center[1])
+		alpha = math.atan2(arcStart[1] - center[1], arcStart[0] - center[0])
+		sweep = Arcs.sweep(arcStart, arcEnd, center, ccw)
+
+		if self.arcTolerance < a:
+			step = 2 * math.acos(1 - self.arcTolerance / a)
+		else:
+			step = math.pi / 2
+		n = max(1, int(math.ceil(abs(sweep) / step)))
+
+		for k in xrange(1, n):
+			angle = alpha + sweep * k / n
+			pos = [ None, None, None ]
+			pos[first] = center[0] + a * math.cos(angle)
+			pos[second] = center[1] + a * math.sin(angle)
+			pos[normal] = start[normal] + (target[normal] - start[normal]) * k / n
+			self._straightMotionToTarget(pos, False)
+
+		self._straightMotionToTarget(list(target), False)
+		self.firstMove = False
 
 	def _processCannedCycle(self, insn, peck):
 		move = self._readAxes(insn)
 		oldZ = self.position[2]
 
-		if self._getAddress('R', insn):
+		if self._getAddress('R', insn) != None:
 			self.cannedCycleWords['R'] = self._getAddress('R', insn)
 		if self.cannedCycleWords['R'] == None:
 			raise ValueError('R not set for canned cycle')
-		clearZ = float(self.cannedCycleWords['R']) * self.stretch
+		clearZ = self.cannedCycleWords['R'] * self.stretch
 
 		if move[2]:
 			self.cannedCycleWords['Z'] = move[2]
@@ -565,7 +1764,6 @@ class GCodeInterpreter:
 			Q = self._getAddress('Q', insn)
 			if Q == None: raise ValueError('Q of G83 not set')
 
-			Q = float(Q)
 			if Q <= 0:
 				raise ValueError('Q of G83 must not be zero or negative')
 
@@ -611,6 +1809,68 @@ class GCodeInterpreter:
 
 			self._straightMotionToTarget([ None, None, oldZ ], True)
 
+	def _drillRun(self, parser):
+		# drill a run of at least 3 canned cycle blocks with the same code
+		# and parameters in the order found by Optimizers.orderPoints, if
+		# that is shorter, returns False if there is no such run at the
+		# current block.  The last hole stays last, so blocks after the
+		# run (incremental ones, those not giving all axes) continue from
+		# where they would have.  The blocks must have absolute X and Y;
+		# L only repeats a hole in place in absolute distance mode, so it
+		# moves along with its hole
+		if not self.absDistanceMode:
+			return False
+
+		code = self.currentMotionCommand
+		holes = [ ]
+		i = self.currentBlock + 1
+
+		while len(holes) < self.drillGroupLimit:
+			block = self._getBlock(parser, i)
+			if block.__class__ is not tuple or len(block) != 1:
+				break
+
+			insnCode, params = block[0]
+			if insnCode == None:
+				insnCode = code
+			if not insnCode in _drillCodes or not _drillLetters.issuperset(params):
+				break
+			if not 'X' in params or not 'Y' in params:
+				break
+
+			if not holes:
+				code = insnCode
+			elif insnCode != code or [ key for key in 'RZQP'
+						    if params.get(key, holes[0].get(key)) != holes[0].get(key) ]:
+				break
+
+			holes.append(params)
+			i += 1
+
+		if len(holes) < 3:
+			return False
+
+		points = [ (hole['X'], hole['Y']) for hole in holes ]
+		start = (self.position[0] / self.stretch, self.position[1] / self.stretch)
+		order = Optimizers.orderPoints(start, points, True)
+		before = Optimizers.pathLength(start, points)
+		after = Optimizers.pathLength(start, [ points[k] for k in order ])
+		if after >= before:
+			order, after = range(len(points)), before
+		self.drillTravel[0] += before * self.stretch
+		self.drillTravel[1] += after * self.stretch
+
+		# R and Z of the first block take effect with the first hole
+		settings = dict([ (key, value) for key, value in holes[0].items() if key in 'RZ' ])
+		for n, k in enumerate(order):
+			params = dict([ (key, value) for key, value in holes[k].items() if not key in 'RZ' ])
+			if n == 0:
+				params.update(settings)
+			self.process((code, params))
+
+		self.currentBlock = i - 1
+		return True
+
 	def processG81(self, insn):
 		self._processCannedCycle(insn, False)
 
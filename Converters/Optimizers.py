@@ -0,0 +1,513 @@
+"""optimizing stages between the interpreter and the writer
+
+like Filters.FilterChain, the stages take the place of the target of the
+interpreter and pass everything on to the target they wrap"""
+import math
+
+def arcEnd(start, x, y, p):
+	"""end point of a circle command (as of circleMotion, machine units)
+	starting at start"""
+	cx = start[0] + x
+	cy = start[1] + y
+	r = math.hypot(x, y)
+	angle = math.atan2(-y, -x) + p / 1000000.
+	return [ round(cx + r * math.cos(angle)), round(cy + r * math.sin(angle)) ]
+
+class ArcFitter:
+	"""replaces runs of straight moves lying on a circle by circle commands
+
+	moves are held back while they continue a run in the XY plane; a run of
+	at least minSegments moves where neither the points nor the moves
+	between them deviate more than tolerance (mm) from a circle becomes a
+	single circleMotion.  Any other call to the target ends the run.
+	savedMoves counts the moves that were dropped"""
+	def __init__(self, target, tolerance = 0.005, minSegments = 4, maxSegments = 1000):
+		d = self.__dict__
+		d['_target'] = target
+		d['tolerance'] = tolerance * 1000
+		d['minSegments'] = minSegments
+		d['maxSegments'] = maxSegments
+		d['arcs'] = 0
+		d['savedMoves'] = 0
+		d['_position'] = [ None, None, None ]
+		# points of the current run, the first being where it starts, and
+		# the straightMotion arguments of the moves to them
+		d['_points'] = [ ]
+		d['_moves'] = [ ]
+		d['_fitted'] = False
+
+	def __getattr__(self, name):
+		value = getattr(self.__dict__['_target'], name)
+		if callable(value):
+			self.flush()
+		return value
+
+	def __setattr__(self, name, value):
+		setattr(self.__dict__['_target'], name, value)
+
+	def straightMotion(self, rapid, longMoveAxe, machinePos):
+		pos = self._position
+		if (rapid or machinePos[2] != None or pos[0] == None or pos[1] == None or
+		    (machinePos[0] == None and machinePos[1] == None)):
+			self.flush()
+			self._target.straightMotion(rapid, longMoveAxe, machinePos)
+			self._moveTo(machinePos)
+			return
+
+		if not self._points:
+			self._points.append((pos[0], pos[1]))
+		self._moveTo(machinePos)
+		self._points.append((pos[0], pos[1]))
+		self._moves.append((rapid, longMoveAxe, machinePos))
+		self._extend()
+
+	def straightMotionBatch(self, rapid, longMoveAxe, machinePos):
+		for args in zip(rapid, longMoveAxe, machinePos):
+			self.straightMotion(*args)
+
+	def circleMotion(self, x, y, p):
+		self.flush()
+		self._target.circleMotion(x, y, p)
+		if self._position[0] != None and self._position[1] != None:
+			self._position[:2] = arcEnd(self._position, x, y, p)
+
+	def savedCommands(self):
+		"""commands saved with CNCCon.CNCConWriter, which sends an E and
+		a V command per move"""
+		return 2 * self.savedMoves
+
+	def flush(self):
+		"""pass on the moves held back"""
+		if self._fitted:
+			self._emitArc(len(self._points))
+		self._emitStraight(len(self._moves))
+		del self._points[:]
+		self.__dict__['_fitted'] = False
+
+	def _moveTo(self, machinePos):
+		for i in xrange(3):
+			if machinePos[i] != None:
+				self._position[i] = machinePos[i]
+
+	def _extend(self):
+		# find the longest run fitting a circle: drop moves from the front
+		# of the run until it does, a run that fitted before the last move
+		# came in is complete
+		points = self._points
+		while len(points) > self.minSegments and not self._circle(points):
+			if self._fitted:
+				self._emitArc(len(points) - 1)
+			else:
+				self._emitStraight(1)
+				del points[0]
+		self.__dict__['_fitted'] = fitted = len(points) > self.minSegments
+		if fitted and len(points) > self.maxSegments:
+			self._emitArc(len(points))
+
+	def _emitStraight(self, n):
+		for args in self._moves[:n]:
+			self._target.straightMotion(*args)
+		del self._moves[:n]
+
+	def _emitArc(self, n):
+		# replace the first n points (n - 1 moves) of the run by an arc,
+		# the run continues from where the controller ends up
+		points = self._points
+		center, ccw, sweep = self._circle(points[:n])
+		start = points[0]
+
+		x = round(center[0] - start[0])
+		y = round(center[1] - start[1])
+		p = math.ceil(sweep * 1000000 if ccw else -sweep * 1000000)
+		self._target.circleMotion(x, y, p)
+
+		end = arcEnd(start, x, y, p)
+		points[:n] = [ tuple(end) ]
+		del self._moves[:n - 1]
+		if not self._moves:
+			self._position[:2] = end
+			del points[:]
+
+		self.__dict__['arcs'] += 1
+		self.__dict__['savedMoves'] += n - 2
+		self.__dict__['_fitted'] = False
+
+	def _circle(self, points):
+		# (center, ccw, sweep) of the circle through points within
+		# tolerance, None if there is none
+		tolerance = self.tolerance
+		(ax, ay), (bx, by), (cx, cy) = points[0], points[len(points) // 2], points[-1]
+
+		d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+		if d == 0:
+			return None
+		a2, b2, c2 = ax * ax + ay * ay, bx * bx + by * by, cx * cx + cy * cy
+		ux = (a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d
+		uy = (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d
+		r = math.hypot(ax - ux, ay - uy)
+
+		# the controller's angles have a resolution of 1 urad
+		if r * 0.000001 > tolerance:
+			return None
+
+		sweep = 0
+		direction = 0
+		last = math.atan2(ay - uy, ax - ux)
+		for k in xrange(1, len(points)):
+			x, y = points[k]
+			if abs(math.hypot(x - ux, y - uy) - r) > tolerance:
+				return None
+
+			angle = math.atan2(y - uy, x - ux)
+			step = (angle - last + math.pi) % (2 * math.pi) - math.pi
+			last = angle
+			if step == 0 or (direction and (step > 0) != (direction > 0)):
+				return None
+			direction = step
+
+			# sagitta, deviation of the straight move from the arc
+			if r * (1 - math.cos(step / 2)) > tolerance:
+				return None
+
+			sweep += abs(step)
+			if sweep >= 2 * math.pi:
+				return None
+
+		return (ux, uy), direction > 0, sweep
+
+class CommandOptimizer:
+	"""drops CNCCON commands that don't change the controller state
+
+	works on the command stream of CNCCon.CNCConWriter, e.g. the chunks of
+	GCodeInterpreter.iterRun: speed (C/W pairs), feed rate (G20/G21),
+	spindle speed (D with its W100) and output (A) settings repeating the
+	current value are dropped, as are empty steps (E following E).  Only
+	empty steps are merged, so the E commands still count the steps the
+	controller reports.  The controller state is unknown at first, so use
+	a new optimizer for every run.  droppedCommands counts the commands
+	dropped"""
+	def __init__(self):
+		self._state = { }
+		# C or D command waiting for the W following it
+		self._held = None
+		self._afterStep = False
+		self.droppedCommands = 0
+
+	def optimize(self, chunks):
+		"""generate the optimized chunks of an iterable of command lists"""
+		for chunk in chunks:
+			result = self.optimizeChunk(chunk)
+			if result:
+				yield result
+
+		result = self.flush()
+		if result:
+			yield result
+
+	def optimizeChunk(self, commands):
+		"""return the optimized commands, the last one may be held back
+		until the next chunk (or flush)"""
+		result = [ ]
+		for command in commands:
+			self._process(command, result)
+		return result
+
+	def flush(self):
+		"""return the command held back, if any"""
+		result = [ ]
+		if self._held:
+			self._setting((self._held[0], ), (self._held, ), result)
+			self._held = None
+		return result
+
+	def _process(self, command, result):
+		held = self._held
+		if held:
+			self._held = None
+			if command[0] == 'W':
+				if held[0] == 'C':
+					self._setting(('C', 'W'), (held, command), result)
+				else:
+					# the W100 belongs to the spindle speed
+					self._setting(('D', 'DW'), (held, command), result)
+				return
+			self._setting((held[0], ), (held, ), result)
+
+		kind = command[0]
+		if kind == 'E':
+			if self._afterStep:
+				self.droppedCommands += 1
+			else:
+				result.append(command)
+				self._afterStep = True
+		elif kind in 'CD':
+			self._held = command
+		elif kind == 'A':
+			self._setting(('A', ), (command, ), result)
+		elif command.startswith('G20,') or command.startswith('G21,'):
+			self._setting((command[:3], ), (command, ), result)
+		else:
+			result.append(command)
+			self._afterStep = False
+
+	def _setting(self, keys, commands, result):
+		# drop the commands if they set nothing but the current state of
+		# keys (one command per key)
+		state = self._state
+		if [ state.get(key) for key in keys ] == list(commands[:len(keys)]):
+			self.droppedCommands += len(commands)
+			return
+
+		for key, command in zip(keys, commands):
+			state[key] = command
+		result.extend(commands)
+		self._afterStep = False
+
+def pathLength(start, points):
+	"""length of the path from start through points (in the XY plane)"""
+	length = 0
+	for point in points:
+		length += math.hypot(point[0] - start[0], point[1] - start[1])
+		start = point
+	return length
+
+def orderPoints(start, points, keepLast = False, maxPasses = 50):
+	"""order (list of indices) of points giving a short path from start
+	through all of them: nearest neighbour, improved by 2-opt.  With
+	keepLast the last point stays last, so the path ends where it would
+	have.  The result only depends on the input, ties keep the original
+	order"""
+	n = len(points)
+	xs = [ start[0] ] + [ p[0] for p in points ]
+	ys = [ start[1] ] + [ p[1] for p in points ]
+	hypot = math.hypot
+	last = n - 1 if keepLast and n else n
+
+	# nearest neighbour
+	order = [ 0 ]
+	left = range(1, last + 1)
+	while left:
+		x, y = xs[order[-1]], ys[order[-1]]
+		best = min(left, key = lambda k: (hypot(xs[k] - x, ys[k] - y), k))
+		order.append(best)
+		left.remove(best)
+	order += range(last + 1, n + 1)
+
+	# 2-opt: reverse order[i:j + 1] if that shortens the path, the start
+	# stays fixed and the end is free unless keepLast
+	def d(a, b):
+		return hypot(xs[a] - xs[b], ys[a] - ys[b])
+
+	for p in xrange(maxPasses):
+		improved = False
+		for i in xrange(1, last):
+			a, b = order[i - 1], order[i]
+			ab = d(a, b)
+			for j in xrange(i + 1, last + 1):
+				c = order[j]
+				if j < n:
+					e = order[j + 1]
+					delta = d(a, c) + d(b, e) - ab - d(c, e)
+				else:
+					delta = d(a, c) - ab
+				if delta < -1e-9:
+					order[i:j + 1] = order[i:j + 1][::-1]
+					improved = True
+					a, b = order[i - 1], order[i]
+					ab = d(a, b)
+		if not improved:
+			break
+
+	return [ k - 1 for k in order[1:] ]
+
+class _Island:
+	# the moves of one contour: start is where the rapid moves leading to
+	# it end, calls what follows up to the next contour
+	def __init__(self, start, feed):
+		self.start = start
+		self.feed = feed
+		self.calls = [ ]
+		self.box = None
+		self.end = start
+
+	def extend(self, x, y, r = 0):
+		box = self.box
+		if box == None:
+			self.box = [ x - r, y - r, x + r, y + r ]
+		else:
+			self.box = [ min(box[0], x - r), min(box[1], y - r), max(box[2], x + r), max(box[3], y + r) ]
+
+	def overlaps(self, other):
+		a, b = self.box, other.box
+		return (a != None and b != None and a[0] <= b[2] and b[0] <= a[2] and
+			a[1] <= b[3] and b[1] <= a[3])
+
+class ContourOrderer:
+	"""reorders contours separated by retracts to shorten the rapid moves
+	between them
+
+	a contour (island) starts with rapid moves in the XY plane and lasts
+	up to the next such moves.  Runs of contours entered and left at the
+	same height are held back and cut in nearest neighbour order, if that
+	is shorter than the program order; the last one stays last, so the
+	program continues where it would have, and contours overlapping (in
+	the XY plane) an earlier one stay after it, which keeps depth passes
+	and inner before outer cuts in order.
+	Feed rates are re-established as needed.  Any other call to the target
+	(spindle, coolant, tool change, ...) ends the run.  rapidTravel is the
+	length of the rapid moves to the contours (mm) in program and in cut
+	order"""
+	def __init__(self, target, maxIslands = 500):
+		d = self.__dict__
+		d['_target'] = target
+		d['maxIslands'] = maxIslands
+		d['rapidTravel'] = [ 0.0, 0.0 ]
+		d['_position'] = [ None, None, None ]
+		d['_feed'] = None
+		d['_islands'] = [ ]
+		# where the run starts and at which height contours are entered
+		d['_entry'] = None
+		d['_height'] = None
+
+	def __getattr__(self, name):
+		value = getattr(self.__dict__['_target'], name)
+		if callable(value):
+			self.flush()
+		return value
+
+	def __setattr__(self, name, value):
+		setattr(self.__dict__['_target'], name, value)
+
+	def straightMotion(self, rapid, longMoveAxe, machinePos):
+		pos = self._position
+		islands = self._islands
+		leadIn = rapid and machinePos[2] == None
+
+		if leadIn and not (islands and not islands[-1].calls):
+			# rapid moves to a new contour
+			if None in pos or (islands and pos[2] != self._height) or len(islands) >= self.maxIslands:
+				self.flush()
+			if None in pos:
+				self._pass(rapid, longMoveAxe, machinePos)
+				return
+
+			if not islands:
+				self.__dict__['_entry'] = pos[:2]
+				self.__dict__['_height'] = pos[2]
+			islands.append(_Island(None, self._feed))
+
+		if not islands:
+			self._pass(rapid, longMoveAxe, machinePos)
+			return
+
+		self._moveTo(machinePos)
+		island = islands[-1]
+		if leadIn and not island.calls:
+			island.start = island.end = tuple(pos[:2])
+			return
+
+		island.calls.append(('straightMotion', (rapid, longMoveAxe, machinePos)))
+		island.extend(pos[0], pos[1])
+		island.end = tuple(pos[:2])
+
+	def straightMotionBatch(self, rapid, longMoveAxe, machinePos):
+		for args in zip(rapid, longMoveAxe, machinePos):
+			self.straightMotion(*args)
+
+	def circleMotion(self, x, y, p):
+		islands = self._islands
+		pos = self._position
+		if not islands:
+			self._target.circleMotion(x, y, p)
+		else:
+			island = islands[-1]
+			island.calls.append(('circleMotion', (x, y, p)))
+			island.extend(pos[0] + x, pos[1] + y, math.hypot(x, y))
+
+		if pos[0] != None and pos[1] != None:
+			pos[:2] = arcEnd(pos, x, y, p)
+			if islands:
+				islands[-1].end = tuple(pos[:2])
+
+	def setFeedRate(self, fr):
+		self.__dict__['_feed'] = fr
+		if self._islands:
+			self._islands[-1].calls.append(('setFeedRate', (fr, )))
+		else:
+			self._target.setFeedRate(fr)
+
+	def flush(self):
+		"""cut the contours held back"""
+		islands = self._islands
+		if not islands:
+			return
+
+		order = self._order()
+		position = self._entry
+		before = self._travel(position, islands)
+		after = self._travel(position, [ islands[k] for k in order ])
+		if after >= before:
+			# nearest neighbour can do worse than the program
+			order, after = range(len(islands)), before
+		self.rapidTravel[0] += before / 1000.
+		self.rapidTravel[1] += after / 1000.
+
+		feed = islands[0].feed
+		for k in order:
+			island = islands[k]
+			if island.feed != feed and island.feed != None:
+				self._target.setFeedRate(island.feed)
+
+			dx = abs(island.start[0] - position[0])
+			dy = abs(island.start[1] - position[1])
+			if dx or dy:
+				self._target.straightMotion(True, 0 if dx >= dy else 1, [
+					island.start[0] if dx else None, island.start[1] if dy else None, None ])
+
+			feed = island.feed
+			for name, args in island.calls:
+				getattr(self._target, name)(*args)
+				if name == 'setFeedRate':
+					feed = args[0]
+			position = island.end
+
+		del islands[:]
+
+	def _order(self):
+		# nearest neighbour order of the contours, taking the overlaps
+		# into account; the last contour stays last
+		islands = self._islands
+		n = len(islands)
+		before = [ set([ i for i in xrange(j) if islands[i].overlaps(islands[j]) ]) for j in xrange(n - 1) ]
+
+		order = [ ]
+		done = set()
+		x, y = self._entry
+		while len(order) < n - 1:
+			best = None
+			for j in xrange(n - 1):
+				if j in done or not before[j] <= done:
+					continue
+				d = math.hypot(islands[j].start[0] - x, islands[j].start[1] - y)
+				if best == None or d < bestDist:
+					best, bestDist = j, d
+			order.append(best)
+			done.add(best)
+			x, y = islands[best].end
+		return order + [ n - 1 ]
+
+	def _travel(self, position, islands):
+		length = 0
+		for island in islands:
+			length += math.hypot(island.start[0] - position[0], island.start[1] - position[1])
+			position = island.end
+		return length
+
+	def _pass(self, rapid, longMoveAxe, machinePos):
+		self._target.straightMotion(rapid, longMoveAxe, machinePos)
+		self._moveTo(machinePos)
+
+	def _moveTo(self, machinePos):
+		for i in xrange(3):
+			if machinePos[i] != None:
+				self._position[i] = machinePos[i]
@@ -0,0 +1,119 @@
+import os
+import errno
+import marshal
+import hashlib
+import tempfile
+
+from Converters import GCode
+
+def defaultDirectory():
+	base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+	return os.path.join(base, 'pypc-nc')
+
+class ParseCache:
+	"""on-disk cache of parsed programs
+
+	entries are keyed by the content hash of the program file plus the
+	parser version and hold the parser's lines, pre-tokenized blocks and
+	sequence numbers in marshal format.  The least recently used entries
+	are evicted once the cache grows beyond maxSize bytes."""
+
+	def __init__(self, directory = None, maxSize = 256 * 1024 * 1024):
+		self._directory = directory or defaultDirectory()
+		self._maxSize = maxSize
+		self.hits = 0
+		self.misses = 0
+
+	def directory(self):
+		return self._directory
+
+	def key(self, fname):
+		h = hashlib.sha1()
+		with open(fname, 'rb') as f:
+			while True:
+				chunk = f.read(1024 * 1024)
+				if not chunk: break
+				h.update(chunk)
+		return '%s-%d' % (h.hexdigest(), GCode.PARSER_VERSION)
+
+	def _path(self, key):
+		return os.path.join(self._directory, key + '.parsed')
+
+	def parseFile(self, fname, parser = None):
+		"""parse fname into parser (a new GCodeParser by default),
+		using the cached result if there is one"""
+		if parser == None:
+			parser = GCode.GCodeParser()
+
+		key = self.key(fname)
+		if self.load(key, parser):
+			self.hits += 1
+			return parser
+
+		self.misses += 1
+		parser.parseFile(fname)
+
+		# caching is best effort, e.g. the cache directory may not be writable
+		try:
+			self.store(key, parser)
+		except (IOError, OSError):
+			pass
+		return parser
+
+	def load(self, key, parser):
+		path = self._path(key)
+
+		try:
+			with open(path, 'rb') as f:
+				data = marshal.load(f)
+		except (IOError, EOFError, ValueError, TypeError):
+			return False
+
+		parser.loadParsed(data)
+
+		# mark entry as recently used
+		try:
+			os.utime(path, None)
+		except OSError:
+			pass
+		return True
+
+	def store(self, key, parser):
+		try:
+			os.makedirs(self._directory)
+		except OSError as e:
+			if e.errno != errno.EEXIST: raise
+
+		fd, tmp = tempfile.mkstemp(dir = self._directory, suffix = '.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				marshal.dump(parser.dumpParsed(), f)
+			os.rename(tmp, self._path(key))
+		except:
+			os.unlink(tmp)
+			raise
+
+		self.evict()
+
+	def evict(self):
+		entries = []
+		total = 0
+
+		for name in os.listdir(self._directory):
+			if not name.endswith('.parsed'): continue
+			path = os.path.join(self._directory, name)
+			try:
+				st = os.stat(path)
+			except OSError:
+				continue
+			entries.append((st.st_mtime, st.st_size, path))
+			total += st.st_size
+
+		entries.sort()
+		for mtime, size, path in entries:
+			if total <= self._maxSize: break
+			try:
+				os.unlink(path)
+			except OSError:
+				continue
+			total -= size
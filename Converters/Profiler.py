@@ -0,0 +1,82 @@
+"""per instruction profiling of the interpreter
+
+attaching a Profiler replaces the handlers, some internal methods and the
+target of an interpreter by timing wrappers, interpreters without one run
+unchanged"""
+import timeit
+
+# interpreter methods timed besides the handlers
+methods = [ 'substituteParameters', '_processOWord', '_straightMotion', '_straightMotionRun',
+	    '_circleMotion', '_arcRun', '_segmentedArc', '_processCannedCycle', '_drillRun' ]
+
+class _Entry:
+	def __init__(self):
+		self.calls = 0
+		self.seconds = 0.
+		self.commands = 0
+
+class _TargetProxy:
+	# times the calls to the target
+	def __init__(self, profiler, target):
+		self.__dict__['_profiler'] = profiler
+		self.__dict__['_target'] = target
+
+	def __getattr__(self, name):
+		value = getattr(self.__dict__['_target'], name)
+		if callable(value):
+			value = self._profiler.wrap('target.' + name, value)
+		return value
+
+	def __setattr__(self, name, value):
+		setattr(self.__dict__['_target'], name, value)
+
+class Profiler:
+	"""call counts, cumulative time and emitted commands (the growth of
+	the target's buffer) of the handlers of G, M etc. codes, of the
+	interpreter methods listed in methods and of the target calls
+
+	times are cumulative, nested calls (e.g. straight moves of canned
+	cycles) count for both.  Commands held back by stages of the target
+	count for the call during which they are emitted"""
+	def __init__(self):
+		self.entries = { }
+		self._buffer = lambda: None
+
+	def attach(self, inter):
+		"""time the given interpreter"""
+		for code, handler in inter.handlers.items():
+			inter.handlers[code] = self.wrap(code, handler)
+		for name in methods:
+			setattr(inter, name, self.wrap(name, getattr(inter, name)))
+
+		target = inter.target
+		inter.target = _TargetProxy(self, target)
+		self._buffer = lambda: getattr(target, 'buffer', None)
+
+	def wrap(self, name, f):
+		"""f counting for the entry name"""
+		entry = self.entries.get(name)
+		if entry == None:
+			entry = self.entries[name] = _Entry()
+		timer = timeit.default_timer
+
+		def timed(*args):
+			buffer = self._buffer()
+			size = len(buffer) if buffer != None else 0
+			start = timer()
+			try:
+				return f(*args)
+			finally:
+				entry.seconds += timer() - start
+				entry.calls += 1
+				if buffer != None:
+					entry.commands += len(buffer) - size
+		return timed
+
+	def report(self):
+		"""(name, calls, seconds, commands) of the entries called, most
+		time consuming first"""
+		rows = [ (name, e.calls, e.seconds, e.commands)
+			 for name, e in self.entries.iteritems() if e.calls ]
+		rows.sort(key = lambda row: (-row[2], row[0]))
+		return rows
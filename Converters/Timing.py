@@ -0,0 +1,164 @@
+"""machining time estimation
+
+the estimator takes the place of the target of the interpreter (like the
+stages of Optimizers) and models the moves the controller executes with
+the speeds and ramps of its programmed motion setup"""
+import math
+
+from Converters import CNCCon, GCode, Optimizers
+
+def parseSetup(commands):
+	"""speed (#G) and ramp (#E) settings of a list of setup commands as
+	dicts from the setting number to its list of values"""
+	speeds = { }
+	ramps = { }
+	for command in commands:
+		if command[:2] in ('#G', '#E'):
+			fields = command[2:].split(',')
+			settings = speeds if command[1] == 'G' else ramps
+			settings[int(fields[0])] = [ int(x) for x in fields[1:] ]
+	return speeds, ramps
+
+def rampTime(distance, startSpeed, speed, acceleration):
+	"""time (s) of a move of distance starting and ending at startSpeed,
+	accelerating to speed where the distance allows (trapezoidal profile,
+	machine units)"""
+	if distance <= 0:
+		return 0.
+	if speed <= startSpeed or acceleration <= 0:
+		return distance / float(max(speed, startSpeed))
+
+	rampDistance = (speed * speed - startSpeed * startSpeed) / (2. * acceleration)
+	if 2 * rampDistance <= distance:
+		return 2. * (speed - startSpeed) / acceleration + (distance - 2 * rampDistance) / speed
+
+	peak = math.sqrt(startSpeed * startSpeed + acceleration * distance)
+	return 2. * (peak - startSpeed) / acceleration
+
+class TimeEstimator:
+	"""estimates the time the controller takes for the program
+
+	every move starts and ends at the start speed of the axes (the
+	controller doesn't blend moves) and accelerates to its speed within
+	the distance available: rapid moves (V1..V3) to the rapid speed of
+	their long axis with the rapid ramp, feed moves (V21, K21) to the
+	feed rate, times feedRateOverride percent, with the feed ramp.  The
+	setup is read as #G1..#G3 rapid speeds and #G4..#G6 start speeds of
+	X, Y and Z (um/s), #E41 and #E21 the rapid and feed ramp (um/s^2,
+	the second value isn't modelled).  The machine is assumed to start
+	at the origin, dwells and tool changes take no time.
+
+	calls are passed on to target (if any).  total(), rapidTime
+	and feedTime are in seconds, toolTimes and blockTimes by tool and
+	block number of the source (see setSource), if any.  Moves held back
+	by stages between the interpreter and the estimator or batched by the
+	interpreter may count for a later block"""
+	def __init__(self, target = None, setup = CNCCon.motionSetup):
+		speeds, ramps = parseSetup(setup)
+		d = self.__dict__
+		d['_target'] = target or GCode.NullTarget()
+		d['rapidSpeed'] = [ speeds.get(k, [ 0 ])[0] for k in (1, 2, 3) ]
+		d['startSpeed'] = [ speeds.get(k, [ 0 ])[0] for k in (4, 5, 6) ]
+		d['rapidAcceleration'] = ramps.get(41, [ 0 ])[0]
+		d['feedAcceleration'] = ramps.get(21, [ 0 ])[0]
+		d['feedRateOverride'] = 100
+		d['rapidTime'] = 0.
+		d['feedTime'] = 0.
+		d['toolTimes'] = { }
+		d['blockTimes'] = { }
+		d['_source'] = None
+		d['_feedRate'] = 0
+		d['_position'] = [ 0, 0, 0 ]
+
+	def __getattr__(self, name):
+		return getattr(self.__dict__['_target'], name)
+
+	def __setattr__(self, name, value):
+		if name in self.__dict__:
+			self.__dict__[name] = value
+		else:
+			setattr(self.__dict__['_target'], name, value)
+
+	def setSource(self, source):
+		"""attribute the times to currentBlock and currentTool of source
+		(the interpreter)"""
+		self.__dict__['_source'] = source
+
+	def total(self):
+		return self.rapidTime + self.feedTime
+
+	def setFeedRate(self, fr):
+		self.__dict__['_feedRate'] = fr
+		self._target.setFeedRate(fr)
+
+	def straightMotion(self, rapid, longMoveAxe, machinePos):
+		self._straightMotion(rapid, longMoveAxe, machinePos)
+		self._target.straightMotion(rapid, longMoveAxe, machinePos)
+
+	def straightMotionBatch(self, rapid, longMoveAxe, machinePos):
+		for args in zip(rapid, longMoveAxe, machinePos):
+			self._straightMotion(*args)
+
+		batch = getattr(self._target, 'straightMotionBatch', None)
+		if batch:
+			batch(rapid, longMoveAxe, machinePos)
+		else:
+			for args in zip(rapid, longMoveAxe, machinePos):
+				self._target.straightMotion(*args)
+
+	def circleMotion(self, x, y, p):
+		pos = self._position
+		self._feedMove(math.hypot(x, y) * abs(p) / 1000000., [ 0, 1 ])
+		pos[:2] = Optimizers.arcEnd(pos, x, y, p)
+		self._target.circleMotion(x, y, p)
+
+	def _straightMotion(self, rapid, longMoveAxe, machinePos):
+		pos = self._position
+		delta = [ abs(machinePos[i] - pos[i]) if machinePos[i] != None else 0 for i in xrange(3) ]
+		for i in xrange(3):
+			if machinePos[i] != None:
+				pos[i] = machinePos[i]
+
+		if rapid:
+			# the long axis runs at its rapid speed, the others follow
+			self._add(True, rampTime(delta[longMoveAxe], self.startSpeed[longMoveAxe],
+						 self.rapidSpeed[longMoveAxe], self.rapidAcceleration))
+		else:
+			axes = [ i for i in xrange(3) if delta[i] ] or [ 0 ]
+			self._feedMove(math.sqrt(sum([ x * x for x in delta ])), axes)
+
+	def _feedMove(self, distance, axes):
+		speed = self._feedRate * self.feedRateOverride / 100.
+		if speed <= 0:
+			return	# no feed rate set yet
+		startSpeed = min([ self.startSpeed[i] for i in axes ])
+		self._add(False, rampTime(distance, min(startSpeed, speed), speed, self.feedAcceleration))
+
+	def _add(self, rapid, t):
+		d = self.__dict__
+		if rapid:
+			d['rapidTime'] += t
+		else:
+			d['feedTime'] += t
+
+		source = self._source
+		if source != None and t:
+			self.toolTimes[source.currentTool] = self.toolTimes.get(source.currentTool, 0.) + t
+			self.blockTimes[source.currentBlock] = self.blockTimes.get(source.currentBlock, 0.) + t
+
+def estimateProgram(parser, invertZ = False, feedRateOverride = 100, setup = CNCCon.motionSetup):
+	"""estimate the time of a parsed program, running it to its end (tool
+	changes included).  Returns the TimeEstimator"""
+	estimator = TimeEstimator(None, setup)
+	estimator.feedRateOverride = feedRateOverride
+	inter = GCode.GCodeInterpreter(estimator)
+	inter.invertZ = invertZ
+	estimator.setSource(inter)
+
+	inter.runAll(parser)
+	return estimator
+
+def formatTime(seconds):
+	"""seconds as h:mm:ss"""
+	seconds = int(round(seconds))
+	return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
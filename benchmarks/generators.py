@@ -0,0 +1,136 @@
+"""deterministic generators of synthetic G-Code workloads
+
+every generator takes a size (roughly the number of blocks to generate)
+and a seed, and returns the program as a string; the same arguments
+always yield the same program"""
+import math
+import random
+
+def _program(blocks):
+	return '%\n' + '\n'.join(blocks) + '\nM5 M9\nM30\n%\n'
+
+def surfacing(size, seed = 1):
+	"""dense 3D surfacing: zig-zag raster of short G1 moves over a
+	smooth height field, as exported by CAM software for finishing"""
+	rnd = random.Random(seed)
+	a, b = rnd.uniform(0.05, 0.2), rnd.uniform(0.05, 0.2)
+
+	blocks = [ '(surfacing)', 'G17 G21 G90 G64 P0.01', 'M3 S18000 M7', 'G0 Z5', 'G0 X0 Y0', 'G1 Z0 F300', 'F1200' ]
+	columns = 200
+	rows = max(1, size // columns)
+
+	for row in xrange(rows):
+		y = row * 0.25
+		for col in xrange(columns):
+			x = (col if row % 2 == 0 else columns - 1 - col) * 0.25
+			z = -2 + math.sin(x * a) * math.cos(y * b) + rnd.uniform(-0.005, 0.005)
+			if col == 0:
+				blocks.append('N%d G1 X%.4f Y%.4f Z%.4f' % (len(blocks) * 10, x, y, z))
+			else:
+				blocks.append('X%.4f Z%.4f' % (x, z))
+
+	blocks.append('G0 Z5')
+	return _program(blocks)
+
+def engraving(size, seed = 2):
+	"""arc-heavy engraving: chains of G2/G3 arcs in both R and I/J form,
+	separated by short plunges and rapid moves"""
+	rnd = random.Random(seed)
+
+	blocks = [ '(engraving)', 'G17 G21 G90', 'M3 S12000', 'G0 Z2', 'F400' ]
+	x, y = 0.0, 0.0
+
+	while len(blocks) < size:
+		x, y = round(rnd.uniform(0, 100), 4), round(rnd.uniform(0, 100), 4)
+		blocks.append('G0 X%.4f Y%.4f' % (x, y))
+		blocks.append('G1 Z-0.2')
+
+		for i in xrange(rnd.randint(5, 30)):
+			radius = rnd.uniform(0.5, 10)
+			# clear of the acos domain bounds the interpreter used to
+			# be sensitive to, kept for comparable results
+			start = rnd.uniform(0.1, math.pi - 0.1) + rnd.choice([ 0, math.pi ])
+			sweep = rnd.uniform(0.2, 2.5)
+			cw = rnd.random() < 0.5
+
+			# center relative to the current position
+			cx = x - radius * math.cos(start)
+			cy = y - radius * math.sin(start)
+			end = start - sweep if cw else start + sweep
+			ex = round(cx + radius * math.cos(end), 4)
+			ey = round(cy + radius * math.sin(end), 4)
+			if abs(ex - x) < 0.001: continue
+
+			if rnd.random() < 0.5:
+				blocks.append('G%d X%.4f Y%.4f I%.4f J%.4f' % (2 if cw else 3, ex, ey, cx - x, cy - y))
+			else:
+				blocks.append('G%d X%.4f Y%.4f R%.4f' % (2 if cw else 3, ex, ey, radius if sweep < math.pi else -radius))
+
+			x, y = ex, ey
+
+		blocks.append('G0 Z2')
+
+	return _program(blocks)
+
+def drilling(size, seed = 3):
+	"""large drill grids alternating G81 and G83 (peck) cycles with both
+	retract modes"""
+	rnd = random.Random(seed)
+
+	blocks = [ '(drilling)', 'G17 G21 G90', 'M3 S6000 M7', 'G0 Z10', 'F150' ]
+	grid = 0
+
+	while len(blocks) < size:
+		columns, rows = rnd.randint(5, 40), rnd.randint(5, 40)
+		pitch = rnd.choice([ 2.54, 5, 8, 10 ])
+		originX, originY = rnd.uniform(0, 50), rnd.uniform(0, 50)
+
+		blocks.append('G%d' % (98 if grid % 2 else 99))
+		if grid % 3 == 2:
+			# Q isn't modal (and not accepted without G83), so peck
+			# cycles are repeated for every hole
+			cycle = 'G83 Z-%.3f R2 Q%.2f' % (rnd.uniform(3, 12), rnd.uniform(0.5, 2))
+		else:
+			cycle = 'G81 Z-%.3f R2' % rnd.uniform(1, 5)
+
+		for row in xrange(rows):
+			for col in xrange(columns):
+				if row % 2: col = columns - 1 - col
+				pos = 'X%.3f Y%.3f' % (originX + col * pitch, originY + row * pitch)
+				if (row == 0 and col == 0) or cycle[:3] == 'G83':
+					blocks.append('%s %s' % (cycle, pos))
+				else:
+					blocks.append(pos)
+
+		blocks.append('G80')
+		blocks.append('G0 Z10')
+		grid += 1
+
+	return _program(blocks)
+
+def parametric(size, seed = 4):
+	"""parameter-heavy program: every move is preceded by parameter
+	assignments and refers to its coordinates through parameters"""
+	rnd = random.Random(seed)
+
+	blocks = [ '(parametric)', 'G17 G21 G90', 'M3 S9000', '#100=-1.5', '#101=5', 'G0 Z#101', 'F800' ]
+
+	while len(blocks) < size:
+		blocks.append('#110=%.4f' % rnd.uniform(0, 200))
+		blocks.append('#111=%.4f' % rnd.uniform(0, 200))
+		blocks.append('G0 X#110 Y#111')
+		blocks.append('G1 Z#100')
+		for i in xrange(rnd.randint(1, 10)):
+			blocks.append('#112=%.4f' % rnd.uniform(0, 200))
+			blocks.append('#113=%.4f' % rnd.uniform(0, 200))
+			blocks.append('G1 X#112 Y#113')
+		blocks.append('G0 Z#101')
+
+	return _program(blocks)
+
+workloads = {
+	'surfacing': surfacing,
+	'engraving': engraving,
+	'drilling': drilling,
+	'parametric': parametric,
+}
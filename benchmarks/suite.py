@@ -0,0 +1,216 @@
+"""timing of the conversion stages on the synthetic workloads
+
+every stage is set up and run in forked child processes, so the peak
+memory reported (growth of the maximum resident set size while the stage
+is running) isn't distorted by earlier stages or the setup.  The interpreter is timed
+against a target discarding all output; the writer, filter chain and
+scene renderer are fed from a recording of the target calls made by
+the interpreter, so each stage is timed on its own"""
+import os
+import sys
+import time
+import json
+import marshal
+import platform
+import resource
+
+from Converters import GCode, CNCCon, Filters
+from benchmarks import generators
+
+class Recorder:
+	"""interpreter target recording all calls for later replay"""
+	axes = GCode.NullTarget.axes
+
+	def __init__(self):
+		self.calls = [ ]
+
+		for name in dir(GCode.NullTarget):
+			if name[0] != '_' and name != 'axes':
+				setattr(self, name, self._recorder(name))
+
+	def _recorder(self, name):
+		def record(*args):
+			self.calls.append((name, args))
+		return record
+
+def _copyCalls(calls):
+	# filters modify the position lists passed in
+	return [ (name, tuple([ list(x) if x.__class__ is list else x for x in args ]))
+		 for name, args in calls ]
+
+def _replay(calls, target):
+	for name, args in calls:
+		getattr(target, name)(*args)
+
+def _parse(program):
+	parser = GCode.GCodeParser()
+	parser.parseString(program)
+	return parser
+
+def _interpret(parser, target):
+	inter = GCode.GCodeInterpreter(target)
+	inter.run(parser)
+
+	# pause at tool changes, continue like the operator would
+	while not inter.end:
+		inter.resume(parser)
+	return target
+
+def _record(program):
+	return _interpret(_parse(program), Recorder()).calls
+
+def _filterChain(writer):
+	return Filters.FilterChain([
+		Filters.OffsetFilter([ -10, -20 ]),
+		Filters.PolarFixer(1.001, 0.002),
+		Filters.OffsetFilter([ 5, 5, 5 ]) ], writer)
+
+def _sceneRenderer():
+	from PySide import QtGui
+	from Control.GraphicsView import SceneRenderer
+
+	if not QtGui.QApplication.instance():
+		QtGui.QApplication([ ])
+
+	renderer = SceneRenderer(QtGui.QGraphicsScene())
+	renderer._inter = GCode.GCodeInterpreter(renderer)
+	return renderer
+
+def setupParser(program):
+	return lambda: _parse(program)
+
+def setupInterpreter(program):
+	parser = _parse(program)
+	return lambda: _interpret(parser, GCode.NullTarget())
+
+def setupWriter(program):
+	calls = _copyCalls(_record(program))
+	return lambda: _replay(calls, CNCCon.CNCConWriter())
+
+def setupFilters(program):
+	calls = _copyCalls(_record(program))
+	return lambda: _replay(calls, _filterChain(GCode.NullTarget()))
+
+def setupRenderer(program):
+	calls = _copyCalls(_record(program))
+	renderer = _sceneRenderer()
+	return lambda: _replay(calls, renderer)
+
+stages = [
+	('parser', setupParser),
+	('interpreter', setupInterpreter),
+	('writer', setupWriter),
+	('filters', setupFilters),
+	('renderer', setupRenderer),
+]
+
+def _maxRSS():
+	# kilobytes on Linux
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _inChild(func):
+	# run func in a forked process and return its (marshallable) result
+	r, w = os.pipe()
+	pid = os.fork()
+
+	if pid == 0:
+		os.close(r)
+		try:
+			result = func()
+		except Exception, e:
+			result = { 'error': '%s: %s' % (e.__class__.__name__, e) }
+		os.write(w, marshal.dumps(result))
+		os._exit(0)
+
+	os.close(w)
+	data = ''
+	while True:
+		chunk = os.read(r, 4096)
+		if not chunk: break
+		data += chunk
+	os.close(r)
+	os.waitpid(pid, 0)
+
+	if not data:
+		return { 'error': 'child process died' }
+	return marshal.loads(data)
+
+def _time(run, repeat):
+	# the maximum resident set size of a fresh child starts out at its
+	# current size, so the memory needed by the setup doesn't count
+	rss = _maxRSS()
+	times = [ ]
+	for i in xrange(repeat):
+		start = time.time()
+		run()
+		times.append(time.time() - start)
+
+		# keep the results of one run from counting towards the next
+		if i == 0: peak = _maxRSS() - rss
+
+	return { 'seconds': min(times), 'peakMemoryKB': peak }
+
+def _measure(setup, program, repeat):
+	try:
+		run = setup(program)
+	except ImportError, e:
+		return { 'skipped': str(e) }
+
+	return _inChild(lambda: _time(run, repeat))
+
+def measure(setup, program, repeat = 3):
+	"""run a stage in a child process, returns a dict with the best time
+	in seconds and the peak memory growth in kilobytes (or the reason
+	it has been skipped)"""
+	return _inChild(lambda: _measure(setup, program, repeat))
+
+def run(size = 100000, repeat = 3, workloads = None, stageNames = None, log = None):
+	"""run the benchmarks and return the results, a dict to be saved
+	with save.  If given, log is called with (workload, stage, result)
+	as results come in"""
+	results = { }
+
+	for name in sorted(workloads or generators.workloads):
+		program = generators.workloads[name](size)
+		blocks = len(_parse(program).blocks)
+		results[name] = { 'blocks': blocks, 'bytes': len(program), 'stages': { } }
+
+		for stage, setup in stages:
+			if stageNames and not stage in stageNames: continue
+
+			result = measure(setup, program, repeat)
+			if 'seconds' in result:
+				result['blocksPerSecond'] = blocks / max(result['seconds'], 1e-9)
+			results[name]['stages'][stage] = result
+			if log: log(name, stage, result)
+
+	return {
+		'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'size': size,
+		'repeat': repeat,
+		'workloads': results,
+	}
+
+def save(results, fname):
+	with open(fname, 'w') as f:
+		json.dump(results, f, indent = 1, sort_keys = True)
+
+def load(fname):
+	with open(fname) as f:
+		return json.load(f)
+
+def compare(old, new):
+	"""return (workload, stage, old seconds, new seconds) for all stages
+	measured in both runs"""
+	rows = [ ]
+	for name in sorted(new['workloads']):
+		if not name in old['workloads']: continue
+
+		for stage, setup in stages:
+			a = old['workloads'][name]['stages'].get(stage, { })
+			b = new['workloads'][name]['stages'].get(stage, { })
+			if 'seconds' in a and 'seconds' in b:
+				rows.append((name, stage, a['seconds'], b['seconds']))
+	return rows
@@ -296,6 +296,11 @@
         <source>Run</source>
         <translation>Start</translation>
     </message>
+    <message>
+        <location filename="ui/MainWindow.py" line="410"/>
+        <source>Run from ...</source>
+        <translation>Start ab ...</translation>
+    </message>
     <message>
         <location filename="ui/MainWindow.py" line="410"/>
         <source>Graphics View ...</source>
@@ -0,0 +1,79 @@
+import unittest
+from Converters import GCode, CNCCon, Analysis
+
+class TestAnalyzer(unittest.TestCase):
+	program = '\n'.join([ 'G21 G90 G0 Z5', 'T1 M6', 'M3 S1000', 'G0 X10 Y10', 'G1 Z-1 F300',
+			      'G1 X20', 'G2 X30 Y10 I5 J0 F600', 'G0 Z5', 'T2 M6', 'G0 X0 Y0',
+			      'G1 Z-2 F100', 'G0 Z5', 'M30' ])
+
+	def analyze(self, program = None, **kwargs):
+		parser = GCode.GCodeParser()
+		parser.parseString(program or self.program)
+		return parser, Analysis.analyzeProgram(parser, **kwargs)
+
+	def test_summary(self):
+		parser, a = self.analyze()
+		self.assertEqual(a.box[0][0], 0)
+		self.assertAlmostEqual(a.box[0][1], 30)
+		self.assertEqual(a.box[1][0], 0)
+		self.assertAlmostEqual(a.box[1][1], 15)
+		self.assertEqual(a.box[2], (-2, 5))
+		self.assertAlmostEqual(a.cutLength, 6 + 10 + 5 * 3.14159265 + 7, 4)
+		self.assertAlmostEqual(a.rapidLength, 5 + 10 * 2 ** .5 + 6 + 1000 ** .5 + 7)
+		self.assertEqual(a.feedRange, (100, 600))
+		self.assertEqual(a.tools, [ 1, 2 ])
+		self.assertEqual(a.codes[ 'G0' ], 5)
+		self.assertEqual(a.codes[ 'M6' ], 2)
+		self.assertEqual(a.codes[ 'G2' ], 1)
+		self.assertEqual(a.violations, 0)
+
+	def test_batchCodes(self):
+		# runs of moves and arcs handled by NumPy count like single blocks
+		lines = [ 'G21 G90 G0 Z5', 'G1 Z-1 F300' ]
+		lines += [ 'G1 X%d Y%d' % (k, k % 2) for k in xrange(41) ]
+		lines += [ 'G2 X%d Y0 I1 J0' % (k * 2 + 42) for k in xrange(40) ]
+		lines += [ 'G0 Z5', 'M30' ]
+		program = '\n'.join(lines)
+
+		parser = GCode.GCodeParser()
+		parser.parseString(program)
+		scalar = Analysis.analyzeProgram(parser)
+
+		batch = Analysis.Analyzer()
+		inter = GCode.GCodeInterpreter(batch)
+		inter.batchMotion = True
+		batch.attach(inter)
+		inter.runAll(parser)
+
+		self.assertEqual(batch.codes, scalar.codes)
+		self.assertEqual(batch.codes[ 'G1' ], 42)
+		self.assertEqual(batch.codes[ 'G2' ], 40)
+
+	def test_travel(self):
+		parser, a = self.analyze(travel = Analysis.parseTravel('X0:100, Y0:12,Z-1.5:10'))
+		self.assertEqual(a.violations, 2)
+		self.assertEqual([ (axis, block) for axis, value, block in a.firstViolations ], [ ('Y', 6), ('Z', 10) ])
+		self.assertAlmostEqual(a.firstViolations[0][1], 15)
+
+	def test_startPosition(self):
+		# the first cut runs along Y0 and Z0, where the program starts
+		parser, a = self.analyze('G21 G90 G1 X10 F100\nG1 Y5\nG1 X2\nM30',
+					 travel = Analysis.parseTravel('Y1:10,Z-5:-1'))
+		self.assertEqual(a.box, [ (0, 10), (0, 5), (0, 0) ])
+		self.assertEqual([ (axis, value) for axis, value, block in a.firstViolations ], [ ('Y', 0), ('Z', 0) ])
+
+	def test_parseTravel(self):
+		self.assertEqual(Analysis.parseTravel('z-80:0,X0:400'), [ (0, 400), None, (-80, 0) ])
+		self.assertRaises(ValueError, Analysis.parseTravel, 'A0:10')
+		self.assertRaises(ValueError, Analysis.parseTravel, 'X10')
+
+	def test_passesOn(self):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		writer = CNCCon.CNCConWriter()
+		i = GCode.GCodeInterpreter(Analysis.Analyzer(writer))
+		i.run(parser)
+
+		plain = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		plain.run(parser)
+		self.assertEqual(writer.buffer, plain.target.buffer)
@@ -0,0 +1,37 @@
+import unittest
+from Converters import GCode, CNCCon
+from benchmarks import generators, suite
+
+class TestGenerators(unittest.TestCase):
+	def test_deterministic(self):
+		for name, generate in generators.workloads.items():
+			self.assertEqual(generate(500), generate(500))
+			self.assertNotEqual(generate(500), generate(500, seed = 42))
+
+	def test_programsRun(self):
+		for name, generate in generators.workloads.items():
+			parser = GCode.GCodeParser()
+			parser.parseString(generate(2000))
+			self.assertTrue(len(parser.blocks) >= 2000)
+
+			inter = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+			inter.run(parser)
+			while not inter.end:
+				inter.resume(parser)
+
+class TestSuite(unittest.TestCase):
+	def test_replayMatchesWriter(self):
+		program = generators.engraving(300)
+		parser = GCode.GCodeParser()
+		parser.parseString(program)
+		inter = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		inter.run(parser)
+
+		writer = CNCCon.CNCConWriter()
+		suite._replay(suite._record(program), writer)
+		self.assertEqual(writer.buffer, inter.target.buffer)
+
+	def test_measure(self):
+		result = suite.measure(suite.setupParser, generators.surfacing(300), 1)
+		self.assertTrue(result['seconds'] > 0)
+		self.assertTrue(result['peakMemoryKB'] >= 0)
@@ -0,0 +1,75 @@
+import unittest
+from Converters import Expressions
+
+class TestExpressions(unittest.TestCase):
+	parameters = { 1: 2.0, 2: 30.0, 100: 0.002 }
+
+	def eval(self, expr):
+		return Expressions.compileExpression(expr)(self.parameters)
+
+	def test_literals(self):
+		self.assertEqual(self.eval('1'), 1.0)
+		self.assertEqual(self.eval('-1.5'), -1.5)
+		self.assertEqual(self.eval('.5'), .5)
+
+	def test_precedence(self):
+		self.assertEqual(self.eval('[1 + 2 * 3]'), 7.0)
+		self.assertEqual(self.eval('[[1 + 2] * 3]'), 9.0)
+		self.assertEqual(self.eval('[2 * 3 ** 2]'), 18.0)
+		self.assertEqual(self.eval('[10 - 4 - 3]'), 3.0)
+		self.assertEqual(self.eval('[1 + 1 EQ 2]'), 1.0)
+		self.assertEqual(self.eval('[1 LT 2 AND 3 LT 2]'), 0.0)
+
+	def test_parameters(self):
+		self.assertEqual(self.eval('#1'), 2.0)
+		self.assertEqual(self.eval('##1'), 30.0)
+		self.assertEqual(self.eval('#[#1 * 50]'), 0.002)
+		self.assertEqual(self.eval('-#1'), -2.0)
+		self.assertEqual(self.eval('#5'), 0.0)
+
+	def test_functions(self):
+		self.assertAlmostEqual(self.eval('SIN[#2]'), 0.5)
+		self.assertAlmostEqual(self.eval('cos[60]'), 0.5)
+		self.assertEqual(self.eval('ATAN[1]/[1]'), 45.0)
+		self.assertEqual(self.eval('SQRT[16]'), 4.0)
+		self.assertEqual(self.eval('FIX[-1.5]'), -2.0)
+		self.assertEqual(self.eval('FUP[1.2]'), 2.0)
+		self.assertEqual(self.eval('ROUND[2.5]'), 3.0)
+		self.assertEqual(self.eval('ROUND[-2.5]'), -3.0)
+		self.assertEqual(self.eval('ABS[-2]'), 2.0)
+
+	def test_mod(self):
+		self.assertEqual(self.eval('[7 MOD 3]'), 1.0)
+		self.assertEqual(self.eval('[-7 MOD 3]'), 2.0)
+
+	def test_errors(self):
+		for expr in ('[1 + 2', '[1 / 0]', 'SQRT[-1]', 'FOO[1]', '1 2'):
+			self.assertRaises(RuntimeError, self.eval, expr)
+
+	def test_cached(self):
+		self.assertTrue(Expressions.compileExpression('[#1 + 7]') is
+				Expressions.compileExpression('[#1 + 7]'))
+
+class TestTemplates(unittest.TestCase):
+	def test_noParameters(self):
+		self.assertEqual(Expressions.compileBlock('G0 X1 Y2'), None)
+
+	def test_substitute(self):
+		t = Expressions.compileBlock('G1X[#1*2]Y-0.5 Z#100 F100')
+		self.assertEqual(t.substitute({ 1: 2.0, 100: 0.002 }), 'G1 X4 Y-0.5 Z0.002000 F100')
+		self.assertEqual(t.substitute({ 1: 2.5 }), 'G1 X5 Y-0.5 Z0 F100')
+
+	def test_functionAfterLetter(self):
+		t = Expressions.compileBlock('G1 XSIN[90] Y-#1')
+		self.assertEqual(t.substitute({ 1: 3.0 }), 'G1 X1 Y-3')
+
+	def test_assignmentsUseOldValues(self):
+		parameters = { 1: 1.0 }
+		t = Expressions.compileBlock('#1=[#1+1] #2=#1')
+		self.assertEqual(t.words, [ ])
+		t.assign(parameters)
+		self.assertEqual(parameters, { 1: 2.0, 2: 1.0 })
+
+	def test_cached(self):
+		self.assertTrue(Expressions.compileBlock('G0 X[#1 + 7]') is
+				Expressions.compileBlock('G0 X[#1 + 7]'))
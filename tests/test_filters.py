@@ -0,0 +1,103 @@
+import math
+import unittest
+from Converters import GCode, CNCCon, Filters
+
+class MotionRecorder(GCode.NullTarget):
+	def __init__(self):
+		self.calls = [ ]
+
+	def straightMotion(self, rapid, longMoveAxe, machinePos):
+		self.calls.append((rapid, longMoveAxe, machinePos))
+
+	def setFeedRate(self, fr):
+		self.calls.append(('F', fr))
+
+class TestPolarFixer(unittest.TestCase):
+	def test_lastPosPerInstance(self):
+		a = Filters.PolarFixer(1, 0)
+		b = Filters.PolarFixer(1, 0)
+		a.straightMotion([ 5000, 7000, None ])
+		pos = b.straightMotion([ 1000, None, None ])
+		self.assertAlmostEqual(pos[0], 1000)
+		self.assertAlmostEqual(pos[1], 0)
+
+	def test_rotate(self):
+		fixer = Filters.PolarFixer(1, math.pi / 2)
+		pos = fixer.straightMotion([ 1000, 0, 5 ])
+		self.assertAlmostEqual(pos[0], 0)
+		self.assertAlmostEqual(pos[1], 1000)
+		self.assertEqual(pos[2], 5)
+
+class TestSimplifyFilter(unittest.TestCase):
+	def setUp(self, tolerance = 0.002):
+		self.filter = Filters.SimplifyFilter(tolerance, 8)
+		self.writer = MotionRecorder()
+		self.chain = Filters.FilterChain([ self.filter ], self.writer)
+		self.chain.straightMotion(True, 0, [ 0, 0, 0 ])
+
+	def test_collinear(self):
+		for k in xrange(1, 6):
+			self.chain.straightMotion(False, 0, [ k * 1000, k * 1000, None ])
+		self.chain.flush()
+
+		self.assertEqual(self.writer.calls[1:], [ (False, 0, [ 5000, 5000, None ]) ])
+		self.assertEqual(self.filter.droppedMoves, 4)
+
+	def test_subResolution(self):
+		for x in (1000, 1000, 1001, 1000, 2000):
+			self.chain.straightMotion(False, 0, [ x, None, None ])
+		self.chain.flush()
+		self.assertEqual(self.writer.calls[1:], [ (False, 0, [ 2000, None, None ]) ])
+
+	def test_corner(self):
+		for pos in ([ 1000, 0, None ], [ 2000, 0, None ], [ 2000, 1000, None ], [ 2000, 3000, None ]):
+			self.chain.straightMotion(False, 0, pos)
+		self.chain.flush()
+
+		self.assertEqual(self.writer.calls[1:], [
+			(False, 0, [ 2000, None, None ]),
+			(False, 1, [ None, 3000, None ]) ])
+
+	def test_tolerance(self):
+		self.setUp(0.05)
+		points = [ [ k * 100, int(round(1000 * math.sin(k / 10.))), -k ] for k in xrange(1, 100) ]
+		for pos in points:
+			self.chain.straightMotion(False, 0, list(pos))
+		self.chain.flush()
+
+		path = [ [ 0, 0, 0 ] ]
+		for call in self.writer.calls[1:]:
+			path.append(Filters._merge(path[-1], call[2]))
+		self.assertTrue(len(path) < len(points) / 2)
+		self.assertEqual(path[-1], points[-1])
+
+		for point in points:
+			dist = min([ Filters._segmentDistance(point, path[k], path[k + 1]) for k in xrange(len(path) - 1) ])
+			self.assertTrue(dist <= 50)
+
+	def test_boundaries(self):
+		self.chain.straightMotion(False, 0, [ 1000, None, None ])
+		self.chain.setFeedRate(300)
+		self.chain.straightMotion(False, 0, [ 2000, None, None ])
+		self.chain.straightMotion(True, 0, [ 3000, None, None ])
+		self.chain.straightMotion(False, 0, [ 4000, None, None ])
+		self.chain.flush()
+
+		self.assertEqual(self.writer.calls[1:], [
+			(False, 0, [ 1000, None, None ]),
+			('F', 300),
+			(False, 0, [ 2000, None, None ]),
+			(True, 0, [ 3000, None, None ]),
+			(False, 0, [ 4000, None, None ]) ])
+
+	def test_interpreter(self):
+		parser = GCode.GCodeParser()
+		parser.parseString('G21 G90 G0 X0 Y0 Z0\nG1 X1 F300\nG1 X2\nG1 X3\nT2 M6\nG1 X4\nG1 X5\nM30')
+		writer = CNCCon.CNCConWriter()
+		i = GCode.GCodeInterpreter(Filters.FilterChain([ Filters.SimplifyFilter(0.001) ], writer))
+		i.run(parser)
+
+		# the tool change ends the path
+		self.assertEqual([ c for c in writer.buffer if c.startswith('V21') ], [ 'V21,X3000' ])
+		i.resume(parser)
+		self.assertEqual([ c for c in writer.buffer if c.startswith('V21') ], [ 'V21,X3000', 'V21,X5000' ])
@@ -249,3 +249,86 @@ class TestDrillingCycle(unittest.TestCase):
 			# 6. a rapid move parallel to the Z-axis to (Z4.8)
 			'E', 'C10', 'W10', 'E', 'C10', 'W10', 'V3,Z5200',
 		])
+
+class HoleRecorder(GCode.NullTarget):
+	def __init__(self):
+		self.position = [ 0, 0, 0 ]
+		self.holes = [ ]
+
+	def straightMotion(self, rapid, longMoveAxe, machinePos):
+		for i in xrange(3):
+			if machinePos[i] != None:
+				self.position[i] = machinePos[i]
+		if not rapid:
+			self.holes.append(tuple(self.position))
+
+class TestDrillOrder(unittest.TestCase):
+	holes = [ (1, 1), (40, 40), (2, 1), (41, 40), (3, 1), (42, 40), (4, 1) ]
+
+	def run_(self, program, drillOrder = True):
+		parser = GCode.GCodeParser()
+		parser.parseString(program)
+		i = GCode.GCodeInterpreter(HoleRecorder())
+		i.drillOrder = drillOrder
+		i.run(parser)
+		return i
+
+	def program(self, first = 'G81 X0 Y0 Z-1 R2', lines = None):
+		lines = lines or [ 'X%d Y%d' % hole for hole in self.holes ]
+		return '\n'.join([ 'G21 G90 G0 Z5', first ] + lines + [ 'G80', 'M30' ])
+
+	def test_reorder(self):
+		a = self.run_(self.program(), False)
+		b = self.run_(self.program())
+
+		self.assertEqual(sorted(a.target.holes), sorted(b.target.holes))
+		self.assertEqual([ h[:2] for h in b.target.holes ], [ (0, 0) ] + [ (x * 1000, y * 1000) for x, y in
+			[ (1, 1), (2, 1), (3, 1), (40, 40), (41, 40), (42, 40), (4, 1) ] ])
+		self.assertEqual(a.drillTravel, [ 0, 0 ])
+		self.assertTrue(b.drillTravel[1] < b.drillTravel[0] / 2)
+
+	def test_deterministic(self):
+		a = self.run_(self.program())
+		b = self.run_(self.program())
+		self.assertEqual(a.target.holes, b.target.holes)
+
+	def test_settingsOfFirstBlock(self):
+		# R and Z of the first hole in program order apply to all holes
+		program = self.program('G0 X0 Y0', [ 'G81 X40 Y40 Z-2 R3', 'X1 Y1', 'X41 Y40', 'X2 Y1' ])
+		b = self.run_(program)
+		self.assertEqual([ h[2] for h in b.target.holes ], [ -2000 ] * 4)
+		self.assertEqual(b.target.holes[0][:2], (1000, 1000))
+
+	def test_runEndsAtChangedParameters(self):
+		program = self.program(lines = [ 'X40 Y40', 'X1 Y1', 'X41 Y40', 'X2 Y1 Z-3', 'X42 Y40', 'X3 Y1', 'X43 Y40' ])
+		b = self.run_(program)
+		a = self.run_(program, False)
+		self.assertEqual(sorted(a.target.holes), sorted(b.target.holes))
+		self.assertEqual([ h[2] for h in b.target.holes ], [ -1000 ] * 4 + [ -3000 ] * 4)
+
+	def test_repeat(self):
+		program = self.program(lines = [ 'G81 X40 Y40 L2', 'X1 Y1', 'X41 Y40', 'X2 Y1' ])
+		b = self.run_(program)
+		self.assertEqual([ h[:2] for h in b.target.holes ][1:], [ (1000, 1000), (40000, 40000), (40000, 40000), (41000, 40000), (2000, 1000) ])
+
+	def test_blocksAfterRun(self):
+		# the run ends at its last hole, incremental holes and moves not
+		# giving all axes continue from there
+		program = self.program('G83 X0 Y0 Z-1 R2 Q0.5', [ 'G83 X%d Y%d Z-1 R2 Q0.5' % hole for hole in self.holes ] + [
+			'G91 G81 X10 Y0 Z-3 R0', 'X0 Y5', 'G90 G80 G1 X60', 'G1 Y2' ])
+		a = self.run_(program, False)
+		b = self.run_(program)
+		self.assertTrue(b.drillTravel[1] < b.drillTravel[0])
+		self.assertEqual(a.target.holes[-4:], b.target.holes[-4:])
+		self.assertEqual(b.target.holes[-4:][0][:2], (14000, 1000))
+		self.assertEqual(a.position, b.position)
+
+	def test_keepsShorterProgramOrder(self):
+		program = self.program(lines = [ 'X1 Y0', 'X2 Y0', 'X3 Y0' ])
+		b = self.run_(program)
+		self.assertEqual([ h[0] for h in b.target.holes ], [ 0, 1000, 2000, 3000 ])
+		self.assertEqual(b.drillTravel[0], b.drillTravel[1])
+
+	def test_incremental(self):
+		program = '\n'.join([ 'G21 G91 G0 Z5', 'G81 X1 Y1 Z-1 R2', 'X10 Y0', 'X-9 Y0', 'X10 Y0', 'G80', 'M30' ])
+		self.assertEqual(self.run_(program).target.holes, self.run_(program, False).target.holes)
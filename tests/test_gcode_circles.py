@@ -126,73 +126,6 @@ class TestCirclesCW(unittest.TestCase):
 		])
 
 
-class TestAngleCalcCW(unittest.TestCase):
-	def test_angleCalcCW_0(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(i.angleCalcCW(1, 0), 0)
-
-	def test_angleCalcCW_4thPI(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCW(math.cos(-math.pi / 4), math.sin(-math.pi / 4)), 3), round(math.pi / 4, 3))
-
-	def test_angleCalcCW_HalfPI(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(i.angleCalcCW(math.cos(-math.pi / 2), math.sin(-math.pi / 2)), math.pi / 2)
-
-	def test_angleCalcCW_4thPI3(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCW(math.cos(math.pi / 4 * 5), math.sin(math.pi / 4 * 5)), 3), round(math.pi / 4 * 3, 3))
-
-	def test_angleCalcCW_PI(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCW(math.cos(math.pi), math.sin(math.pi)), 3), round(math.pi, 3))
-
-	def test_angleCalcCW_4thPI5(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCW(math.cos(math.pi / 4 * 3), math.sin(math.pi / 4 * 3)), 3), round(math.pi / 4 * 5, 3))
-
-	def test_angleCalcCW_HalfPI3(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(i.angleCalcCW(math.cos(math.pi / 2), math.sin(math.pi / 2)), math.pi / 2 * 3)
-
-	def test_angleCalcCW_4thPI7(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCW(math.cos(math.pi / 4), math.sin(math.pi / 4)), 3), round(math.pi / 4 * 7, 3))
-
-class TestAngleCalcCCW(unittest.TestCase):
-	def test_angleCalcCCW_0(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(i.angleCalcCCW(1, 0), 0)
-
-	def test_angleCalcCCW_4thPI(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCCW(math.cos(math.pi / 4), math.sin(math.pi / 4)), 3), round(math.pi / 4, 3))
-
-	def test_angleCalcCCW_HalfPI(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(i.angleCalcCCW(math.cos(math.pi / 2), math.sin(math.pi / 2)), math.pi / 2)
-
-	def test_angleCalcCCW_4thPI3(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCCW(math.cos(math.pi / 4 * 3), math.sin(math.pi / 4 * 3)), 3), round(math.pi / 4 * 3, 3))
-
-	def test_angleCalcCCW_PI(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCCW(math.cos(math.pi), math.sin(math.pi)), 3), round(math.pi, 3))
-
-	def test_angleCalcCCW_4thPI5(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCCW(math.cos(math.pi / 4 * 5), math.sin(math.pi / 4 * 5)), 3), round(math.pi / 4 * 5, 3))
-
-	def test_angleCalcCCW_HalfPI3(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(i.angleCalcCCW(math.cos(math.pi / 2 * 3), math.sin(math.pi / 2 * 3)), math.pi / 2 * 3)
-
-	def test_angleCalcCCW_4thPI7(self):
-		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
-		self.assertEqual(round(i.angleCalcCCW(math.cos(math.pi / 4 * 7), math.sin(math.pi / 4 * 7)), 3), round(math.pi / 4 * 7, 3))
-
-
 class TestCirclesCCW(unittest.TestCase):
 	def setUp(self):
 		f = []
@@ -248,6 +181,18 @@ class TestCirclesCCW(unittest.TestCase):
 			'E', 'E', 'C08', 'W10', 'K21,x0,y10000,p4712389'
 		])
 
+	def test_verticalChordRadiusFormat(self):
+		self.i.process([ 'G0', 'X0', 'Y0' ])
+		self.i.process([ 'G3', 'X0', 'Y20', 'R10' ])
+
+		self.assertEqual(self.i.target.buffer[-1], 'K21,x0,y10000,p3141593')
+
+	def test_fullCircle(self):
+		self.i.process([ 'G0', 'X0', 'Y0' ])
+		self.i.process([ 'G3', 'X0', 'Y0', 'I10', 'J0' ])
+
+		self.assertEqual(self.i.target.buffer[-1], 'K21,x10000,y0,p6283186')
+
 
 class TestArcDistanceModes(unittest.TestCase):
 	def setUp(self):
@@ -283,3 +228,149 @@ class TestArcDistanceModes(unittest.TestCase):
 			'E', 'K21,x10000,y0,p-1570796',
 		])
 
+
+class MotionRecorder(GCode.NullTarget):
+	def __init__(self):
+		self.moves = [ ]
+		self.circles = [ ]
+
+	def straightMotion(self, rapid, longMoveAxe, machinePos):
+		self.moves.append(machinePos)
+
+	def circleMotion(self, x, y, p):
+		self.circles.append((x, y, p))
+
+class TestSegmentedArcs(unittest.TestCase):
+	def setUp(self):
+		self.i = GCode.GCodeInterpreter(MotionRecorder())
+		self.i.process([ 'G0', 'X0', 'Y0', 'Z0' ])
+		self.i.target.moves = [ ]
+
+	def assertOnArc(self, center, radius, axes):
+		last = [ 0, 0, 0 ]
+		for pos in self.i.target.moves:
+			last = [ last[k] if pos[k] == None else pos[k] / 1000. for k in xrange(3) ]
+			d = math.hypot(last[axes[0]] - center[0], last[axes[1]] - center[1])
+			self.assertAlmostEqual(d, radius, delta = .002)
+
+	def test_helix(self):
+		self.i.process([ 'G3', 'X0', 'Y0', 'Z-2', 'I5', 'J0' ])
+
+		moves = self.i.target.moves
+		self.assertEqual(self.i.position, [ 0, 0, -2 ])
+		self.assertEqual(self.i.target.circles, [ ])
+		self.assertEqual(len(moves), int(math.ceil(2 * math.pi / (2 * math.acos(1 - .005 / 5)))))
+		self.assertOnArc((5, 0), 5, (0, 1))
+
+		# counterclockwise, starting towards -Y, Z linear
+		self.assertTrue(moves[0][1] < 0)
+		self.assertEqual([ m[2] for m in moves ], sorted([ m[2] for m in moves ], reverse = True))
+
+	def test_planeXZ(self):
+		self.i.process([ 'G18' ])
+		self.i.process([ 'G2', 'X10', 'Z10', 'R10' ])
+
+		self.assertEqual(self.i.position, [ 10, 0, 10 ])
+		self.assertOnArc((10, 0), 10, (2, 0))
+		self.assertTrue(all([ m[1] == None for m in self.i.target.moves ]))
+
+	def test_planeXZCenterFormat(self):
+		self.i.process([ 'G18' ])
+		self.i.process([ 'G2', 'X10', 'Z10', 'I10', 'K0' ])
+
+		# the other center, the long way round
+		self.assertOnArc((0, 10), 10, (2, 0))
+		self.assertTrue(max([ m[0] for m in self.i.target.moves ]) > 19000)
+
+	def test_planeYZ(self):
+		self.i.process([ 'G19' ])
+		self.i.process([ 'G3', 'Y-10', 'Z10', 'R-10' ])
+
+		self.assertEqual(self.i.position, [ 0, -10, 10 ])
+		self.assertOnArc((0, 10), 10, (1, 2))
+
+	def test_tolerance(self):
+		self.i.arcTolerance = .1
+		self.i.process([ 'G3', 'X0', 'Y0', 'Z1', 'I5', 'J0' ])
+		n = len(self.i.target.moves)
+
+		self.setUp()
+		self.i.process([ 'G3', 'X0', 'Y0', 'Z1', 'I5', 'J0' ])
+		self.assertTrue(len(self.i.target.moves) > 4 * n)
+
+	def test_invertZ(self):
+		self.i.invertZ = True
+		self.i.process([ 'G18' ])
+		self.i.process([ 'G2', 'X10', 'Z10', 'R10' ])
+
+		self.assertEqual(self.i.position, [ 10, 0, -10 ])
+		self.assertOnArc((-10, 0), 10, (2, 0))
+		self.assertTrue(all([ m[2] <= 0 for m in self.i.target.moves if m[2] != None ]))
+
+	def test_planeXYWithoutZ(self):
+		self.i.process([ 'G2', 'X10', 'Y10', 'R10' ])
+		self.assertEqual(self.i.target.moves, [ ])
+		self.assertEqual(self.i.target.circles, [ (10000, 0, -1570796) ])
+
+
+def arcChain(n, seed, incremental = False):
+	# connected arcs of all directions and sizes, in both formats
+	lines = [ ]
+	x, y = 0.0, 0.0
+	for k in xrange(n):
+		radius = 1 + (k * seed % 7)
+		start = k * 2.39996
+		sweep = (0.3 + (k * 5 % 11) * 0.5) * (-1 if k % 2 else 1)
+		cx, cy = x - radius * math.cos(start), y - radius * math.sin(start)
+		ex = round(cx + radius * math.cos(start + sweep), 4)
+		ey = round(cy + radius * math.sin(start + sweep), 4)
+		if k % 4 == 3:
+			ex = x	# vertical chord
+			ey = round(y + radius, 4)
+		code = 'G3' if sweep > 0 else 'G2'
+		tx, ty = (ex - x, ey - y) if incremental else (ex, ey)
+		if k % 3 == 0 or k % 4 == 3:
+			r = max(radius, math.hypot(ex - x, ey - y) / 2)
+			lines.append('%s X%.4f Y%.4f R%.4f' % (code, tx, ty, r if abs(sweep) < math.pi else -r))
+		else:
+			lines.append('%s X%.4f Y%.4f I%.4f J%.4f' % (code, tx, ty, cx - x, cy - y))
+		x, y = ex, ey
+	return lines
+
+@unittest.skipIf(GCode.numpy == None, 'NumPy not available')
+class TestBatchArcs(unittest.TestCase):
+	program = '\n'.join([ 'G21 G90 F100', 'G0 X0 Y0 Z1', 'G1 Z-0.5' ] + arcChain(40, 3) +
+			    [ 'G0 Z1', 'G1 X3 Y4', 'G91' ] + arcChain(40, 5, True) +
+			    [ 'G90 G90.1 G0 X10 Y0' ] + [ 'G3 X10 Y0 I%d J0' % (k % 5) for k in xrange(10) ] + [ 'M30' ])
+
+	def interpreter(self, batch):
+		fc = Filters.FilterChain([ Filters.OffsetFilter([ 5, 5, 5 ]) ], CNCCon.CNCConWriter())
+		i = GCode.GCodeInterpreter(fc)
+		i.batchMotion = batch
+		i.batchMinLength = 4
+		return i
+
+	def convert(self, batch):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		i = self.interpreter(batch)
+		i.run(parser)
+		return i
+
+	def test_matchesScalar(self):
+		scalar = self.convert(False)
+		batch = self.convert(True)
+		self.assertEqual(len([ c for c in batch.target.buffer if c[0] == 'K' ]), 90)
+		self.assertEqual(batch.target.buffer, scalar.target.buffer)
+		self.assertEqual(batch.position, scalar.position)
+		self.assertEqual(batch.currentMotionCommand, scalar.currentMotionCommand)
+
+	def test_errorAtBlock(self):
+		lines = [ 'G21 G90 G0 X0 Y0' ] + arcChain(10, 3)
+		lines[6] = 'G2 X50 Y50 I1 J0'
+		for batch in (False, True):
+			i = self.interpreter(batch)
+			parser = GCode.GCodeParser()
+			parser.parseString('\n'.join(lines))
+			self.assertRaises(RuntimeError, i.run, parser)
+			self.assertEqual(i.currentBlock, 6)
@@ -1,4 +1,5 @@
 import unittest
+import tempfile
 from Converters import GCode
 from Converters import CNCCon
 
@@ -122,3 +123,250 @@ class TestParameterizedProgramming(unittest.TestCase):
 		i.parameters[101] = 5
 		r = i.substituteParameters('G0 X#100 Y#100 Z#101')
 		self.assertEqual(r, 'G0 X10 Y10 Z5')
+
+class TestRunFrom(unittest.TestCase):
+	program = 'G21 G90 F600\nG0 X10 Y15\nG1 Z-1 F100\nM7\nX20'
+
+	def test_runFromRestoresMachineState(self):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		i.runFrom(parser, 4)
+
+		self.assertEqual(i.feedRate, 100 * 1000 / 60.)
+		self.assertEqual(i.coolant, True)
+		self.assertEqual(i.position, [ 20, 15, -1 ])
+
+		expected = CNCCon.CNCConWriter()
+		expected.appendPreamble()
+		expected.setFeedRate(100 * 1000 / 60.)
+		expected.setCoolantMist()
+		self.assertEqual(i.target.buffer[:len(expected.buffer)], expected.buffer)
+
+	def test_runFromStartMatchesRun(self):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		a = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		a.run(parser)
+		b = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		b.runFrom(parser, 0)
+		self.assertEqual(a.target.buffer, b.target.buffer)
+
+class TestDispatch(unittest.TestCase):
+	def test_decimalCodes(self):
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		self.assertEqual(i.handlers['G90.1'], i.processG90_1)
+		i.process([ 'G90.1' ])
+		self.assertEqual(i.absArcDistanceMode, True)
+
+	def test_unsupported(self):
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		self.assertRaisesRegexp(RuntimeError, 'Unsupported G-Code instruction: G5.2',
+					i.process, [ 'G5.2', 'X1' ])
+
+	def test_registerHandler(self):
+		calls = [ ]
+		def processM100(inter, insn):
+			calls.append((inter, insn))
+
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		i.registerHandler('M100', processM100)
+		i.process([ 'M100', 'P2' ])
+		self.assertEqual(calls, [ (i, ('M100', { 'P': 2.0 })) ])
+		self.assertEqual(i.currentMotionCommand, None)
+
+	def test_registerMotionHandler(self):
+		calls = [ ]
+		def processG5(inter, insn):
+			calls.append(insn)
+
+		parser = GCode.GCodeParser()
+		parser.parseString('G5 X1 Y2\nX3')
+
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		i.registerHandler('G5', processG5, motion = True)
+		i.run(parser)
+		self.assertEqual(calls, [ ('G5', { 'X': 1.0, 'Y': 2.0 }), ('G5', { 'X': 3.0 }) ])
+
+class TestExpressions(unittest.TestCase):
+	def run_(self, program):
+		parser = GCode.GCodeParser()
+		parser.parseString(program)
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		i.run(parser)
+		return i
+
+	def test_expressionInWord(self):
+		i = self.run_('G21 G90\n#1=5\nG0 X[#1 * 2] Y[SQRT[#1 * 5]]\nM30')
+		self.assertEqual(i.position, [ 10, 5, 0 ])
+
+	def test_assignmentAfterBlock(self):
+		i = self.run_('#1=5\nG0 X#1 #1=7\nG0 Y#1\nM30')
+		self.assertEqual(i.position, [ 5, 7, 0 ])
+
+	def test_notWriteable(self):
+		self.assertRaisesRegexp(RuntimeError, 'Parameter #5000 is not writeable',
+					self.run_, '#5000=1')
+
+	def test_unsupportedExpression(self):
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		self.assertRaises(RuntimeError, i.evalExpression, '[1 +')
+
+class TestIterRun(unittest.TestCase):
+	program = 'G21 G90 F600\n' + '\n'.join([ 'G1 X%d Y%d' % (k, k % 3) for k in xrange(50) ]) + '\nT2 M6\nG0 X0 Y0\nM30'
+
+	def setUp(self):
+		self.parser = GCode.GCodeParser()
+		self.parser.parseString(self.program)
+
+	def test_matchesRun(self):
+		a = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		a.run(self.parser)
+		a.resume(self.parser)
+
+		b = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		chunks = list(b.iterRun(self.parser, 10))
+		self.assertTrue(b.pause)
+		chunks += list(b.iterResume(self.parser, 10))
+
+		self.assertTrue(len(chunks) > 10)
+		self.assertEqual(sum(chunks, [ ]), a.target.buffer)
+		self.assertEqual(b.target.buffer, [ ])
+
+	def test_lazy(self):
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		chunks = i.iterRun(self.parser, 10)
+		next(chunks)
+		self.assertTrue(i.currentBlock < 10)
+
+	def test_iterRunFrom(self):
+		a = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		a.runFrom(self.parser, 20)
+
+		b = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		self.assertEqual(sum(b.iterRunFrom(self.parser, 20), [ ]), a.target.buffer)
+
+class TestCheckpoints(unittest.TestCase):
+	program = ('G21 G90 F600\n#100=1\n' +
+		   '\n'.join([ 'G1 X%d Y%d' % (k, k % 3) for k in xrange(30) ]) +
+		   '\nT2 M6\nG91\nM3 S3000 M7\n#100=[#100+1]\n' +
+		   '\n'.join([ 'G1 X1 Z-#100' for k in xrange(30) ]) + '\nM30')
+
+	def setUp(self):
+		self.parser = GCode.GCodeParser()
+		self.parser.parseString(self.program)
+
+	def interpreter(self):
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		i.checkpointInterval = 10
+		return i
+
+	def test_recorded(self):
+		i = self.interpreter()
+		i.run(self.parser)
+		i.resume(self.parser)
+		# every 10 blocks plus the one after the tool change
+		self.assertEqual(i._checkpointBlocks, [ 0, 10, 20, 30, 33, 43, 53, 63 ])
+		self.assertEqual(i._checkpoints[4]['nextTool'], 2)
+		self.assertEqual(i._checkpoints[5]['absDistanceMode'], False)
+		self.assertEqual(i._checkpoints[5]['parameters'], { 100: 2.0 })
+
+	def test_restoreIsolated(self):
+		i = self.interpreter()
+		i.run(self.parser)
+		state = i.checkpoint()
+		i.position[0] = 1000
+		i.restore(state)
+		i.position[0] = 2000
+		i.restore(state)
+		self.assertEqual(i.position, [ 29, 2, 0 ])
+
+	def test_runFromMatches(self):
+		first = self.interpreter()
+		first.run(self.parser)
+		first.resume(self.parser)
+
+		for block in (5, 25, 33, 40, 60):
+			a = self.interpreter()
+			a.runFrom(self.parser, block)
+
+			b = self.interpreter()
+			b.adoptCheckpoints(first)
+			self.assertEqual(b.restoreCheckpoint(self.parser, block) <= block, True)
+
+			b = self.interpreter()
+			b.adoptCheckpoints(first)
+			b.runFrom(self.parser, block)
+			self.assertEqual(b.target.buffer, a.target.buffer)
+			self.assertEqual(b.position, a.position)
+			self.assertEqual(b.parameters, a.parameters)
+
+	def test_otherParser(self):
+		first = self.interpreter()
+		first.run(self.parser)
+
+		other = GCode.GCodeParser()
+		other.parseString(self.program)
+		i = self.interpreter()
+		i.adoptCheckpoints(first)
+		self.assertEqual(i.restoreCheckpoint(other, 20), 0)
+		self.assertEqual(i.restoreCheckpoint(self.parser, 25), 20)
+
+class TestOWords(unittest.TestCase):
+	def run_(self, program, parse = 'parseString'):
+		parser = GCode.GCodeParser()
+		getattr(parser, parse)(program)
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		i.run(parser)
+		return i
+
+	def test_call(self):
+		i = self.run_('O100 sub\nG0 X[#1 * 2] Y#2\n#3=1\nO100 endsub\n#3=7\nO100 call [5] [#3]\nM30')
+		self.assertEqual(i.position, [ 10, 7, 0 ])
+		self.assertEqual(i.parameters, { 3: 7 })
+
+	def test_callBeforeSub(self):
+		i = self.run_('O<move> call [3]\nM30\nO<move> sub\nG0 X#1\nO<move> endsub')
+		self.assertEqual(i.position, [ 3, 0, 0 ])
+
+	def test_return(self):
+		i = self.run_('O1 sub\nO2 if [#1 GT 2]\nO1 return\nO2 endif\nG0 X#1\nO1 endsub\n'
+			      'O1 call [1]\nO1 call [5]\nM30')
+		self.assertEqual(i.position, [ 1, 0, 0 ])
+
+	def test_repeat(self):
+		i = self.run_('O1 repeat [4]\nG91 G0 X1\nO1 endrepeat\nO2 repeat [0]\nG0 Y1\nO2 endrepeat\nM30')
+		self.assertEqual(i.position, [ 4, 0, 0 ])
+
+	def test_while(self):
+		i = self.run_('O1 while [#1 LT 10]\n#1=[#1 + 1]\nO2 if [#1 EQ 3]\nO1 continue\n'
+			      'O2 elseif [#1 EQ 6]\nO1 break\nO2 else\n#2=[#2 + 1]\nO2 endif\nO1 endwhile\nM30')
+		self.assertEqual(i.parameters, { 1: 6, 2: 4 })
+
+	def test_doWhile(self):
+		i = self.run_('O1 do\n#1=[#1 + 1]\nO1 while [#1 LT 0]\nM30')
+		self.assertEqual(i.parameters, { 1: 1 })
+
+	def test_nestedCalls(self):
+		i = self.run_('O1 sub\nG91 G0 X#1\nO1 endsub\nO2 sub\nO3 repeat [#1]\nO1 call [2]\nO3 endrepeat\nO2 endsub\n'
+			      'O2 call [3]\nO2 call [2]\nM30')
+		self.assertEqual(i.position, [ 10, 0, 0 ])
+
+	def test_mappedFile(self):
+		f = tempfile.NamedTemporaryFile(suffix = '.nc')
+		f.write('O1 sub\nG91 G0 X#1\nO1 endsub\nO2 repeat [100]\nO1 call [1]\nO2 endrepeat\nM30\n')
+		f.flush()
+
+		for parse in ('streamFile', 'mapFile'):
+			i = self.run_(f.name, parse)
+			self.assertEqual(i.position, [ 100, 0, 0 ])
+
+	def test_programNumber(self):
+		i = self.run_('O1000\nG0 X1\nM30')
+		self.assertEqual(i.position, [ 1, 0, 0 ])
+
+	def test_errors(self):
+		self.assertRaisesRegexp(RuntimeError, 'Missing O1 endwhile', self.run_, 'O1 while [1]\nG0 X1')
+		self.assertRaisesRegexp(RuntimeError, 'O1 endif without if', self.run_, 'O1 endif\nM30')
+		self.assertRaisesRegexp(RuntimeError, 'Missing O2 sub', self.run_, 'O2 call\nM30')
+		self.assertRaisesRegexp(RuntimeError, 'nested too deeply', self.run_, 'O1 sub\nO1 call\nO1 endsub\nO1 call\nM30')
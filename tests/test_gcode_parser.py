@@ -1,5 +1,7 @@
+import StringIO
+import tempfile
 import unittest
-from Converters import GCode
+from Converters import GCode, CNCCon
 
 class TestGCodeParser(unittest.TestCase):
 	def test_readString(self):
@@ -103,3 +105,330 @@ N100 G00 X0 Y0 Z0 (Rapid to Part Zero)
 			'G00 X0 Y0 Z0',
 		])
 		self.assertEqual(parser.sequenceNumbers, { 50: 1, 100: 3 })
+
+G0X1 = (('G0', { 'X': 1.0 }),)
+G1X2Y3 = (('G1', { 'X': 2.0, 'Y': 3.0 }),)
+M30 = (('M30', { }),)
+
+class TestSinglePassParser(unittest.TestCase):
+	program = """
+% A do something simple g-code program
+O1000
+N50 (multiple) G00 (comments) X0 (in) Y0 (one) (line) Z0
+  /N60 G01 X5
+G 01 X 10 Y\t-2.5 ; move somewhere
+(comment (in) comment)
+#100=0.002000
+N100 G00 Z#100
+M06 T02
+%
+"""
+
+	def legacyParse(self, program):
+		parser = GCode.GCodeParser()
+		parser.readString(program)
+		parser.lines = [ x.strip() for x in parser.lines if x.strip() ]
+		parser.removeTapeMarkers()
+		parser.removeComments()
+		parser.removeInlineComments()
+		parser.removeBlockSkipLines()
+		parser.normalizeAddressWhitespace()
+		parser.normalizeLeadingZeros()
+		parser.readSequenceNumbers()
+		return parser
+
+	def test_parseStringMatchesLegacyPasses(self):
+		legacy = self.legacyParse(self.program)
+
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+
+		self.assertEqual([ x.split() for x in parser.lines ],
+				 [ x.split() for x in legacy.lines ])
+		self.assertEqual(parser.sequenceNumbers, legacy.sequenceNumbers)
+
+	def test_parseString(self):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		self.assertEqual(parser.lines, [
+			'O1000',
+			'G0 X0 Y0 Z0',
+			'G1 X10 Y-2.5',
+			'#100=0.002000',
+			'G0 Z#100',
+			'M6 T2',
+		])
+
+	def test_parseStringCompactWords(self):
+		parser = GCode.GCodeParser()
+		parser.parseString('N10G01X10Y20.5Z-.5F300')
+		self.assertEqual(parser.lines, [ 'G1 X10 Y20.5 Z-.5 F300' ])
+
+	def test_parseStringKeepsInnerTapeMarker(self):
+		parser = GCode.GCodeParser()
+		parser.parseString('%\nG0 X1\n%\nG0 X2\n%')
+		self.assertEqual(parser.lines, [ 'G0 X1', '%', 'G0 X2' ])
+
+	def test_tokenize(self):
+		self.assertEqual(GCode.tokenize('G1X10 Y 0020'), [
+			('G', '1'), ('X', '10'), ('Y', '20') ])
+
+	def test_tokenizeRejectsParameters(self):
+		self.assertEqual(GCode.tokenize('G0 Z#100'), None)
+
+class TestStreamingParser(unittest.TestCase):
+	program = '%\nN10 G0 X1\n(comment)\nN20 G1 X2 Y3\nM30\n%\n'
+
+	def setUp(self):
+		self.tmp = tempfile.NamedTemporaryFile(suffix = '.nc')
+		self.tmp.write(self.program)
+		self.tmp.flush()
+
+	def tearDown(self):
+		self.tmp.close()
+
+	def test_iterBlocks(self):
+		parser = GCode.GCodeParser()
+		blocks = parser.iterBlocks(StringIO.StringIO(self.program))
+		self.assertEqual(next(blocks), 'G0 X1')
+		self.assertEqual(parser.sequenceNumbers, { 10: 0 })
+		self.assertEqual(list(blocks), [ 'G1 X2 Y3', 'M30' ])
+		self.assertEqual(parser.sequenceNumbers, { 10: 0, 20: 1 })
+
+	def test_streamFileGetBlock(self):
+		parser = GCode.GCodeParser()
+		parser.streamFile(self.tmp.name)
+		self.assertEqual(parser.getBlock(0), G0X1)
+		self.assertEqual(parser.getBlock(0), G0X1)
+		self.assertEqual(parser.getBlock(2), M30)
+		self.assertEqual(parser.getBlock(3), None)
+		self.assertEqual(parser.getBlock(1), G1X2Y3)
+
+	def test_streamFileFindLine(self):
+		# a fresh stream has no line index before it is read from
+		parser = GCode.GCodeParser()
+		parser.streamFile(self.tmp.name)
+		self.assertEqual(parser.findLine(3), 1)
+		self.assertEqual(parser.getBlock(1), G1X2Y3)
+
+		parser = GCode.GCodeParser()
+		parser.streamFile(self.tmp.name)
+		self.assertEqual(parser.lineOfBlock(2), 5)
+		self.assertEqual(parser.lineOfBlock(3), None)
+
+		parser = GCode.GCodeParser()
+		parser.streamFile(self.tmp.name)
+		self.assertEqual(parser.findLine(9), None)
+
+	def test_streamedRunMatchesInMemory(self):
+		parser = GCode.GCodeParser()
+		parser.parseFile(self.tmp.name)
+		inter = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		inter.run(parser)
+
+		streamed = GCode.GCodeParser()
+		streamed.streamFile(self.tmp.name)
+		inter2 = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		inter2.run(streamed)
+
+		self.assertEqual(inter2.target.buffer, inter.target.buffer)
+
+class TestMappedParser(unittest.TestCase):
+	program = '\n%\nN10 G0 X1\n(comment)\n\nN20 G1 X2 Y3\n%\nN30 M30\n%\n\n'
+
+	def setUp(self):
+		self.tmp = tempfile.NamedTemporaryFile(suffix = '.nc')
+		self.tmp.write(self.program)
+		self.tmp.flush()
+
+	def tearDown(self):
+		self.tmp.close()
+
+	def test_getBlock(self):
+		parser = GCode.GCodeParser()
+		parser.mapFile(self.tmp.name)
+		self.assertEqual([ parser.getBlock(i) for i in xrange(11) ], [
+			(), (), G0X1, (), (), G1X2Y3, '%', M30, (), (), None ])
+
+	def test_randomAccess(self):
+		parser = GCode.GCodeParser()
+		parser.mapFile(self.tmp.name)
+		self.assertEqual(parser.getBlock(7), M30)
+		self.assertEqual(parser.getBlock(2), G0X1)
+		self.assertEqual(parser.getBlock(5), G1X2Y3)
+
+	def test_sparseIndex(self):
+		GCode.GCodeFileMap.STRIDE = 2
+		try:
+			parser = GCode.GCodeParser()
+			parser.mapFile(self.tmp.name)
+			self.assertEqual(parser.getBlock(9), ())
+			self.assertEqual(parser.getBlock(5), G1X2Y3)
+			self.assertEqual(parser.getBlock(7), M30)
+			self.assertEqual(parser.getBlock(2), G0X1)
+		finally:
+			GCode.GCodeFileMap.STRIDE = 64
+
+	def test_findSequenceNumber(self):
+		parser = GCode.GCodeParser()
+		parser.mapFile(self.tmp.name)
+		self.assertEqual(parser.findSequenceNumber(30), 7)
+		self.assertEqual(parser.findSequenceNumber(20), 5)
+		self.assertEqual(parser.findSequenceNumber(40), None)
+
+	def test_mappedRunMatchesInMemory(self):
+		tmp = tempfile.NamedTemporaryFile(suffix = '.nc')
+		tmp.write('%\nN10 G0 X1\n(comment)\n\nG1 X2 Y3 F100\nN30 M30\n%\n')
+		tmp.flush()
+
+		parser = GCode.GCodeParser()
+		parser.parseFile(tmp.name)
+		inter = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		inter.run(parser)
+
+		mapped = GCode.GCodeParser()
+		mapped.mapFile(tmp.name)
+		inter2 = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		inter2.run(mapped)
+
+		self.assertEqual(inter2.target.buffer, inter.target.buffer)
+		tmp.close()
+
+	def test_emptyFile(self):
+		tmp = tempfile.NamedTemporaryFile(suffix = '.nc')
+		parser = GCode.GCodeParser()
+		parser.mapFile(tmp.name)
+		self.assertEqual(parser.getBlock(0), None)
+		tmp.close()
+
+class TestCompiledBlocks(unittest.TestCase):
+	def test_parseFileKeepsLinesAndBlocks(self):
+		parser = GCode.GCodeParser()
+		parser.parseString('G0 X1\n#1=2\nM30')
+		self.assertEqual(parser.lines, [ 'G0 X1', '#1=2', 'M30' ])
+		self.assertEqual(parser.blocks, [ G0X1, '#1=2', M30 ])
+		self.assertEqual(parser.getBlock(1), '#1=2')
+
+	def test_oWordsStayText(self):
+		# O-words are interpreted from the text in both parsing modes
+		program = 'G21 G90\nO100\nO100 G0 X1\nM30'
+		for compiled in (True, False):
+			parser = GCode.GCodeParser()
+			if compiled:
+				parser.parseString(program)
+			else:
+				parser.readString(program)
+			self.assertEqual(parser.getBlock(2), 'O100 G0 X1')
+
+			inter = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+			with self.assertRaises(RuntimeError) as cm:
+				inter.run(parser)
+			self.assertEqual(str(cm.exception), 'Unsupported O-word: O100 g')
+
+	def test_compileWordsGroupsLikeSplitBlock(self):
+		words = GCode.tokenize('G17 G20 G90 G64 P0.003 M3 S3000 M7 F1')
+		self.assertEqual(GCode.compileWords(words), (
+			('F', { 'F': 1.0 }),
+			('G17', { }),
+			('G20', { }),
+			('G90', { }),
+			('G64', { 'P': 0.003 }),
+			('M3', { 'S': 3000.0 }),
+			('M7', { })))
+
+	def test_compileWordsAxes(self):
+		words = GCode.tokenize('G2 X1 Y2 R3 F100')
+		self.assertEqual(GCode.compileWords(words), (
+			('F', { 'F': 100.0 }),
+			('G2', { 'X': 1.0, 'Y': 2.0, 'R': 3.0 })))
+
+	def test_compileWordsModalMotion(self):
+		words = GCode.tokenize('X1 Z-2 S100')
+		self.assertEqual(GCode.compileWords(words), (
+			('S', { 'S': 100.0 }),
+			(None, { 'X': 1.0, 'Z': -2.0 })))
+
+	def test_modalMotionUsesModeOfBlockStart(self):
+		parser = GCode.GCodeParser()
+		parser.parseString('G0 X1\nX2\nG1 X3 F60\nY4')
+		inter = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		inter.run(parser)
+
+		legacy = GCode.GCodeParser()
+		legacy.readString('G0 X1\nX2\nG1 X3 F60\nY4')
+		inter2 = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		inter2.run(legacy)
+
+		self.assertEqual(inter.target.buffer, inter2.target.buffer)
+
+class TestSequenceNumberIndex(unittest.TestCase):
+	program = '%\nN10 G0 X1\n(comment)\nN20 G1 X2 Y3\n\nN30 M30\n%\n'
+
+	def test_perInstance(self):
+		a = GCode.GCodeParser()
+		a.parseString(self.program)
+		b = GCode.GCodeParser()
+		b.parseString('N40 G0 X1')
+		self.assertEqual(a.sequenceNumbers, { 10: 0, 20: 1, 30: 2 })
+		self.assertEqual(b.sequenceNumbers, { 40: 0 })
+
+	def test_reparse(self):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		parser.parseString('G0 X1\nN40 G0 X2')
+		self.assertEqual(parser.sequenceNumbers, { 40: 1 })
+		self.assertEqual(parser.blockSequenceNumbers, { 1: 40 })
+		self.assertEqual(parser.findSequenceNumber(10), None)
+
+		parser.loadParsed(([ 'G0 X1' ], [ 'G0 X1' ], { }, ''))
+		self.assertEqual(parser.sequenceNumbers, { })
+		self.assertEqual(parser.sequenceNumberOfBlock(1), None)
+
+	def test_sequenceNumberOfBlock(self):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		self.assertEqual(parser.findSequenceNumber(20), 1)
+		self.assertEqual(parser.findSequenceNumber(25), None)
+		self.assertEqual(parser.sequenceNumberOfBlock(2), 30)
+
+	def test_findLine(self):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		self.assertEqual(parser.findLine(1), 0)
+		self.assertEqual(parser.findLine(3), 1)
+		self.assertEqual(parser.findLine(5), 2)
+		self.assertEqual(parser.findLine(7), None)
+		self.assertEqual(parser.lineOfBlock(1), 4)
+
+class TestParallelParser(unittest.TestCase):
+	program = '\n%\nN10 G0 X1\n(comment)\n\n  N20 G1 X2 Y3\n%\n/ G0 X5\nN30 G0 Z#100\nM30\n%\n\n'
+
+	def setUp(self):
+		self.tmp = tempfile.NamedTemporaryFile(suffix = '.nc')
+		self.tmp.write(self.program * 5)
+		self.tmp.flush()
+
+	def tearDown(self):
+		self.tmp.close()
+
+	def test_chunks(self):
+		fileMap = GCode.GCodeFileMap(self.tmp.name)
+		chunks = fileMap.chunks(7)
+		self.assertEqual(chunks[0][0], 0)
+		self.assertEqual(chunks[-1][1], len(self.program) * 5)
+		for (start, end), (nextStart, nextEnd) in zip(chunks, chunks[1:]):
+			self.assertEqual(end, nextStart)
+			self.assertEqual(self.program[(start - 1) % len(self.program)], '\n')
+
+	def test_matchesSerial(self):
+		serial = GCode.GCodeParser()
+		serial.parseFile(self.tmp.name)
+
+		for chunkSize in (16, 37, 100):
+			parser = GCode.GCodeParser()
+			parser.parseFileParallel(self.tmp.name, 2, chunkSize)
+			self.assertEqual(parser.lines, serial.lines)
+			self.assertEqual(parser.blocks, serial.blocks)
+			self.assertEqual(parser.blockLines, serial.blockLines)
+			self.assertEqual(parser.sequenceNumbers, serial.sequenceNumbers)
+			self.assertEqual(parser.blockSequenceNumbers, serial.blockSequenceNumbers)
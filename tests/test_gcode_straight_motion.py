@@ -176,3 +176,43 @@ class TestG0G1Switching(unittest.TestCase):
 			'E', 'V1,X10000,Y10000',
 		])
 
+
+@unittest.skipIf(GCode.numpy == None, 'NumPy not available')
+class TestBatchMotion(unittest.TestCase):
+	program = '\n'.join([ 'G21 G90 F100', 'G0 X0 Y0 Z1', 'G1 Z-0.5' ] +
+			    [ 'X%.4f Y%.4f' % (k * 0.1234, (k % 3) * 0.0005) for k in xrange(40) ] +
+			    [ 'G0 Z1', 'X0.0005 Y-0.0015', 'G91', 'G1 X0.1' ] +
+			    [ 'X0.25 Y-0.0005 Z0' for k in xrange(40) ] + [ 'M30' ])
+
+	def convert(self, batch, invertZ = False):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+
+		fc = Filters.FilterChain([ Filters.OffsetFilter([ 5, 5, 5 ]) ], CNCCon.CNCConWriter())
+		i = GCode.GCodeInterpreter(fc)
+		i.batchMotion = batch
+		i.batchMinLength = 4
+		i.invertZ = invertZ
+		i.run(parser)
+		return i
+
+	def test_matchesScalar(self):
+		for invertZ in (False, True):
+			scalar = self.convert(False, invertZ)
+			batch = self.convert(True, invertZ)
+			self.assertEqual(batch.target.buffer, scalar.target.buffer)
+			self.assertEqual(batch.position, scalar.position)
+			self.assertEqual(batch.currentMotionCommand, scalar.currentMotionCommand)
+
+	def test_writerBatch(self):
+		moves = [ (True, 1, [ 1000.0, 2000.0, None ]), (False, 0, [ 3000.0, None, None ]),
+			  (False, 2, [ None, None, -5.0 ]), (True, 0, [ 0.0, None, None ]) ]
+
+		w = CNCCon.CNCConWriter()
+		w.straightMotionBatch(*zip(*moves))
+
+		scalar = CNCCon.CNCConWriter()
+		for move in moves:
+			scalar.straightMotion(*move)
+		self.assertEqual(w.buffer, scalar.buffer)
+		self.assertEqual(w.buffer[-4:], [ 'E', 'C10', 'W10', 'V1,X0' ])
@@ -0,0 +1,190 @@
+import math
+import unittest
+from Converters import GCode, CNCCon, Optimizers
+
+def arcProgram(n, sweep, radius = 10, cw = False):
+	lines = [ 'G21 G90 G0 X%f Y5 Z0' % radius, 'G1 Y0 F300' ]
+	for k in xrange(1, n + 1):
+		a = sweep * k / n
+		if cw: a = -a
+		lines.append('G1 X%.4f Y%.4f' % (radius * math.cos(a), radius * math.sin(a)))
+	lines += [ 'G1 X20 Y20', 'G0 Z5', 'M30' ]
+	return '\n'.join(lines)
+
+class TestArcFitter(unittest.TestCase):
+	def run_(self, program, fit, **kwargs):
+		parser = GCode.GCodeParser()
+		parser.parseString(program)
+		writer = CNCCon.CNCConWriter()
+		target = Optimizers.ArcFitter(writer, **kwargs) if fit else writer
+		GCode.GCodeInterpreter(target).run(parser)
+		return writer.buffer, target
+
+	def test_fitsArc(self):
+		buffer, fitter = self.run_(arcProgram(100, math.pi), True)
+		self.assertEqual(fitter.arcs, 1)
+		self.assertEqual(fitter.savedMoves, 99)
+		self.assertEqual([ c for c in buffer if c[0] == 'K' ], [ 'K21,x-10000,y0,p3141593' ])
+		self.assertEqual(buffer[-11:], [ 'E', 'V21,X20000,Y20000', 'E', 'C10', 'W10', 'E', 'C10', 'W10', 'V3,Z5000', 'E', 'D0' ])
+
+	def test_clockwise(self):
+		buffer, fitter = self.run_(arcProgram(100, math.pi / 2, cw = True), True)
+		arcs = [ c for c in buffer if c[0] == 'K' ]
+		self.assertEqual(len(arcs), 1)
+		x, y, p = [ int(v[1:]) for v in arcs[0].split(',')[1:] ]
+		self.assertEqual((x, y), (-10000, 0))
+		self.assertAlmostEqual(p, -math.pi / 2 * 1000000, delta = 100)
+
+	def test_endPoint(self):
+		start = [ 10000, 0 ]
+		x, y, p = -10000, 0, math.ceil(math.pi / 2 * 1000000)
+		self.assertEqual(Optimizers.arcEnd(start, x, y, p), [ 0, 10000 ])
+
+	def test_coarseSegmentsKept(self):
+		# the moves deviate more than the tolerance from the circle
+		program = arcProgram(20, math.pi)
+		self.assertEqual(self.run_(program, True)[0], self.run_(program, False)[0])
+
+		buffer, fitter = self.run_(program, True, tolerance = 0.2)
+		self.assertEqual(fitter.arcs, 1)
+
+	def test_straightLinesKept(self):
+		lines = [ 'G21 G90 G0 X0 Y0 Z0' ] + [ 'G1 X%d Y%d' % (k, (k % 2) * 3) for k in xrange(50) ] + [ 'M30' ]
+		program = '\n'.join(lines)
+		buffer, fitter = self.run_(program, True)
+		self.assertEqual(buffer, self.run_(program, False)[0])
+		self.assertEqual(fitter.arcs, 0)
+
+	def test_minSegments(self):
+		buffer, fitter = self.run_(arcProgram(3, math.pi / 8), True)
+		self.assertEqual(fitter.arcs, 0)
+
+	def test_maxSegments(self):
+		buffer, fitter = self.run_(arcProgram(100, math.pi), True, maxSegments = 40)
+		self.assertEqual(fitter.arcs, 3)
+
+class TestCommandOptimizer(unittest.TestCase):
+	def optimize(self, *chunks):
+		o = Optimizers.CommandOptimizer()
+		return [ c for chunk in o.optimize(chunks) for c in chunk ], o
+
+	def test_emptySteps(self):
+		commands, o = self.optimize([ 'E', 'E', 'V21,X1', 'E' ], [ 'E', 'E', 'D0' ])
+		self.assertEqual(commands, [ 'E', 'V21,X1', 'E', 'D0' ])
+		self.assertEqual(o.droppedCommands, 3)
+
+	def test_feedRate(self):
+		commands, o = self.optimize([ 'E', 'G21,500', 'G20,500', 'E', 'V21,X1', 'E', 'G21,500', 'G20,500',
+					      'E', 'V21,X2', 'E', 'G21,600', 'G20,600' ])
+		self.assertEqual(commands, [ 'E', 'G21,500', 'G20,500', 'E', 'V21,X1', 'E', 'V21,X2',
+					     'E', 'G21,600', 'G20,600' ])
+
+	def test_speed(self):
+		commands, o = self.optimize([ 'E', 'C10', 'W10' ], [ 'E', 'C10', 'W10', 'V1,X1', 'E', 'C08', 'W10', 'V21,X2' ])
+		self.assertEqual(commands, [ 'E', 'C10', 'W10', 'E', 'V1,X1', 'E', 'C08', 'W10', 'V21,X2' ])
+
+	def test_spindleSpeed(self):
+		commands, o = self.optimize([ 'C08', 'D141', 'A50', 'D141', 'W100', 'E', 'D141', 'W100', 'E', 'D42', 'W100' ])
+		self.assertEqual(commands, [ 'C08', 'D141', 'A50', 'D141', 'W100', 'E', 'D42', 'W100' ])
+
+	def test_heldCommand(self):
+		commands, o = self.optimize([ 'E', 'C08' ])
+		self.assertEqual(commands, [ 'E', 'C08' ])
+
+	def test_outputs(self):
+		commands, o = self.optimize([ 'A50', 'A51', 'E', 'A51', 'W100', 'E', 'A50' ])
+		self.assertEqual(commands, [ 'A50', 'A51', 'E', 'W100', 'E', 'A50' ])
+
+	def test_program(self):
+		parser = GCode.GCodeParser()
+		parser.parseString('G21 G90 F600\nM3 S3000\nM7\nM7\nG1 X1 F600\nG1 X2 F600\nG0 Z5\nM9\nM30')
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		commands, o = self.optimize(*i.iterRun(parser, 4))
+
+		i = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		i.run(parser)
+		self.assertTrue(len(commands) < len(i.target.buffer))
+		self.assertEqual([ c for c in commands if c[0] in 'VK' ], [ c for c in i.target.buffer if c[0] in 'VK' ])
+
+class TestOrderPoints(unittest.TestCase):
+	def test_permutation(self):
+		points = [ ((k * 37) % 101, (k * 53) % 97) for k in xrange(60) ]
+		order = Optimizers.orderPoints((0, 0), points)
+		self.assertEqual(sorted(order), range(60))
+		self.assertEqual(order, Optimizers.orderPoints((0, 0), points))
+		self.assertTrue(Optimizers.pathLength((0, 0), [ points[k] for k in order ]) <
+				Optimizers.pathLength((0, 0), points) / 3)
+
+	def test_line(self):
+		points = [ (3, 0), (1, 0), (4, 0), (2, 0) ]
+		self.assertEqual(Optimizers.orderPoints((0, 0), points), [ 1, 3, 0, 2 ])
+
+	def test_keepLast(self):
+		points = [ (3, 0), (1, 0), (4, 0), (2, 0) ]
+		self.assertEqual(Optimizers.orderPoints((0, 0), points, True), [ 1, 0, 2, 3 ])
+		self.assertEqual(Optimizers.orderPoints((0, 0), [ (5, 0) ], True), [ 0 ])
+
+	def test_ties(self):
+		self.assertEqual(Optimizers.orderPoints((0, 0), [ (1, 0), (0, 1), (-1, 0) ]), [ 0, 1, 2 ])
+		self.assertEqual(Optimizers.orderPoints((0, 0), [ ]), [ ])
+
+def squares(corners, depth = 1):
+	lines = [ 'G21 G90 G0 Z5', 'F300' ]
+	for x, y in corners:
+		lines += [ 'G0 X%d Y%d' % (x, y), 'G1 Z-%d' % depth, 'G1 X%d' % (x + 5), 'G1 Y%d' % (y + 5),
+			   'G1 X%d' % x, 'G1 Y%d' % y, 'G0 Z5' ]
+	lines.append('M30')
+	return '\n'.join(lines)
+
+class TestContourOrderer(unittest.TestCase):
+	def run_(self, program):
+		parser = GCode.GCodeParser()
+		parser.parseString(program)
+		writer = CNCCon.CNCConWriter()
+		orderer = Optimizers.ContourOrderer(writer)
+		GCode.GCodeInterpreter(orderer).run(parser)
+		return writer.buffer, orderer
+
+	def leadIns(self, buffer):
+		return [ c for c in buffer if c.split(',')[0] in ('V1', 'V2') and not 'Z' in c ]
+
+	def test_reorder(self):
+		buffer, orderer = self.run_(squares([ (1, 0), (100, 0), (10, 0), (110, 0), (20, 0) ]))
+		self.assertEqual(self.leadIns(buffer), [ 'V1,X1000', 'V1,X10000', 'V1,X100000', 'V1,X110000', 'V1,X20000' ])
+		self.assertAlmostEqual(orderer.rapidTravel[0], 379)
+		self.assertAlmostEqual(orderer.rapidTravel[1], 199)
+
+		plain = CNCCon.CNCConWriter()
+		parser = GCode.GCodeParser()
+		parser.parseString(squares([ (1, 0), (100, 0), (10, 0), (110, 0), (20, 0) ]))
+		GCode.GCodeInterpreter(plain).run(parser)
+		self.assertEqual(len(buffer), len(plain.buffer))
+		self.assertEqual(buffer[-4:], plain.buffer[-4:])
+
+	def test_overlapsKeepOrder(self):
+		# the square at X48, nearest to the entry but overlapping the one
+		# at X50, must follow it
+		program = squares([ (0, 0), (50, 0), (100, 0), (48, 1), (100, 20) ])
+		buffer, orderer = self.run_(program)
+		self.assertEqual(self.leadIns(buffer), [ 'V1,X50000', 'V1,X48000,Y1000', 'V1,X100000,Y0', 'V2,Y20000' ])
+
+	def test_feedRates(self):
+		# the third square is cut at the F200 set in the second one before
+		# the second one is cut at F300
+		program = squares([ (1, 0), (100, 0), (10, 0), (0, 20) ]).replace('G1 X105\n', 'G1 X105 F200\n')
+		buffer, orderer = self.run_(program)
+		self.assertEqual(self.leadIns(buffer), [ 'V1,X1000', 'V1,X10000', 'V1,X100000', 'V1,X0,Y20000' ])
+		self.assertEqual([ c for c in buffer if c.startswith('G21') ], [ 'G21,5000', 'G21,3333', 'G21,5000', 'G21,3333' ])
+
+	def test_keepsShorterProgramOrder(self):
+		# nearest neighbour goes to X17 first, which takes 76 mm
+		buffer, orderer = self.run_(squares([ (20, 0), (24, 0), (50, 0), (17, 0), (10, 0) ]))
+		self.assertEqual(self.leadIns(buffer), [ 'V1,X20000', 'V1,X24000', 'V1,X50000', 'V1,X17000', 'V1,X10000' ])
+		self.assertAlmostEqual(orderer.rapidTravel[0], 70)
+		self.assertAlmostEqual(orderer.rapidTravel[1], 70)
+
+	def test_heightChangeFlushes(self):
+		program = squares([ (1, 0), (100, 0), (10, 0) ]).replace('G0 Z5\nG0 X100', 'G0 Z10\nG0 X100')
+		buffer, orderer = self.run_(program)
+		self.assertEqual(self.leadIns(buffer), [ 'V1,X1000', 'V1,X100000', 'V1,X10000' ])
+		self.assertEqual(orderer.rapidTravel[0], orderer.rapidTravel[1])
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+from Converters import GCode, ParseCache
+
+class TestParseCache(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.cache = ParseCache.ParseCache(os.path.join(self.dir, 'cache'))
+		self.program = self.writeProgram('prog.nc', '%\nN10 G0 X1 (go)\n#1=2\nN20 G1 Y#1 F100\nM30\n%\n')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def writeProgram(self, name, content):
+		fname = os.path.join(self.dir, name)
+		with open(fname, 'w') as f:
+			f.write(content)
+		return fname
+
+	def test_missThenHit(self):
+		first = self.cache.parseFile(self.program)
+		second = self.cache.parseFile(self.program)
+
+		self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+		self.assertEqual(second.lines, first.lines)
+		self.assertEqual(second.blocks, first.blocks)
+		self.assertEqual(second.sequenceNumbers, { 10: 0, 20: 2 })
+
+	def test_keyFollowsContent(self):
+		other = self.writeProgram('copy.nc', open(self.program).read())
+		self.assertEqual(self.cache.key(other), self.cache.key(self.program))
+
+		self.writeProgram('copy.nc', 'M30\n')
+		self.assertNotEqual(self.cache.key(other), self.cache.key(self.program))
+
+	def test_keyIncludesParserVersion(self):
+		key = self.cache.key(self.program)
+		self.assertTrue(key.endswith('-%d' % GCode.PARSER_VERSION))
+
+	def test_cachedRunMatches(self):
+		parser = GCode.GCodeParser()
+		parser.parseFile(self.program)
+		self.cache.parseFile(self.program)
+		cached = self.cache.parseFile(self.program)
+
+		self.assertEqual(cached.dumpParsed(), parser.dumpParsed())
+
+	def test_evictLeastRecentlyUsed(self):
+		a = self.writeProgram('a.nc', 'G0 X1\n' * 100)
+		b = self.writeProgram('b.nc', 'G0 X2\n' * 100)
+
+		self.cache.parseFile(a)
+		pathA = self.cache._path(self.cache.key(a))
+		os.utime(pathA, (1, 1))
+
+		self.cache._maxSize = os.path.getsize(pathA) + 1
+		self.cache.parseFile(b)
+
+		self.assertFalse(os.path.exists(pathA))
+		self.assertTrue(os.path.exists(self.cache._path(self.cache.key(b))))
+
+	def test_unwritableCacheDirectory(self):
+		cache = ParseCache.ParseCache(os.path.join(self.program, 'not-a-dir'))
+		parser = cache.parseFile(self.program)
+		self.assertEqual(parser.lines[0], 'G0 X1')
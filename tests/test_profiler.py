@@ -0,0 +1,37 @@
+import unittest
+from Converters import GCode, CNCCon, Profiler
+
+class TestProfiler(unittest.TestCase):
+	program = '\n'.join([ 'G21 G90 F300', 'G0 X10 Y10', '#1 = 5', 'G1 X[#1 * 4]',
+			      'G2 X30 Y10 I5 J0', 'G81 X40 Y40 R1 Z-2', 'X50', 'G80', 'M30' ])
+
+	def run_(self, profile):
+		parser = GCode.GCodeParser()
+		parser.parseString(self.program)
+		inter = GCode.GCodeInterpreter(CNCCon.CNCConWriter())
+		profiler = Profiler.Profiler()
+		if profile:
+			profiler.attach(inter)
+		return [ c for chunk in inter.iterRun(parser, 4) for c in chunk ], profiler
+
+	def test_outputUnchanged(self):
+		self.assertEqual(self.run_(True)[0], self.run_(False)[0])
+
+	def test_counts(self):
+		commands, profiler = self.run_(True)
+		rows = dict([ (row[0], row[1:]) for row in profiler.report() ])
+		self.assertEqual(rows['G1'][0], 1)
+		self.assertEqual(rows['G81'][0], 2)
+		self.assertEqual(rows['_processCannedCycle'][0], 2)
+		self.assertEqual(rows['_circleMotion'][0], 1)
+		self.assertEqual(rows['substituteParameters'][0], 1)
+		self.assertEqual(rows['target.circleMotion'][0], 1)
+		self.assertEqual(rows['target.circleMotion'][2], 2)
+		self.assertEqual(rows['target.appendPreamble'][2], 7)
+		self.assertEqual(sum([ rows[code][2] for code in rows if not code[0] in '_t' ]) + 7 + 2,
+				 len(commands))
+		self.assertFalse('G2' in [ row[0] for row in Profiler.Profiler().report() ])
+
+	def test_sorted(self):
+		seconds = [ row[2] for row in self.run_(True)[1].report() ]
+		self.assertEqual(seconds, sorted(seconds, reverse = True))
@@ -0,0 +1,68 @@
+import unittest
+from Converters import GCode, CNCCon, Timing
+
+class TestRampTime(unittest.TestCase):
+	def test_constantSpeed(self):
+		self.assertAlmostEqual(Timing.rampTime(10000, 5000, 5000, 1000), 2)
+		self.assertAlmostEqual(Timing.rampTime(10000, 0, 5000, 0), 2)
+		self.assertEqual(Timing.rampTime(0, 1000, 5000, 1000), 0)
+
+	def test_trapezoid(self):
+		# 2 s ramping up and down over 10 mm, 80 mm at 10 mm/s
+		self.assertAlmostEqual(Timing.rampTime(100000, 0, 10000, 5000), 12)
+
+	def test_triangle(self):
+		# half the distance ramping up, never reaching the speed
+		self.assertAlmostEqual(Timing.rampTime(10000, 0, 10000, 5000), 2 * 2 ** .5)
+
+class TestTimeEstimator(unittest.TestCase):
+	setup = [ '#E21,1000,30', '#E41,10000,30', '#G1,20000', '#G2,10000', '#G3,5000',
+		  '#G4,2000', '#G5,2000', '#G6,1000' ]
+
+	def estimate(self, program, **kwargs):
+		parser = GCode.GCodeParser()
+		parser.parseString(program)
+		return Timing.estimateProgram(parser, setup = self.setup, **kwargs)
+
+	def test_setup(self):
+		estimator = Timing.TimeEstimator(None, self.setup)
+		self.assertEqual(estimator.rapidSpeed, [ 20000, 10000, 5000 ])
+		self.assertEqual(estimator.startSpeed, [ 2000, 2000, 1000 ])
+		self.assertEqual((estimator.rapidAcceleration, estimator.feedAcceleration), (10000, 1000))
+
+		estimator = Timing.TimeEstimator()
+		self.assertEqual(estimator.rapidSpeed, [ 15000, 15000, 10000 ])
+
+	def test_rapidAndFeed(self):
+		estimator = self.estimate('G21 G90 G0 X100 Y10\nG1 X110 F120\nM30')
+		self.assertAlmostEqual(estimator.rapidTime, Timing.rampTime(100000, 2000, 20000, 10000))
+		self.assertAlmostEqual(estimator.feedTime, Timing.rampTime(10000, 2000, 2000, 1000))
+		self.assertAlmostEqual(estimator.total(), estimator.rapidTime + estimator.feedTime)
+
+	def test_arc(self):
+		estimator = self.estimate('G21 G90 G0 X10 Y0\nG3 X-10 Y0 I-10 J0 F60\nM30')
+		self.assertAlmostEqual(estimator.feedTime, 31.4159, 3)
+
+	def test_feedRateOverride(self):
+		program = 'G21 G90 G1 X100 F60\nM30'
+		self.assertAlmostEqual(self.estimate(program).feedTime, 100)
+		self.assertAlmostEqual(self.estimate(program, feedRateOverride = 50).feedTime, 200)
+
+	def test_toolsAndBlocks(self):
+		estimator = self.estimate('G21 G90 G1 X1 F60\nT2 M6\nG1 X3\nM30')
+		self.assertEqual(sorted(estimator.toolTimes.keys()), [ 1, 2 ])
+		self.assertAlmostEqual(estimator.toolTimes[2], 2)
+		self.assertEqual(sorted(estimator.blockTimes.keys()), [ 0, 2 ])
+		self.assertAlmostEqual(estimator.blockTimes[0], 1)
+
+	def test_passesOn(self):
+		parser = GCode.GCodeParser()
+		parser.parseString('G21 G90 G0 X10\nG1 Y10 F60\nM30')
+		writer = CNCCon.CNCConWriter()
+		estimator = Timing.TimeEstimator(writer)
+		GCode.GCodeInterpreter(estimator).run(parser)
+
+		plain = CNCCon.CNCConWriter()
+		GCode.GCodeInterpreter(plain).run(parser)
+		self.assertEqual(writer.buffer, plain.buffer)
+		self.assertTrue(estimator.total() > 0)